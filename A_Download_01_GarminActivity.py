@@ -2,11 +2,17 @@ import datetime
 import json
 import logging
 import os
+import random
 import sys
+import time
 from getpass import getpass
 
 import requests
-from garth.exc import GarthHTTPError
+
+try:
+    from garth.exc import GarthHTTPError
+except ImportError:  # 新版 garminconnect 不再依赖 garth
+    GarthHTTPError = requests.exceptions.HTTPError
 
 from garminconnect import (
     Garmin,
@@ -14,6 +20,9 @@ from garminconnect import (
     GarminConnectConnectionError,
     GarminConnectTooManyRequestsError,
 )
+from Z_Common_05_Metrics import Metrics
+from Z_Common_09_Catalog import Catalog
+from Z_Common_15_FakeGarmin import FAKE_ENV, FakeGarmin
 
 # 配置调试日志记录
 logging.basicConfig(level=logging.INFO)
@@ -30,6 +39,14 @@ num_activities = 5  # 修改为你需要的数量
 save_path = "./DataProcess/A_OriginZIPData"  # 设置保存文件的相对路径
 filename_format = "OriginZIPData"  # 设置文件名称格式
 
+# 遇到限流（429）或连接错误时的重试
+max_retries = 4  # 最多重试次数，0 表示不重试
+retry_backoff = 2.0  # 第一次重试前的等待时间(秒)，之后每次翻倍
+retry_backoff_max = 60.0  # 单次等待时间上限(秒)
+retry_stats = {"retries": 0, "backoff_s": 0.0}  # 本次运行的重试次数与累计等待时间
+
+metrics = Metrics("A_Download_01_GarminActivity")  # 阶段运行指标
+
 def display_json(api_call, output):
     """格式化API输出以便更好地阅读。"""
     dashed = "-" * 20
@@ -40,8 +57,39 @@ def display_json(api_call, output):
     print(json.dumps(output, indent=4))
     print(footer)
 
+def call_with_retry(fn, *args, **kwargs):
+    """
+    调用 API，遇到限流（429）或连接错误时按指数退避重试（等待时间带随机抖动，避免并发请求同时重试）。
+
+    :raises: 重试 max_retries 次后仍失败时抛出最后一次的异常。
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return fn(*args, **kwargs)
+        except (GarminConnectTooManyRequestsError, GarminConnectConnectionError) as err:
+            if attempt == max_retries:
+                raise
+            delay = min(retry_backoff * 2**attempt, retry_backoff_max) * random.uniform(0.5, 1.0)
+            logger.warning(f"{err}，{delay:.1f} 秒后重试（{attempt + 1}/{max_retries}）")
+            retry_stats["retries"] += 1
+            retry_stats["backoff_s"] += delay
+            time.sleep(delay)
+
 def init_api(email, password):
-    """使用你的凭据初始化Garmin API。"""
+    """使用你的凭据初始化Garmin API。设置环境变量 GARMIN_FAKE 时使用离线替身（见 Z_Common_15_FakeGarmin）。"""
+    if os.getenv(FAKE_ENV):
+        print(f"使用离线 Garmin Connect 替身（{FAKE_ENV}={os.getenv(FAKE_ENV)}）\n")
+        garmin = FakeGarmin.from_env()
+        try:
+            call_with_retry(garmin.login)
+        except (
+            GarminConnectAuthenticationError,
+            GarminConnectConnectionError,
+            GarminConnectTooManyRequestsError,
+        ) as err:
+            logger.error(err)
+            return None
+        return garmin
     try:
         print(f"尝试使用目录 '{tokenstore}' 中的令牌数据登录Garmin Connect...\n")
         garmin = Garmin()
@@ -66,20 +114,26 @@ def init_api(email, password):
             return None
     return garmin
 
-def download_activity(api, activity_id, filename):
-    """将活动下载为.zip文件。"""
+def download_activity(api, activity_id, filename, activity=None):
+    """
+    将活动下载为.zip文件，成功时返回 True。
+
+    :param activity: 活动列表中已有的元数据，提供时不再单独请求活动详情。
+    """
     try:
-        activity = api.get_activity(activity_id)
+        if activity is None:
+            activity = call_with_retry(api.get_activity, activity_id)
         activity_name = activity.get("activityName", "Unknown Activity")
         activity_start_time = activity.get("startTimeLocal", None)
 
         print(f"下载活动 {activity_id} ({activity_name})")
         
-        fit_data = api.download_activity(activity_id, dl_fmt=api.ActivityDownloadFormat.ORIGINAL)
+        fit_data = call_with_retry(api.download_activity, activity_id, dl_fmt=api.ActivityDownloadFormat.ORIGINAL)
         output_file = filename
         with open(output_file, "wb") as fb:
             fb.write(fit_data)
         print(f"活动数据下载到文件 {output_file}")
+        return True
 
     except (
         GarminConnectConnectionError,
@@ -89,6 +143,52 @@ def download_activity(api, activity_id, filename):
         GarthHTTPError,
     ) as err:
         logger.error(err)
+    return False
+
+def archive_path(catalog, folder, seq, activity_id):
+    """
+    活动的下载文件路径：已登记过压缩包的活动沿用原文件名；否则为 OriginZIPData{seq}.zip，
+    该文件名已属于其他活动（本地导入的压缩包编号与文件名不一定一致）或已有同名文件时，改用 OriginZIPData{seq}_{activityId}.zip，
+    不会覆盖其他压缩包。
+    """
+    archive = catalog.archive_of(seq)
+    if archive:
+        return os.path.join(folder, archive)
+    archive = f"{filename_format}{seq}.zip"
+    if catalog.archive_owner(archive) is not None or os.path.exists(os.path.join(folder, archive)):
+        archive = f"{filename_format}{seq}_{activity_id}.zip"
+    return os.path.join(folder, archive)
+
+def download_new_activities(api, limit, folder=save_path):
+    """
+    获取最近的活动列表并登记到活动目录，只下载尚未下载过的活动。
+
+    文件以活动目录分配的编号命名（OriginZIPData{seq}.zip，见 archive_path），同一个活动每次运行文件名不变。
+    :return: 本次新下载的压缩包路径列表。
+    """
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    downloaded = []
+    activities = call_with_retry(api.get_activities, 0, limit)
+    with Catalog() as catalog:
+        for activity in activities:
+            activity_id = activity["activityId"]
+            seq = catalog.upsert_activity(activity)
+            filename = archive_path(catalog, folder, seq, activity_id)
+            if catalog.stage_status(seq, "A") == "done" and os.path.exists(filename):
+                print(f"活动 {activity_id} 已下载，跳过")
+                continue
+            with metrics.activity(activity_id):
+                # 先写临时文件再改名，避免监视文件夹的服务读到写了一半的压缩包
+                if download_activity(api, activity_id, filename + ".part", activity):
+                    os.replace(filename + ".part", filename)
+                    catalog.register_archive(filename, seq)
+                    catalog.set_stage(seq, "A", "done", filename)
+                    downloaded.append(filename)
+                else:
+                    catalog.set_stage(seq, "A", "failed", filename, error="下载失败")
+    return downloaded
 
 def main():
     global api
@@ -98,16 +198,10 @@ def main():
         api = init_api(email, password)
 
     if api:
-        if not os.path.exists(save_path):
-            os.makedirs(save_path)
-
-        activities = api.get_activities(0, num_activities)
-        for i, activity in enumerate(activities, start=1):
-            activity_id = activity["activityId"]
-            filename = os.path.join(save_path, f"OriginZIPData{i}.zip")
-            download_activity(api, activity_id, filename)
+        download_new_activities(api, num_activities)
     else:
         print("无法登录Garmin Connect，请稍后再试。")
 
 if __name__ == "__main__":
-    main()
+    with metrics.run():
+        main()
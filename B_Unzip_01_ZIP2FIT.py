@@ -1,51 +1,120 @@
+import concurrent.futures
 import os
+import shutil
+import sys
 import zipfile
+import zlib
+from Z_Common_05_Metrics import Metrics
+from Z_Common_09_Catalog import Catalog, stage_inputs, track_stage
 
 # 设置要读取和解压的.zip文件的路径及解压后的保存路径
 zip_files_path = "./DataProcess/A_OriginZIPData"  # 下载的.zip文件存放路径
 extract_path = "./DataProcess/B_FITData"  # 解压后的文件存放路径
 filename_format = "FITData"  # 解压后的文件名称格式
+max_workers = 8  # 并发解压的线程数（解压以读写为主，可多于 CPU 核心数）
+copy_buffer_size = 1 << 20  # 解压与校验时每次读写的字节数
 
-def unzip_and_rename(zip_file_name, new_file_name):
-    """解压 .zip 文件并重命名解压后的文件。"""
-    with zipfile.ZipFile(zip_file_name, 'r') as zip_ref:
-        # 获取 zip 存档中的所有文件列表
-        zip_info_list = zip_ref.infolist()
-        
-        # 解压并重命名每个文件
-        for zip_info in zip_info_list:
-            # 解压文件
-            extracted_path = zip_ref.extract(zip_info, extract_path)
+metrics = Metrics("B_Unzip_01_ZIP2FIT")  # 阶段运行指标
+
+def member_names(zip_info_list, new_file_name):
+    """
+    为压缩包中的每个文件确定输出文件名，返回 [(ZipInfo, 输出文件名)]。
+
+    第一个 .fit 文件使用 new_file_name（后续阶段只读取它），其余文件按在压缩包中的顺序
+    依次命名为 {名称}_2{扩展名}、{名称}_3{扩展名}……，同一个压缩包每次解压得到相同的文件名。
+    """
+    members = [info for info in zip_info_list if not info.is_dir()]
+    fit_members = [info for info in members if info.filename.lower().endswith(".fit")]
+    primary = fit_members[0] if fit_members else (members[0] if members else None)
+    stem = os.path.splitext(new_file_name)[0]
+    names = []
+    k = 1
+    for info in members:
+        if info is primary:
+            names.append((info, new_file_name))
+        else:
+            k += 1
+            names.append((info, f"{stem}_{k}{os.path.splitext(info.filename)[1].lower()}"))
+    return names
+
+def file_crc32(path):
+    """流式计算文件的 CRC-32（与 zip 中记录的校验值相同的算法）"""
+    crc = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(copy_buffer_size)
+            if not chunk:
+                return crc
+            crc = zlib.crc32(chunk, crc)
 
-            # 获取原始文件名
-            original_file_name = os.path.basename(zip_info.filename)
+def is_extracted(zip_info, path):
+    """已解压的文件大小与 CRC-32 都与压缩包中记录的一致时返回 True（只读取已解压的文件，不解压）"""
+    return os.path.isfile(path) and os.path.getsize(path) == zip_info.file_size and file_crc32(path) == zip_info.CRC
 
-            # 定义新的文件路径
-            new_file_path = os.path.join(os.path.dirname(extracted_path), new_file_name)
+def unzip_and_rename(zip_file_name, new_file_name):
+    """
+    解压 .zip 文件并按 member_names 重命名解压后的文件。
+
+    先流式解压到临时文件，读到末尾时 zipfile 会校验 CRC-32，校验失败抛出 BadZipFile 并删除临时文件；
+    已解压且大小与 CRC 一致的文件跳过。
 
-            # 如果存在同名文件，则删除
-            if os.path.exists(new_file_path):
-                os.remove(new_file_path)
+    :return: (解压的文件数, 跳过的文件数)。
+    """
+    extracted = skipped = 0
+    with zipfile.ZipFile(zip_file_name, 'r') as zip_ref:
+        for zip_info, name in member_names(zip_ref.infolist(), new_file_name):
+            new_file_path = os.path.join(extract_path, name)
+            if is_extracted(zip_info, new_file_path):
+                skipped += 1
+                continue
+            tmp_path = f"{new_file_path}.tmp"
+            try:
+                with zip_ref.open(zip_info) as src, open(tmp_path, "wb") as dst:
+                    shutil.copyfileobj(src, dst, copy_buffer_size)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            os.replace(tmp_path, new_file_path)
+            extracted += 1
+    return extracted, skipped
 
-            # 重命名文件
-            os.rename(extracted_path, new_file_path)
+def extract_activity(i, zip_file):
+    """在线程中解压一个压缩包并记录阶段状态，返回 (解压的文件数, 跳过的文件数)"""
+    new_file_name = f"{filename_format}{i}.fit"
+    with metrics.activity(zip_file), track_stage(i, "B", os.path.join(extract_path, new_file_name)):
+        return unzip_and_rename(os.path.join(zip_files_path, zip_file), new_file_name)
 
 def main():
     # 确保解压后的保存目录存在
     if not os.path.exists(extract_path):
         os.makedirs(extract_path)
 
-    # 获取所有.zip文件
-    zip_files = [f for f in os.listdir(zip_files_path) if f.endswith('.zip')]
-    
-    # 依次处理每个.zip文件
-    for i, zip_file in enumerate(zip_files, start=1):
-        zip_file_path = os.path.join(zip_files_path, zip_file)
-        new_file_name = f"{filename_format}{i}.fit"
-        unzip_and_rename(zip_file_path, new_file_name)
-        
-    print(f"已完成")
+    # 登记手动放入的.zip文件，再从活动目录获取所有.zip文件及其编号
+    with Catalog() as catalog:
+        catalog.register_archives(zip_files_path)
+    zip_files = stage_inputs("A", zip_files_path, lambda row: row["archive"], lambda f: f.endswith('.zip'))
+
+    # 多个压缩包并发解压，单个压缩包损坏只记录失败，不影响其他压缩包
+    extracted = skipped = failed = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        futures = {executor.submit(extract_activity, i, zip_file): zip_file for i, zip_file in zip_files}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                n_extracted, n_skipped = future.result()
+            except Exception as e:  # 压缩包损坏（BadZipFile、zlib.error）或读写失败
+                failed += 1
+                print(f"解压 {futures[future]} 失败: {e}")
+                continue
+            extracted += n_extracted
+            skipped += n_skipped
+
+    print(f"已完成：解压 {extracted} 个文件，跳过 {skipped} 个未变化的文件，失败 {failed} 个压缩包")
+    if failed:
+        return 1
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    with metrics.run():
+        sys.exit(main())
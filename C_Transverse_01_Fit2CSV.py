@@ -1,27 +1,158 @@
-from fitparse import FitFile
+import fitparse
+import concurrent.futures
+import csv
+import json
 import pandas as pd
 import os
+import sys
+import time
+import traceback
+from Z_Common_02_FrameRunner import atomic_write_bytes
+from Z_Common_04_FitFile import FitValidationError, validate_fit
+from Z_Common_05_Metrics import Metrics
+from Z_Common_08_Scheduler import Scheduler
+from Z_Common_09_Catalog import Catalog, catalog_exists, stage_inputs, track_stage
+from Z_Common_10_Stream import chunk_rows
+from Z_Common_13_Fields import required_fields
 
 # 设置要读取和转换的 .fit 文件的路径及转换后的保存路径
 fit_files_path = "./DataProcess/B_FITData"  # 解压出的 .fit 文件存放路径
 save_path = "./DataProcess/C_CSVData"  # 转换后的 .csv 文件存放路径
 filename_format = "CSVData"  # 转换后的文件名称格式
+input_filename_format = "FITData"  # 解压出的 .fit 文件名称格式
+validate_mode = "crc"  # 解码前的完整性校验："crc"（文件头、长度与 CRC）、"size"（只检查文件头与长度）或 None（不校验）
+max_workers = None  # 并发解码的工作进程数，None 表示使用全局调度器的 CPU 预算
+error_report_file = os.path.join(save_path, "decode_report.json")  # 解码结果报告（记录每个失败文件的错误）
 
-def fit_to_csv(fit_file_name, new_file_name):
-    """将 .fit 文件转换为 .csv 文件。"""
+metrics = Metrics("C_Transverse_01_Fit2CSV")  # 阶段运行指标
+
+class _StreamingFitFile(fitparse.FitFile):
+    """不保留已解析消息的 FitFile（fitparse 1.2 的 FitFile 会缓存全部消息），逐条解析、用完即丢弃"""
+
+    def _parse_message(self):
+        message = super()._parse_message()
+        self._messages.clear()
+        return message
+
+# 新版 fitparse 自带不缓存消息的 UncachedFitFile
+FitFile = getattr(fitparse, "UncachedFitFile", _StreamingFitFile)
+
+def _extend_header(path, columns):
+    """记录中出现新字段时，流式重写已写出的部分，补上新列（已写出的行新列为空）"""
+    tmp_path = f"{path}.extend"
+    with open(path, "r", newline="", encoding="utf-8") as f_in, open(tmp_path, "w", newline="", encoding="utf-8") as f_out:
+        reader = csv.reader(f_in)
+        writer = csv.writer(f_out, lineterminator=os.linesep)
+        next(reader)
+        writer.writerow(columns)
+        for row in reader:
+            writer.writerow(row + [""] * (len(columns) - len(row)))
+    os.replace(tmp_path, path)
+
+def fit_to_csv(fit_file_name, new_file_name, fields=None):
+    """
+    将 .fit 文件转换为 .csv 文件。
+
+    逐条解码记录，每积累一块就追加写出，内存中最多只有一块记录；列按字段首次出现的顺序排列。
+
+    :param fields: 要保留的字段名称集合，None 表示保留全部字段（包括开发者字段）。
+    """
     fit_file = FitFile(fit_file_name)
-    data = []
-    for record in fit_file.get_messages('record'):
-        fields = record.get_values()
-        data.append(fields)
-    
-    df = pd.DataFrame(data)
     new_file_path = os.path.join(save_path, new_file_name)
-    
+    tmp_path = f"{new_file_path}.tmp"
+    columns = []  # 已出现的字段，按首次出现的顺序
+    known = set()
+    header_columns = None  # 已写入文件的列数，None 表示尚未写入标题行
+    buffer = []
+    size = chunk_rows()
+
+    def flush():
+        nonlocal header_columns
+        if header_columns is not None and header_columns < len(columns):
+            _extend_header(tmp_path, columns)
+        with open(tmp_path, "w" if header_columns is None else "a", newline="", encoding="utf-8") as f:
+            if header_columns is None:
+                csv.writer(f, lineterminator=os.linesep).writerow(columns)
+            header_columns = len(columns)
+            csv.DictWriter(f, fieldnames=columns, lineterminator=os.linesep).writerows(buffer)
+        buffer.clear()
+
+    try:
+        for record in fit_file.get_messages('record'):
+            if fields is None:
+                values = record.get_values()
+            else:
+                values = {field.name: field.value for field in record.fields if field.name in fields}
+            for key in values:
+                if key not in known:
+                    known.add(key)
+                    columns.append(key)
+            buffer.append(values)
+            if len(buffer) >= size:
+                flush()
+        flush()
+    except BaseException:
+        # 解码中途失败时不留下不完整的临时文件
+        for path in (tmp_path, f"{tmp_path}.extend"):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+
     if os.path.exists(new_file_path):
         os.remove(new_file_path)
-        
-    df.to_csv(new_file_path, index=False)
+    os.replace(tmp_path, new_file_path)
+
+def convert_activity(seq, fit_file_path, new_file_name):
+    """
+    转换一个活动；本地导入的活动没有下载元数据，用第一个时间戳补全活动目录中的开始时间。
+
+    按 validate_mode 先做完整性校验，截断或损坏的文件抛出 FitValidationError，不进入解码；
+    只保留后续阶段需要的字段（见 Z_Common_13_Fields.py）。
+    """
+    if validate_mode:
+        error = validate_fit(fit_file_path, check_crc=validate_mode == "crc")
+        if error:
+            raise FitValidationError(f"{os.path.basename(fit_file_path)}: {error}")
+    fit_to_csv(fit_file_path, new_file_name, required_fields())
+    df = pd.read_csv(os.path.join(save_path, new_file_name), nrows=1)
+    if catalog_exists() and "timestamp" in df and len(df):
+        with Catalog() as catalog:
+            catalog.fill_start_time(seq, df["timestamp"].iloc[0])
+
+def decode_activity(seq, fit_file, new_file_name):
+    """
+    在工作进程中转换一个活动，捕获所有异常，返回结果字典而不向外抛出，一个文件损坏不影响其他文件。
+
+    :return: {"seq", "file", "status": "done" | "invalid" | "failed", "error", "error_type", "traceback", "wall_s", "cpu_s"}
+    """
+    result = {"seq": seq, "file": fit_file, "status": "done", "error": None, "error_type": None, "traceback": None}
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        with track_stage(seq, "C", os.path.join(save_path, new_file_name)):
+            convert_activity(seq, os.path.join(fit_files_path, fit_file), new_file_name)
+    except Exception as e:
+        result.update(
+            status="invalid" if isinstance(e, FitValidationError) else "failed",
+            error=str(e),
+            error_type=type(e).__name__,
+            traceback=None if isinstance(e, FitValidationError) else traceback.format_exc(),
+        )
+    result["wall_s"] = time.perf_counter() - wall_start
+    result["cpu_s"] = time.process_time() - cpu_start
+    return result
+
+def write_error_report(results, path=error_report_file):
+    """写出结构化的解码报告：各状态的数量与每个未成功文件的错误"""
+    results = sorted(results, key=lambda r: r["seq"])
+    report = {
+        "generated": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "validate_mode": validate_mode,
+        "total": len(results),
+        "counts": {status: sum(r["status"] == status for r in results) for status in ("done", "invalid", "failed")},
+        "errors": [r for r in results if r["status"] != "done"],
+    }
+    atomic_write_bytes(json.dumps(report, ensure_ascii=False, indent=2).encode("utf-8"), path)
+    return report
 
 def main():
     # 确保转换后的保存目录存在
@@ -29,16 +160,48 @@ def main():
         os.makedirs(save_path)
 
     # 获取所有 .fit 文件
-    fit_files = [f for f in os.listdir(fit_files_path) if f.endswith('.fit')]
+    fit_files = stage_inputs("B", fit_files_path, lambda row: f"{input_filename_format}{row['seq']}.fit", lambda f: f.endswith('.fit'))
+
+    # 先推算需要的字段（工作进程由本进程派生时直接继承结果）
+    fields = required_fields()
+    if fields is not None:
+        print(f"只保留 {len(fields)} 个字段: {', '.join(sorted(fields))}")
+
+    # 每个 .fit 文件作为一个任务并发解码，小文件优先
+    results = []
+    with Scheduler(max_workers) as scheduler:
+        futures = {}
+        for i, fit_file in fit_files:
+            priority = os.path.getsize(os.path.join(fit_files_path, fit_file))
+            future = scheduler.submit(decode_activity, i, fit_file, f"{filename_format}{i}.csv", priority=priority)
+            futures[future] = (i, fit_file)
 
-    # 依次处理每个 .fit 文件
-    for i, fit_file in enumerate(fit_files, start=1):
-        fit_file_path = os.path.join(fit_files_path, fit_file)
-        new_file_name = f"{filename_format}{i}.csv"
-        fit_to_csv(fit_file_path, new_file_name)
+        for future in concurrent.futures.as_completed(futures):
+            i, fit_file = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:  # 工作进程异常退出等，任务本身没有机会记录结果
+                result = {"seq": i, "file": fit_file, "status": "failed", "error": str(e) or repr(e), "error_type": type(e).__name__,
+                          "traceback": None, "wall_s": 0.0, "cpu_s": 0.0}
+                if catalog_exists():
+                    with Catalog() as catalog:
+                        catalog.set_stage(i, "C", "failed", os.path.join(save_path, f"{filename_format}{i}.csv"), error=result["error"])
+            results.append(result)
+            metrics.activities[fit_file] = {"wall_s": result["wall_s"], "cpu_s": result["cpu_s"]}
+            if result["status"] == "done":
+                print(f"{fit_file} 已转换（{result['wall_s']:.1f} 秒）")
+            else:
+                print(f"{fit_file} {'校验未通过' if result['status'] == 'invalid' else '解码失败'}: {result['error']}")
 
-    print(f"已完成")
+    report = write_error_report(results)
+    counts = report["counts"]
+    print(f"已完成：成功 {counts['done']} 个，校验未通过 {counts['invalid']} 个，解码失败 {counts['failed']} 个")
+    if report["errors"]:
+        print(f"错误详情见: {error_report_file}")
+        return 1
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    with metrics.run():
+        sys.exit(main())
@@ -1,10 +1,14 @@
 import csv
 import os
+from Z_Common_05_Metrics import Metrics
+from Z_Common_09_Catalog import stage_inputs, track_stage
+from Z_Common_13_Fields import required_divided_files
 
 # 配置区域
 input_csv_path = "./DataProcess/C_CSVData"  # 输入 CSV 文件路径
 output_base_path = "./DataProcess/D_DividedData"  # 输出文件夹路径
 filename_format = "Activity"  # 输出文件夹名称格式
+input_filename_format = "CSVData"  # 输入 CSV 文件名称格式
 
 # 输出配置（文件名: 需要保留的列）
 output_config = {
@@ -24,6 +28,8 @@ output_config = {
         "Cadenceb.csv": ["fractional_cadence"]
 }
 
+metrics = Metrics("D_Divide_01_CSV2CSVs")  # 阶段运行指标
+
 def split_csv_with_config(input_file, output_config, output_folder):
     """
     按列分割 CSV 文件核心函数
@@ -42,13 +48,12 @@ def split_csv_with_config(input_file, output_config, output_folder):
                 if col not in original_columns:
                     raise ValueError(f"列 '{col}' 不存在于输入文件中")
 
-        # 初始化输出文件写入器
+        # 初始化输出文件写入器（输出文件不含标题行）
         writers = {}
         for filename, columns in output_config.items():
             output_file_path = os.path.join(output_folder, filename)
             f_out = open(output_file_path, 'w', newline='', encoding='utf-8')
             writer = csv.DictWriter(f_out, fieldnames=columns)
-            writer.writeheader()  # 写入标题
             writers[filename] = (writer, f_out)
 
         # 逐行处理数据
@@ -61,13 +66,20 @@ def split_csv_with_config(input_file, output_config, output_folder):
         for _, f_out in writers.values():
             f_out.close()
 
-    # 删除每个输出文件的第一行（标题行）
-    for filename in output_config.keys():
-        output_file_path = os.path.join(output_folder, filename)
-        with open(output_file_path, 'r', newline='', encoding='utf-8') as f:
-            lines = f.readlines()
-        with open(output_file_path, 'w', newline='', encoding='utf-8') as f:
-            f.writelines(lines[1:])  # 跳过第一行
+def projected_output_config():
+    """只保留帧图层需要的输出文件（见 Z_Common_13_Fields.py），C 阶段同样只解码了这些文件的字段"""
+    needed = required_divided_files()
+    if needed is None:
+        return output_config
+    return {filename: columns for filename, columns in output_config.items() if filename in needed}
+
+def process_activity(input_file_path, output_folder):
+    """把一个活动的 CSV 拆分到输出文件夹中"""
+    # 确保输出文件夹存在
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    split_csv_with_config(input_file_path, projected_output_config(), output_folder)
 
 def main():
     # 确保输出文件夹存在
@@ -75,19 +87,16 @@ def main():
         os.makedirs(output_base_path)
 
     # 获取所有 .csv 文件
-    csv_files = [f for f in os.listdir(input_csv_path) if f.endswith('.csv')]
+    csv_files = stage_inputs("C", input_csv_path, lambda row: f"{input_filename_format}{row['seq']}.csv", lambda f: f.endswith('.csv'))
 
     # 依次处理每个 .csv 文件
-    for i, csv_file in enumerate(csv_files, start=1):
+    for i, csv_file in csv_files:
         input_file_path = os.path.join(input_csv_path, csv_file)
         output_folder = os.path.join(output_base_path, f"{filename_format}{i}")
-        
-        # 确保输出文件夹存在
-        if not os.path.exists(output_folder):
-            os.makedirs(output_folder)
-        
-        split_csv_with_config(input_file_path, output_config, output_folder)
+        with metrics.activity(csv_file), track_stage(i, "D", output_folder):
+            process_activity(input_file_path, output_folder)
 
     print(f'已完成')
 if __name__ == "__main__":
-    main()
+    with metrics.run():
+        main()
@@ -1,7 +1,10 @@
-import pandas as pd
 import numpy as np
 import os
 import shutil
+from Z_Common_05_Metrics import Metrics
+from Z_Common_09_Catalog import stage_inputs, track_stage
+from Z_Common_10_Stream import ChunkWriter, read_csv_chunks
+from Z_Common_13_Fields import has_inputs
 
 # 配置区域
 input_base_path = "./DataProcess/D_DividedData"  # 输入文件夹路径
@@ -24,6 +27,8 @@ files_to_transfer = [
     "HeartRate.csv"  # 直接转移的文件
 ]
 
+metrics = Metrics("E_Conversion_01_Speed_HeartRate_Cadence_Power")  # 阶段运行指标
+
 def convert_all_speed_to_pace(input_file, output_file):
     """
     将 CSV 文件中的所有速度 (km/h) 列转换为跑步配速 (min/km)，并将零速度替换为特殊符号。
@@ -32,9 +37,6 @@ def convert_all_speed_to_pace(input_file, output_file):
     :param input_file: 输入 CSV 文件的名称。
     :param output_file: 输出 CSV 文件的名称。
     """
-    # 读取 CSV 文件
-    df = pd.read_csv(input_file, header=None)
-    
     # 将速度 (km/h) 转换为配速 (min/km) 的函数
     def speed_to_pace(speed):
         if speed <= 1.2:
@@ -44,12 +46,12 @@ def convert_all_speed_to_pace(input_file, output_file):
         seconds = int((pace - minutes) * 60)
         return f"{minutes}:{seconds:02d}"
     
-    # 将转换函数应用于所有列
-    for col in df.columns:
-        df[col] = df[col].apply(lambda x: speed_to_pace(x) if isinstance(x, (int, float)) else x)
-
-    # 保存修改后的 DataFrame 到新 CSV 文件
-    df.to_csv(output_file, index=False, header=False)
+    # 分块读取，将转换函数应用于所有列，并追加保存到新 CSV 文件
+    with ChunkWriter(output_file) as writer:
+        for df in read_csv_chunks(input_file):
+            for col in df.columns:
+                df[col] = df[col].apply(lambda x: speed_to_pace(x) if isinstance(x, (int, float)) else x)
+            writer.write(df)
     print(f"将所有速度列转换为配速并保存到 '{output_file}'")
 
 def transfer_files(input_folder_path, output_folder_path, files_to_transfer):
@@ -77,21 +79,20 @@ def process_csv_files(file1, file2, output_file):
     :param file2: 第二个输入 CSV 文件的路径。
     :param output_file: 输出 CSV 文件的路径。
     """
-    # 读取 CSV 文件
-    df1 = pd.read_csv(file1, header=None)
-    df2 = pd.read_csv(file2, header=None)
-    
-    # 按次序相加并乘以 2
-    result_df = (df1 + df2) * 2
+    # 两个文件行数相同，按相同的块大小同步分块读取
+    with ChunkWriter(output_file) as writer:
+        for df1, df2 in zip(read_csv_chunks(file1), read_csv_chunks(file2)):
+            # 按次序相加并乘以 2
+            result_df = (df1 + df2) * 2
 
-    # 只保留整数部分
-    result_df = np.floor(result_df).astype(int)
+            # 只保留整数部分
+            result_df = np.floor(result_df).astype(int)
 
-    # 判断是否小于115，若小于115，则输出相应结果
-    result_df = result_df.map(lambda x: '--' if x < 115 else x)
-    
-    # 输出到新的 CSV 文件
-    result_df.to_csv(output_file, index=False, header=False)
+            # 判断是否小于115，若小于115，则输出相应结果
+            result_df = result_df.map(lambda x: '--' if x < 115 else x)
+
+            # 追加输出到新的 CSV 文件
+            writer.write(result_df)
     print(f"处理后的步频数据保存到 '{output_file}'")
 
 def process_csv_power(file1, output_file):
@@ -101,44 +102,62 @@ def process_csv_power(file1, output_file):
     :param file1: 输入 CSV 文件的路径。
     :param output_file: 输出 CSV 文件的路径。
     """
-    # 读取 CSV 文件
-    dfpower = pd.read_csv(file1, header=None)
+    with ChunkWriter(output_file) as writer:
+        for dfpower in read_csv_chunks(file1):
+            # 判断是否小于200，若小于200，则输出一符号
+            dfpower = dfpower.map(lambda x: '--' if x < 200 else x)
 
-    # 判断是否小于200，若小于200，则输出一符号
-    dfpower = dfpower.map(lambda x: '--' if x < 200 else x)
-    
-    # 输出到新的 CSV 文件
-    dfpower.to_csv(output_file, index=False, header=False)
+            # 追加输出到新的 CSV 文件
+            writer.write(dfpower)
     print(f"处理后的功率数据保存到 '{output_file}'")
 
+def output_dependencies():
+    """输出文件 -> 所需的输入文件（Z_Common_13_Fields 据此推算需要解码的 FIT 字段）"""
+    dependencies = {
+        output_speed_file: [input_speed_file],
+        output_cadence_file: [input_cadence_a_file, input_cadence_b_file],
+        output_power_file: [input_power_file],
+    }
+    dependencies.update({f: [f] for f in files_to_transfer})
+    return dependencies
+
+def process_activity(input_folder_path, output_folder_path):
+    """转换一个活动文件夹中的数据，缺少输入文件的输出跳过"""
+    # 确保输出文件夹存在
+    if not os.path.exists(output_folder_path):
+        os.makedirs(output_folder_path)
+    dependencies = output_dependencies()
+
+    # 处理速度文件
+    if has_inputs(input_folder_path, dependencies[output_speed_file]):
+        convert_all_speed_to_pace(os.path.join(input_folder_path, input_speed_file), os.path.join(output_folder_path, output_speed_file))
+
+    # 直接转移文件
+    transfer_files(input_folder_path, output_folder_path, [f for f in files_to_transfer if has_inputs(input_folder_path, [f])])
+
+    # 处理步幅文件
+    if has_inputs(input_folder_path, dependencies[output_cadence_file]):
+        process_csv_files(os.path.join(input_folder_path, input_cadence_a_file), os.path.join(input_folder_path, input_cadence_b_file), os.path.join(output_folder_path, output_cadence_file))
+
+    # 处理功率文件
+    if has_inputs(input_folder_path, dependencies[output_power_file]):
+        process_csv_power(os.path.join(input_folder_path, input_power_file), os.path.join(output_folder_path, output_power_file))
+
 def main():
     # 确保输出文件夹存在
     if not os.path.exists(output_base_path):
         os.makedirs(output_base_path)
 
     # 获取所有分割后的文件夹
-    activity_folders = [f for f in os.listdir(input_base_path) if os.path.isdir(os.path.join(input_base_path, f))]
+    activity_folders = stage_inputs("D", input_base_path, lambda row: f"{filename_format}{row['seq']}", lambda f: os.path.isdir(os.path.join(input_base_path, f)))
 
     # 依次处理每个文件夹
-    for i, folder in enumerate(activity_folders, start=1):
+    for i, folder in activity_folders:
         input_folder_path = os.path.join(input_base_path, folder)
         output_folder_path = os.path.join(output_base_path, f"{filename_format}{i}")
-        
-        # 确保输出文件夹存在
-        if not os.path.exists(output_folder_path):
-            os.makedirs(output_folder_path)
-        
-        # 处理速度文件
-        convert_all_speed_to_pace(os.path.join(input_folder_path, input_speed_file), os.path.join(output_folder_path, output_speed_file))
-
-        # 直接转移文件
-        transfer_files(input_folder_path, output_folder_path, files_to_transfer)
-        
-        # 处理步幅文件
-        process_csv_files(os.path.join(input_folder_path, input_cadence_a_file), os.path.join(input_folder_path, input_cadence_b_file), os.path.join(output_folder_path, output_cadence_file))
-        
-        # 处理功率文件
-        process_csv_power(os.path.join(input_folder_path, input_power_file), os.path.join(output_folder_path, output_power_file))
+        with metrics.activity(folder), track_stage(i, "E1", output_folder_path):
+            process_activity(input_folder_path, output_folder_path)
 
 if __name__ == "__main__":
-    main()
+    with metrics.run():
+        main()
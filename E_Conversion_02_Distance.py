@@ -1,5 +1,8 @@
-import pandas as pd
 import os
+from Z_Common_05_Metrics import Metrics
+from Z_Common_09_Catalog import stage_inputs, track_stage
+from Z_Common_10_Stream import ChunkWriter, read_csv_chunks
+from Z_Common_13_Fields import has_inputs
 
 # 配置区域
 input_base_path = "./DataProcess/D_DividedData"  # 输入文件夹路径
@@ -9,6 +12,8 @@ filename_format = "Activity"  # 输出文件夹名称格式
 input_distance_file = "Distance.csv"  # 输入距离文件
 output_distance_file = "DistanceConversed.csv"  # 输出距离文件
 
+metrics = Metrics("E_Conversion_02_Distance")  # 阶段运行指标
+
 def process_distance_file(input_file, output_file):
     """
     读取 CSV 文件，将每个值除以 1000，保留两位小数，并将结果输出到新的 CSV 文件。
@@ -16,39 +21,50 @@ def process_distance_file(input_file, output_file):
     :param input_file: 输入 CSV 文件的路径。
     :param output_file: 输出 CSV 文件的路径。
     """
-    # 读取 CSV 文件
-    df = pd.read_csv(input_file, header=None)
-    
-    # 除以 1000 并保留两位小数
-    result_df = df / 1000
-    result_df = result_df.round(2)
-    
-    # 输出到新的 CSV 文件
-    result_df.to_csv(output_file, index=False, header=False)
+    # 分块读取 CSV 文件
+    with ChunkWriter(output_file) as writer:
+        for df in read_csv_chunks(input_file):
+            # 除以 1000 并保留两位小数
+            result_df = df / 1000
+            result_df = result_df.round(2)
+
+            # 追加输出到新的 CSV 文件
+            writer.write(result_df)
     print(f"处理后的距离数据保存到 '{output_file}'")
 
+def output_dependencies():
+    """输出文件 -> 所需的输入文件（Z_Common_13_Fields 据此推算需要解码的 FIT 字段）"""
+    return {output_distance_file: [input_distance_file]}
+
+def process_activity(input_folder_path, output_folder_path):
+    """转换一个活动文件夹中的数据，缺少输入文件时跳过"""
+    # 确保输出文件夹存在
+    if not os.path.exists(output_folder_path):
+        os.makedirs(output_folder_path)
+    if not has_inputs(input_folder_path, [input_distance_file]):
+        return
+
+    # 处理距离文件
+    process_distance_file(
+        os.path.join(input_folder_path, input_distance_file),
+        os.path.join(output_folder_path, output_distance_file)
+    )
+
 def main():
     # 确保输出文件夹存在
     if not os.path.exists(output_base_path):
         os.makedirs(output_base_path)
 
     # 获取所有分割后的文件夹
-    activity_folders = [f for f in os.listdir(input_base_path) if os.path.isdir(os.path.join(input_base_path, f))]
+    activity_folders = stage_inputs("D", input_base_path, lambda row: f"{filename_format}{row['seq']}", lambda f: os.path.isdir(os.path.join(input_base_path, f)))
 
     # 依次处理每个文件夹
-    for i, folder in enumerate(activity_folders, start=1):
+    for i, folder in activity_folders:
         input_folder_path = os.path.join(input_base_path, folder)
         output_folder_path = os.path.join(output_base_path, f"{filename_format}{i}")
-        
-        # 确保输出文件夹存在
-        if not os.path.exists(output_folder_path):
-            os.makedirs(output_folder_path)
-        
-        # 处理距离文件
-        process_distance_file(
-            os.path.join(input_folder_path, input_distance_file),
-            os.path.join(output_folder_path, output_distance_file)
-        )
+        with metrics.activity(folder), track_stage(i, "E2", output_folder_path):
+            process_activity(input_folder_path, output_folder_path)
 
 if __name__ == "__main__":
-    main()
+    with metrics.run():
+        main()
@@ -1,6 +1,10 @@
 import pandas as pd
 import numpy as np
 import os
+from Z_Common_05_Metrics import Metrics
+from Z_Common_09_Catalog import stage_inputs, track_stage
+from Z_Common_10_Stream import ChunkWriter, read_csv_chunks
+from Z_Common_13_Fields import has_inputs
 
 # 配置区域
 input_base_path = "./DataProcess/D_DividedData"  # 输入文件夹路径
@@ -14,6 +18,32 @@ output_lon_file = "LongitudeDeg.csv"  # 输出转换后的经度文件
 output_lat_inter_file = "LatitudeDegInter.csv"  # 输出插值后的纬度文件
 output_lon_inter_file = "LongitudeDegInter.csv"  # 输出插值后的经度文件
 
+metrics = Metrics("E_Conversion_03_Latitude_Longitude")  # 阶段运行指标
+
+def interpolate_chunks(chunks, factor):
+    """
+    对分块到达的数据做线性插值，每两个原始数据间插入 factor - 1 个值。
+
+    每块保留最后一个原始值作为下一块的起点，结果与对整段数据一次插值相同，
+    内存中只有一块数据及其插值结果。
+
+    :param chunks: 依次到达的一维数组。
+    :param factor: 插值因子。
+    :return: 依次生成插值结果的一维数组，最后生成末尾的原始值。
+    """
+    steps = np.arange(factor) / factor
+    previous = None
+    for data in chunks:
+        if previous is not None:
+            data = np.concatenate(([previous], data))
+        if len(data) == 0:
+            continue
+        if len(data) >= 2:
+            yield (data[:-1, None] + np.diff(data)[:, None] * steps).ravel()
+        previous = data[-1]
+    if previous is not None:
+        yield np.array([previous])
+
 def convert_and_store_lat_lon(lat_file, lon_file, lat_output_file, lon_output_file, lat_inter_file, lon_inter_file):
     """
     将两个 CSV 文件中的原始纬度和经度信息进行转换，并保存到单独的 CSV 文件中。
@@ -28,67 +58,73 @@ def convert_and_store_lat_lon(lat_file, lon_file, lat_output_file, lon_output_fi
     # 定义转换因子
     conversion_factor = (2**31 - 1)
     
-    # 读取 CSV 文件
-    raw_lat_df = pd.read_csv(lat_file, header=None).values.flatten()
-    raw_lon_df = pd.read_csv(lon_file, header=None).values.flatten()
-    
-    # 将原始数据转换为度数
-    lat_df = raw_lat_df.astype(float) / conversion_factor * 180
-    lon_df = raw_lon_df.astype(float) / conversion_factor * 180
-
     # 定义插值因子
     factor = 10  # 每两个原始数据间插入9个值，总共生成10个值
 
-    # 创建插值函数
-    def interpolate(data, factor):
-        x = np.arange(len(data))
-        xi = np.linspace(0, len(data) - 1, len(data) * factor - (factor - 1))
-        return np.interp(xi, x, data)
+    # 分块读取 CSV 文件并将原始数据转换为度数
+    def to_degrees(path):
+        for chunk in read_csv_chunks(path):
+            yield chunk.values.flatten().astype(float) / conversion_factor * 180
 
-    # 对经纬度数据进行插值
-    lon_interpolated = interpolate(lon_df, factor)
-    lat_interpolated = interpolate(lat_df, factor)
-    
-    # 保存转换后的 DataFrame 到新的 CSV 文件
-    pd.DataFrame(lat_df).to_csv(lat_output_file, index=False, header=False)
-    print(f"转换后的纬度信息已保存到 '{lat_output_file}'")
-    
-    pd.DataFrame(lon_df).to_csv(lon_output_file, index=False, header=False)
-    print(f"转换后的经度信息已保存到 '{lon_output_file}'")
+    # 转换与插值都按块进行，每块转换后的度数直接写出，同时交给插值生成器
+    def convert(path, output_file, inter_file):
+        with ChunkWriter(output_file) as writer, ChunkWriter(inter_file) as inter_writer:
+            def degrees():
+                for chunk in to_degrees(path):
+                    writer.write(pd.DataFrame(chunk))
+                    yield chunk
+
+            for interpolated in interpolate_chunks(degrees(), factor):
+                inter_writer.write(pd.DataFrame(interpolated))
 
-    # 保存插值后的 DataFrame 到新的 CSV 文件
-    pd.DataFrame(lat_interpolated).to_csv(lat_inter_file, index=False, header=False)
+    # 保存转换后与插值后的纬度
+    convert(lat_file, lat_output_file, lat_inter_file)
+    print(f"转换后的纬度信息已保存到 '{lat_output_file}'")
     print(f"插值后的纬度信息已保存到 '{lat_inter_file}'")
-    
-    pd.DataFrame(lon_interpolated).to_csv(lon_inter_file, index=False, header=False)
+
+    # 保存转换后与插值后的经度
+    convert(lon_file, lon_output_file, lon_inter_file)
+    print(f"转换后的经度信息已保存到 '{lon_output_file}'")
     print(f"插值后的经度信息已保存到 '{lon_inter_file}'")
 
+def output_dependencies():
+    """输出文件 -> 所需的输入文件（Z_Common_13_Fields 据此推算需要解码的 FIT 字段）"""
+    inputs = [input_lat_file, input_lon_file]
+    return {f: inputs for f in (output_lat_file, output_lon_file, output_lat_inter_file, output_lon_inter_file)}
+
+def process_activity(input_folder_path, output_folder_path):
+    """转换一个活动文件夹中的数据，缺少输入文件时跳过"""
+    # 确保输出文件夹存在
+    if not os.path.exists(output_folder_path):
+        os.makedirs(output_folder_path)
+    if not has_inputs(input_folder_path, [input_lat_file, input_lon_file]):
+        return
+
+    # 处理纬度和经度文件
+    convert_and_store_lat_lon(
+        os.path.join(input_folder_path, input_lat_file),
+        os.path.join(input_folder_path, input_lon_file),
+        os.path.join(output_folder_path, output_lat_file),
+        os.path.join(output_folder_path, output_lon_file),
+        os.path.join(output_folder_path, output_lat_inter_file),
+        os.path.join(output_folder_path, output_lon_inter_file)
+    )
+
 def main():
     # 确保输出文件夹存在
     if not os.path.exists(output_base_path):
         os.makedirs(output_base_path)
 
     # 获取所有分割后的文件夹
-    activity_folders = [f for f in os.listdir(input_base_path) if os.path.isdir(os.path.join(input_base_path, f))]
+    activity_folders = stage_inputs("D", input_base_path, lambda row: f"{filename_format}{row['seq']}", lambda f: os.path.isdir(os.path.join(input_base_path, f)))
 
     # 依次处理每个文件夹
-    for i, folder in enumerate(activity_folders, start=1):
+    for i, folder in activity_folders:
         input_folder_path = os.path.join(input_base_path, folder)
         output_folder_path = os.path.join(output_base_path, f"{filename_format}{i}")
-        
-        # 确保输出文件夹存在
-        if not os.path.exists(output_folder_path):
-            os.makedirs(output_folder_path)
-        
-        # 处理纬度和经度文件
-        convert_and_store_lat_lon(
-            os.path.join(input_folder_path, input_lat_file),
-            os.path.join(input_folder_path, input_lon_file),
-            os.path.join(output_folder_path, output_lat_file),
-            os.path.join(output_folder_path, output_lon_file),
-            os.path.join(output_folder_path, output_lat_inter_file),
-            os.path.join(output_folder_path, output_lon_inter_file)
-        )
+        with metrics.activity(folder), track_stage(i, "E3", output_folder_path):
+            process_activity(input_folder_path, output_folder_path)
 
 if __name__ == "__main__":
-    main()
+    with metrics.run():
+        main()
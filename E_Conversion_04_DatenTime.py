@@ -2,6 +2,10 @@ import pandas as pd
 from datetime import datetime, timedelta
 import pytz
 import os
+from Z_Common_05_Metrics import Metrics
+from Z_Common_09_Catalog import stage_inputs, track_stage
+from Z_Common_10_Stream import ChunkWriter, read_csv_chunks
+from Z_Common_13_Fields import has_inputs
 
 # 配置区域
 input_base_path = "./DataProcess/D_DividedData"  # 输入文件夹路径
@@ -12,6 +16,8 @@ output_date_day_file = "DateDay.csv"  # 输出日期文件
 output_date_time_file = "DateTime.csv"  # 输出时间文件
 output_date_delta_file = "DateDelta.csv"  # 输出相对时间文件
 
+metrics = Metrics("E_Conversion_04_DatenTime")  # 阶段运行指标
+
 def process_date_file(input_file, output_day_file, output_time_file, output_delta_file):
     """
     读取 CSV 文件，将时间转换为目标时区，并提取日期、时间和相对时间，保存到新的 CSV 文件中。
@@ -21,19 +27,32 @@ def process_date_file(input_file, output_day_file, output_time_file, output_delt
     :param output_time_file: 输出时间信息的 CSV 文件路径。
     :param output_delta_file: 输出相对时间信息的 CSV 文件路径。
     """
-    # 读取 CSV 文件
-    df = pd.read_csv(input_file, header=None)
-    timestamps = df[0].to_list()
-
     # 定义原始时区和目标时区
     original_tz = pytz.timezone('UTC')
     target_tz = pytz.timezone('Asia/Shanghai')
 
+    # 分块读取并转换，相对时间的基准时间在各块之间保持
+    base_time = None
+    with ChunkWriter(output_day_file) as day_writer, ChunkWriter(output_time_file) as time_writer, ChunkWriter(output_delta_file) as delta_writer:
+        for df in read_csv_chunks(input_file):
+            dates, times, relative_times, base_time = convert_timestamps(df[0].to_list(), original_tz, target_tz, base_time)
+
+            # 追加保存到新的 CSV 文件
+            day_writer.write(pd.DataFrame(dates))
+            time_writer.write(pd.DataFrame(times))
+            delta_writer.write(pd.DataFrame(relative_times))
+    print(f"处理后的数据已保存到 '{output_day_file}', '{output_time_file}', '{output_delta_file}'")
+
+def convert_timestamps(timestamps, original_tz, target_tz, base_time=None):
+    """
+    转换一块时间戳，返回 (日期列表, 时间列表, 相对时间列表, 基准时间)。
+
+    :param base_time: 上一块得到的基准时间，第一块为 None（以第一个时间戳为基准）。
+    """
     # 转换时间并提取日期和时间
     dates = []
     times = []
     relative_times = []
-    base_time = None
 
     for timestamp in timestamps:
         # 解析时间
@@ -65,11 +84,27 @@ def process_date_file(input_file, output_day_file, output_time_file, output_delt
         relative_time_str = f'{hours:02}:{minutes:02}:{seconds:02}'
         relative_times.append(relative_time_str)
 
-    # 保存到新的 CSV 文件
-    pd.DataFrame(dates).to_csv(output_day_file, header=False, index=False)
-    pd.DataFrame(times).to_csv(output_time_file, header=False, index=False)
-    pd.DataFrame(relative_times).to_csv(output_delta_file, header=False, index=False)
-    print(f"处理后的数据已保存到 '{output_day_file}', '{output_time_file}', '{output_delta_file}'")
+    return dates, times, relative_times, base_time
+
+def output_dependencies():
+    """输出文件 -> 所需的输入文件（Z_Common_13_Fields 据此推算需要解码的 FIT 字段）"""
+    return {f: [input_date_file] for f in (output_date_day_file, output_date_time_file, output_date_delta_file)}
+
+def process_activity(input_folder_path, output_folder_path):
+    """转换一个活动文件夹中的数据，缺少输入文件时跳过"""
+    # 确保输出文件夹存在
+    if not os.path.exists(output_folder_path):
+        os.makedirs(output_folder_path)
+    if not has_inputs(input_folder_path, [input_date_file]):
+        return
+
+    # 处理日期文件
+    process_date_file(
+        os.path.join(input_folder_path, input_date_file),
+        os.path.join(output_folder_path, output_date_day_file),
+        os.path.join(output_folder_path, output_date_time_file),
+        os.path.join(output_folder_path, output_date_delta_file)
+    )
 
 def main():
     # 确保输出文件夹存在
@@ -77,24 +112,15 @@ def main():
         os.makedirs(output_base_path)
 
     # 获取所有分割后的文件夹
-    activity_folders = [f for f in os.listdir(input_base_path) if os.path.isdir(os.path.join(input_base_path, f))]
+    activity_folders = stage_inputs("D", input_base_path, lambda row: f"{filename_format}{row['seq']}", lambda f: os.path.isdir(os.path.join(input_base_path, f)))
 
     # 依次处理每个文件夹
-    for i, folder in enumerate(activity_folders, start=1):
+    for i, folder in activity_folders:
         input_folder_path = os.path.join(input_base_path, folder)
         output_folder_path = os.path.join(output_base_path, f"{filename_format}{i}")
-        
-        # 确保输出文件夹存在
-        if not os.path.exists(output_folder_path):
-            os.makedirs(output_folder_path)
-        
-        # 处理日期文件
-        process_date_file(
-            os.path.join(input_folder_path, input_date_file),
-            os.path.join(output_folder_path, output_date_day_file),
-            os.path.join(output_folder_path, output_date_time_file),
-            os.path.join(output_folder_path, output_date_delta_file)
-        )
+        with metrics.activity(folder), track_stage(i, "E4", output_folder_path):
+            process_activity(input_folder_path, output_folder_path)
 
 if __name__ == "__main__":
-    main()
+    with metrics.run():
+        main()
@@ -0,0 +1,91 @@
+import os
+
+import pandas as pd
+
+from Z_Common_05_Metrics import Metrics
+from Z_Common_09_Catalog import stage_inputs, track_stage
+from Z_Common_10_Stream import ChunkWriter, read_csv_chunks
+from Z_Common_12_Channels import get_channel, load_plugins
+
+# 配置区域
+input_base_path = "./DataProcess/D_DividedData"  # 输入文件夹路径
+output_base_path = "./DataProcess/E_ConversedData"  # 输出文件夹路径
+filename_format = "Activity"  # 输出文件夹名称格式
+
+# 要转换的通道（见 Z_Common_12_Channels.py 中登记的通道）
+channels = [
+    "altitude",
+    "heart_rate",
+    "distance",
+    "vertical_oscillation",
+    "stance_time",
+    "vertical_ratio",
+    "step_length",
+]
+
+# 插件模块：导入时调用 register_channel 登记自定义通道，如 "my_channels"
+plugins = []
+
+metrics = Metrics("E_Conversion_05_Channels")  # 阶段运行指标
+
+def convert_channel(channel, input_file, output_folder_path):
+    """
+    分块读取通道的源文件，输出转换后的数值与格式化后的文本。
+
+    空行（缺失值）保留为 NaN，输出与源文件逐行对齐。
+
+    :param channel: Z_Common_12_Channels.Channel。
+    :param input_file: 源 CSV 文件的路径。
+    :param output_folder_path: 输出文件夹路径。
+    """
+    value_file = os.path.join(output_folder_path, channel.value_file)
+    text_file = os.path.join(output_folder_path, channel.text_file)
+    with ChunkWriter(value_file) as value_writer, ChunkWriter(text_file) as text_writer:
+        for df in read_csv_chunks(input_file, skip_blank_lines=False):
+            values = channel.convert(pd.to_numeric(df[0], errors="coerce").to_numpy(dtype=float))
+            value_writer.write(pd.DataFrame({0: values}))
+            text_writer.write(pd.DataFrame({0: channel.format(values)}))
+    print(f"通道 {channel.name} 已保存到 '{value_file}' 与 '{text_file}'")
+
+def output_dependencies():
+    """输出文件 -> 所需的输入文件（Z_Common_13_Fields 据此推算需要解码的 FIT 字段）"""
+    load_plugins(plugins)
+    dependencies = {}
+    for name in channels:
+        channel = get_channel(name)
+        dependencies[channel.value_file] = dependencies[channel.text_file] = [channel.source]
+    return dependencies
+
+def process_activity(input_folder_path, output_folder_path):
+    """转换一个活动文件夹中的所有通道，缺少源文件的通道跳过"""
+    # 确保输出文件夹存在
+    if not os.path.exists(output_folder_path):
+        os.makedirs(output_folder_path)
+
+    load_plugins(plugins)
+    for name in channels:
+        channel = get_channel(name)
+        input_file = os.path.join(input_folder_path, channel.source)
+        if not os.path.exists(input_file):
+            print(f"活动缺少 {channel.source}，跳过通道 {name}")
+            continue
+        convert_channel(channel, input_file, output_folder_path)
+
+def main():
+    # 确保输出文件夹存在
+    if not os.path.exists(output_base_path):
+        os.makedirs(output_base_path)
+
+    # 获取所有分割后的文件夹
+    activity_folders = stage_inputs("D", input_base_path, lambda row: f"{filename_format}{row['seq']}", lambda f: os.path.isdir(os.path.join(input_base_path, f)))
+
+    # 依次处理每个文件夹
+    for i, folder in activity_folders:
+        input_folder_path = os.path.join(input_base_path, folder)
+        output_folder_path = os.path.join(output_base_path, f"{filename_format}{i}")
+        with metrics.activity(folder), track_stage(i, "E5", output_folder_path):
+            process_activity(input_folder_path, output_folder_path)
+
+if __name__ == "__main__":
+    with metrics.run():
+        main()
@@ -1,8 +1,19 @@
-import csv
+import bisect
+import copy
 import os
+import sys
 import math
-from PIL import Image, ImageDraw, ImageFont
-import concurrent.futures
+import numpy as np
+from PIL import Image, ImageDraw
+from Z_Common_02_FrameRunner import render_with_manifest, report_failures, save_frame
+from Z_Common_03_FrameStore import FrameStore, load_frame_timestamps
+from Z_Common_05_Metrics import FrameTimer, Metrics
+from Z_Common_07_Text import draw_text_with_stroke, load_font
+from Z_Common_08_Scheduler import Job, Scheduler
+from Z_Common_09_Catalog import stage_inputs, track_stage
+from Z_Common_10_Stream import column_summary, read_column_windows, read_csv_chunks
+from Z_Common_11_Compositor import Sprite, frame_buffer, text_sprite
+from Z_Common_14_Shards import write_frame_index
 
 # ================== 配置参数 ==================
 CONFIG = {
@@ -14,6 +25,17 @@ CONFIG = {
     "frame_prefix": "frame_",  # 帧序列自动编号前的名称
     "use_multithreading": True,  # 是否使用多线程
     "use_multiprocessing": True,  # 是否使用多核心
+    "resume": True,  # 是否断点续渲染（只补渲染缺失或失败的帧）
+    "frame_shard_size": 1000,  # 每个子目录存放的帧数（0表示不分子目录）
+    "progress_interval": 2.0,  # 进度输出间隔(秒)
+    "progress_format": "text",  # 进度输出格式："text"、"json"（每行一个JSON事件）或 "off"
+    "frame_window": 500,  # 每个渲染任务的最大帧数，工作进程只接收该窗口的数据
+    "encode_workers": 1,  # 每个渲染任务的 PNG 编码线程数（CPU 有空闲核心时可增加），0 表示在渲染线程中同步编码与写入
+    "encode_queue_depth": 4,  # 等待编码的帧数上限（编码跟不上时渲染阻塞）
+    "write_queue_depth": 8,  # 等待写入的帧数上限（磁盘跟不上时编码阻塞）
+    "shard": None,  # 分片渲染："k/n"（全部帧等分为 n 份中的第 k 份）或 "start-end"（帧号闭区间），None 表示全部帧；环境变量 GARMIN_SHARD 优先
+    "input_file": "DistanceConversed.csv",  # 距离数据文件
+    "split_time_file": "DateDelta.csv",  # 相对时间数据文件（计算分段用时）
 
     # 竖线参数
     "total_length": 800,  # 竖线分布总长度(像素)
@@ -47,34 +69,119 @@ CONFIG = {
     "dynamic_font_size": 40,  # 动态字体大小
     "dynamic_color": (0, 0, 0, 255),  # 动态文本颜色
 
+    # 分段标记参数（每经过一个分段距离在进度条上画一条标记线，并在该段进度条内显示分段用时）
+    "split_markers": True,  # 是否绘制分段标记
+    "split_interval": 1.0,  # 分段距离(千米)
+    "split_marker_width": 3,  # 标记线宽度
+    "split_marker_color": (255, 255, 255, 255),  # 标记线颜色RGBA
+    "split_font": "SourceHanSans-Heavy.ttc",  # 分段用时字体
+    "split_font_size": 24,  # 分段用时字体大小
+    "split_text_color": (0, 0, 0, 255),  # 分段用时文本颜色（描边使用首尾文本的描边参数）
+    "split_label_gap": 4,  # 分段用时文本与两侧标记线的最小间距，该段放不下时只画标记线
+
     # 整体位置参数
     "vertical_offset": -400  # 整体元素的垂直偏移量（负值上移）
 }
 
+# ================== 分段用时 ==================
+def _parse_delta(text):
+    """把相对时间 "HH:MM:SS" 解析为秒"""
+    hours, minutes, seconds = (int(part) for part in text.split(":"))
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def _format_split(seconds):
+    """分段用时文本：不足一小时为 M:SS，否则为 H:MM:SS"""
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}" if hours else f"{minutes}:{seconds:02}"
+
+
 # ================== 核心功能类 ==================
 class ProgressGenerator:
     def __init__(self, config, activity_index):
         self.config = config
-        self.distances = []
+        self.distances = []  # 当前窗口的距离数据，从 window_start 帧开始
+        self.window_start = 0
+        self.static_layers = None  # 每帧相同的竖线、首尾文本与分段标记图块，在工作进程中首次使用时绘制
+        self.first_distance = 0.0
+        self.final_distance = 0.0
         self.line_positions = []
+        self.splits = []  # 已完成的分段 [(分段终点距离, 到达该距离的帧号, 分段用时秒数)]
+        self.split_frames = []  # 各分段终点的帧号（升序），逐帧按二分查找确定已完成的分段数
+        self.split_reveal_x = []  # 完成前 k 个分段时分段标记层显示到的X坐标（不含）
         self.total_frames = 0
-        self.input_csv = os.path.join(config["input_base_path"], f"{config['filename_format']}{activity_index}/DistanceConversed.csv")
+        self.input_folder_path = os.path.join(config["input_base_path"], f"{config['filename_format']}{activity_index}")
+        self.input_csv = os.path.join(self.input_folder_path, config["input_file"])
+        self.split_time_csv = os.path.join(self.input_folder_path, config["split_time_file"])
         self.output_dir = os.path.join(config["output_base_path"], f"{config['filename_format']}{activity_index}/ProgressBar")
         
         # 初始化数据
         self._load_data()
         self._calculate_line_positions()
+        self._find_splits()
         
         # 创建输出目录
-        os.makedirs(self.output_dir, exist_ok=True)
+        self.store = FrameStore(self.output_dir, config["frame_prefix"], self.total_frames, config["frame_shard_size"])
+        self.store.make_dirs()
     
     def _load_data(self):
-        """加载CSV距离数据"""
-        with open(self.input_csv, "r") as f:
-            reader = csv.reader(f)
-            self.distances = [float(row[0]) for row in reader]  # 直接使用读取的数据
-            self.total_frames = len(self.distances)
+        """流式统计CSV距离数据的行数与首尾距离（逐帧距离在渲染时按窗口读取）"""
+        self.total_frames, first, last = column_summary(self.input_csv)
+        if self.total_frames:
+            self.first_distance = float(first)  # 直接使用读取的数据
+            self.final_distance = float(last)
+
+    def _window(self, start, columns):
+        """只携带一个窗口数据的副本，派发到工作进程时不必序列化整个活动"""
+        window = copy.copy(self)
+        window.window_start = start
+        window.distances = [float(value) for value in columns[0]]
+        return window
+
+    def frame_windows(self, frame_nums, size):
+        """按窗口依次读取距离数据，生成 (窗口帧号列表, 窗口任务)"""
+        for start, frames, columns in read_column_windows([self.input_csv], frame_nums, size):
+            yield frames, self._window(start, columns).generate_frame
     
+    def _find_splits(self):
+        """
+        按块读取累计距离，每块用一次向量化的 searchsorted 找出其中各分段终点首次到达的帧号，再读取这些帧的相对时间得到分段用时。
+
+        只保留分段终点的帧号与用时，内存与活动长度无关；距离偶有回落时按累计最大值处理。
+        """
+        interval = self.config["split_interval"]
+        if not self.config["split_markers"] or not self.total_frames or self.final_distance < interval:
+            return
+        bounds = np.arange(1, int(self.final_distance / interval + 1e-9) + 1) * interval
+        frames = np.full(len(bounds), -1, dtype=np.int64)
+        offset, running = 0, -np.inf
+        for chunk in read_csv_chunks(self.input_csv):
+            distances = np.array(chunk[0], dtype=np.float64)
+            distances[0] = max(distances[0], running)
+            distances = np.maximum.accumulate(distances)
+            running = distances[-1]
+            idx = np.searchsorted(distances, bounds - 1e-9)  # 首个不小于分段终点的位置
+            found = (idx < len(distances)) & (frames < 0)
+            frames[found] = idx[found] + offset
+            offset += len(distances)
+        bounds, frames = bounds[frames >= 0], frames[frames >= 0]
+        if not len(frames):
+            return
+
+        # 读取起点与各分段终点帧的相对时间
+        wanted = np.concatenate(([0], frames))
+        elapsed = np.zeros(len(wanted))
+        offset = 0
+        for chunk in read_csv_chunks(self.split_time_csv, dtype=str):
+            values = chunk[0].to_numpy()
+            hit = (wanted >= offset) & (wanted < offset + len(values))
+            elapsed[hit] = [_parse_delta(text) for text in values[wanted[hit] - offset]]
+            offset += len(values)
+        split_seconds = np.diff(elapsed)
+        self.splits = [(float(d), int(k), float(t)) for d, k, t in zip(bounds, frames, split_seconds)]
+        self.split_frames = [k for _, k, _ in self.splits]
+
     def _calculate_line_positions(self):
         """计算竖线分布位置"""
         spacing = self.config["total_length"] / 100  # 101个点形成100个间隔
@@ -101,11 +208,49 @@ class ProgressGenerator:
                 width=self.config["line_width"]
             )
     
-    def _draw_progress(self, draw, current_distance):
-        """绘制进度条"""
+    def _draw_splits(self):
+        """把全部分段标记线与分段用时绘制到一个图层上（每个分段的文本只绘制一次），记录完成各分段时该层的显示范围"""
+        layer = Image.new("RGBA", self.config["frame_size"], (0, 0, 0, 0))
+        draw = ImageDraw.Draw(layer)
+        font = load_font(self.config["split_font"], self.config["split_font_size"])
+        width = self.config["split_marker_width"]
+        center_y = self.config["frame_size"][1] // 2 + self.config["vertical_offset"]
+        y0 = center_y - self.config["progress_height"] // 2
+        y1 = y0 + self.config["progress_height"]
+
+        self.split_reveal_x = []
+        previous_x = self.line_positions[0]
+        for distance, _, seconds in self.splits:
+            x = self.line_positions[0] + distance / self.final_distance * self.config["total_length"]
+            draw.line([(x, y0), (x, y1)], fill=self.config["split_marker_color"], width=width)
+
+            # 分段用时显示在该段进度条的中间，放不下时省略
+            text = _format_split(seconds)
+            bbox = font.getbbox(text)
+            text_width, text_height = bbox[2] - bbox[0], bbox[3] - bbox[1]
+            if text_width + 2 * self.config["split_label_gap"] + width <= x - previous_x:
+                position = ((previous_x + x) / 2 - text_width / 2 - bbox[0], center_y - text_height / 2 - bbox[1])
+                draw_text_with_stroke(draw, position, text, font, self.config["split_text_color"], self.config["text_stroke_color"], self.config["text_stroke_width"])
+            self.split_reveal_x.append(math.ceil(x + width / 2))
+            previous_x = x
+        return Sprite(layer) if self.splits else None
+
+    def _get_static_layers(self):
+        """绘制每帧相同的竖线层、首尾文本层与分段标记层（只绘制一次），返回 (竖线图块, 文本图块, 分段图块或 None)"""
+        if self.static_layers is None:
+            lines = Image.new("RGBA", self.config["frame_size"], (0, 0, 0, 0))
+            self._draw_vertical_lines(ImageDraw.Draw(lines))
+            labels = Image.new("RGBA", self.config["frame_size"], (0, 0, 0, 0))
+            draw = ImageDraw.Draw(labels)
+            self._draw_start_end_text(draw, True, FrameTimer())
+            self._draw_start_end_text(draw, False, FrameTimer())
+            self.static_layers = (Sprite(lines), Sprite(labels), self._draw_splits())
+        return self.static_layers
+
+    def _draw_progress(self, current_distance):
+        """绘制进度条图块，返回 (图块, 图块左上角坐标, 进度条右端X坐标)"""
         vertical_offset = self.config["vertical_offset"]
-        final_distance = self.distances[-1]
-        progress_ratio = current_distance / final_distance
+        progress_ratio = current_distance / self.final_distance
         progress_width = progress_ratio * self.config["total_length"]
         
         # 定义进度条形状
@@ -114,40 +259,30 @@ class ProgressGenerator:
         x1 = x0 + progress_width
         y1 = y0 + self.config["progress_height"]
         
-        # 绘制圆角矩形进度条
-        draw.rounded_rectangle(
-            [x0, y0, x1, y1],
+        # 在只容纳进度条的小图上绘制圆角矩形，坐标整体平移 (left, top)
+        left, top = math.floor(x0), math.floor(y0)
+        img = Image.new("RGBA", (math.ceil(x1) - left + 2, math.ceil(y1) - top + 2), (0, 0, 0, 0))
+        ImageDraw.Draw(img).rounded_rectangle(
+            [x0 - left, y0 - top, x1 - left, y1 - top],
             radius=self.config["progress_radius"],
             fill=self.config["progress_color"]
         )
-        return x1  # 返回当前进度条右端X坐标
+        return Sprite(img), (left, top), x1  # 返回当前进度条右端X坐标
     
-    def _draw_text_annotations(self, draw, progress_end_x, frame_idx):
-        """绘制所有文本标注"""
-        # 绘制起始文本和结束文本（每一帧）
-        self._draw_start_end_text(draw, is_start=True)
-        self._draw_start_end_text(draw, is_start=False)
-        
-        # 绘制动态文本
-        self._draw_dynamic_text(draw, progress_end_x, frame_idx)
-    
-    def _draw_start_end_text(self, draw, is_start):
+    def _draw_start_end_text(self, draw, is_start, timer):
         """绘制首尾固定文本"""
         vertical_offset = self.config["vertical_offset"]
         # 获取文本内容
         if is_start:
-            text = f"{self.config['prefix_start']}{self.distances[0]}{self.config['suffix_start']}"
+            text = f"{self.config['prefix_start']}{self.first_distance}{self.config['suffix_start']}"
             x = self.line_positions[0]
         else:
-            text = f"{self.config['prefix_end']}{self.distances[-1]}{self.config['suffix_end']}"
+            text = f"{self.config['prefix_end']}{self.final_distance}{self.config['suffix_end']}"
             x = self.line_positions[-1]
 
         font_path = self.config["start_font"] if is_start else self.config["end_font"]
-        font = ImageFont.truetype(font_path, self.config["font_size"])
-
-        # 检查字体文件是否存在
-        if not os.path.isfile(font_path):
-            raise FileNotFoundError(f"字体文件 {font_path} 不存在。")
+        font = load_font(font_path, self.config["font_size"])
+        timer.lap("font_load")
         
         # 计算文本位置
         bbox = font.getbbox(text)
@@ -156,18 +291,16 @@ class ProgressGenerator:
         y = (self.config["frame_size"][1] // 2) - self.config["long_height"] // 2 - self.config["text_offset"] - text_height + vertical_offset
         
         # 绘制带描边的文本
-        self._draw_text_with_stroke(draw, (x - text_width // 2, y), text, font, self.config["text_color"], self.config["text_stroke_color"], self.config["text_stroke_width"])
+        draw_text_with_stroke(draw, (x - text_width // 2, y), text, font, self.config["text_color"], self.config["text_stroke_color"], self.config["text_stroke_width"])
+        timer.lap("draw")
 
-    def _draw_dynamic_text(self, draw, progress_x, frame_idx):
-        """绘制动态跟随文本"""
+    def _draw_dynamic_text(self, buffer, progress_x, frame_idx, timer):
+        """绘制动态跟随文本并合成到帧缓冲区"""
         vertical_offset = self.config["vertical_offset"]
-        text = f"{self.distances[frame_idx]}千米"  # 显示当前距离
+        text = f"{self.distances[frame_idx - self.window_start]}千米"  # 显示当前距离
         font_path = self.config["dynamic_font"]
-        font = ImageFont.truetype(font_path, self.config["dynamic_font_size"])
-
-        # 检查字体文件是否存在
-        if not os.path.isfile(font_path):
-            raise FileNotFoundError(f"字体文件 {font_path} 不存在。")
+        font = load_font(font_path, self.config["dynamic_font_size"])
+        timer.lap("font_load")
         
         # 计算文本位置
         bbox = font.getbbox(text)
@@ -176,62 +309,65 @@ class ProgressGenerator:
         x = progress_x - text_width // 2
         y = (self.config["frame_size"][1] // 2) + self.config["progress_height"] // 2 + self.config["dynamic_offset"] + vertical_offset
         
-        # 绘制带描边的动态文本
-        self._draw_text_with_stroke(draw, (x, y), text, font, self.config["dynamic_color"], self.config["text_stroke_color"], self.config["text_stroke_width"])
-    
-    def _draw_text_with_stroke(self, draw, position, text, font, fill, stroke_fill, stroke_width):
-        """绘制带描边的文本"""
-        x, y = position
-        # 绘制描边
-        for angle in range(0, 360, 45):
-            offset_x = stroke_width * math.cos(math.radians(angle))
-            offset_y = stroke_width * math.sin(math.radians(angle))
-            draw.text((x + offset_x, y + offset_y), text, font=font, fill=stroke_fill)
-        
-        # 绘制文本
-        draw.text(position, text, font=font, fill=fill)
+        # 绘制带描边的动态文本：图块按整数像素平移，小数部分在图块内绘制，与直接绘制在画布上的结果相同
+        ix, iy = math.floor(x), math.floor(y)
+        fx, fy = x - ix, y - iy
+        sprite, (dx, dy) = text_sprite(text, font, math.ceil(self.config["text_stroke_width"]) + 1, lambda draw, position: draw_text_with_stroke(
+            draw, (position[0] + fx, position[1] + fy), text, font, self.config["dynamic_color"], self.config["text_stroke_color"], self.config["text_stroke_width"]))
+        timer.lap("draw")
+        buffer.composite(sprite, (ix + dx, iy + dy))
+        timer.lap("composite")
     
     def generate_frame(self, frame_idx):
         """生成单个帧"""
-        # 创建透明画布
-        img = Image.new("RGBA", self.config["frame_size"], self.config["background_color"])
-        draw = ImageDraw.Draw(img)
+        # 复用本进程的帧缓冲区，只清除上一帧合成过的区域
+        timer = FrameTimer()
+        buffer = frame_buffer(self.config["frame_size"], self.config["background_color"], timer)
+        lines, labels, splits = self._get_static_layers()
+        timer.lap("composite")
         
-        # 绘制元素
-        self._draw_vertical_lines(draw)
-        current_distance = self.distances[frame_idx]
-        progress_end_x = self._draw_progress(draw, current_distance)
-        self._draw_text_annotations(draw, progress_end_x, frame_idx)
+        # 按原来的绘制顺序合成：竖线、进度条、分段标记、首尾文本、动态文本
+        current_distance = self.distances[frame_idx - self.window_start]
+        progress, progress_position, progress_end_x = self._draw_progress(current_distance)
+        timer.lap("draw")
+        buffer.composite(lines, (0, 0))
+        buffer.composite(progress, progress_position)
+        # 分段标记层只显示到最后一个已完成分段的标记线，每帧的开销与已完成的分段数无关
+        passed = bisect.bisect_right(self.split_frames, frame_idx)
+        if passed:
+            buffer.composite(splits, (0, 0), clip=(0, 0, self.split_reveal_x[passed - 1], self.config["frame_size"][1]))
+        buffer.composite(labels, (0, 0))
+        timer.lap("composite")
+        self._draw_dynamic_text(buffer, progress_end_x, frame_idx, timer)
         
         # 保存帧
-        img.save(os.path.join(self.output_dir, f"{self.config['frame_prefix']}{frame_idx:04d}.png"))
-        if (frame_idx + 1) % 100 == 0 or frame_idx == self.total_frames - 1:
-            print(f"生成进度：{frame_idx + 1}/{self.total_frames}")
-
-    def generate_frames(self):
-        """生成所有帧序列"""
-        if self.config["use_multithreading"]:
-            executor_class = concurrent.futures.ProcessPoolExecutor if self.config["use_multiprocessing"] else concurrent.futures.ThreadPoolExecutor
-            with executor_class() as executor:
-                futures = [executor.submit(self.generate_frame, frame_idx) for frame_idx in range(self.total_frames)]
-                for future in concurrent.futures.as_completed(futures):
-                    try:
-                        future.result()
-                    except Exception as e:
-                        print(f"生成帧时出错: {e}")
-        else:
-            for frame_idx in range(self.total_frames):
-                self.generate_frame(frame_idx)
+        save_frame(buffer.image(), self.store.path(frame_idx), timer)
+        return timer.as_dict()
+
+    def generate_frames(self, metrics=None, scheduler=None):
+        """生成所有帧序列（跳过已完成的帧），返回失败帧字典"""
+        failures = render_with_manifest(self.generate_frame, self.total_frames, self.output_dir, self.config, metrics, scheduler=scheduler, windows=self.frame_windows,
+                                        frame_path=self.store.path)
+        write_frame_index(self.store, load_frame_timestamps(self.input_folder_path), self.config, failures)
+        return failures
 
 # ================== 执行程序 ==================
 if __name__ == "__main__":
     # 获取所有分割后的文件夹
     def process_folder(i, folder):
-        generator = ProgressGenerator(CONFIG, i)
-        generator.generate_frames()
+        with metrics.activity(folder), track_stage(i, "F2") as record:
+            generator = ProgressGenerator(CONFIG, i)
+            failures[generator.output_dir] = generator.generate_frames(metrics, scheduler)
+            if failures[generator.output_dir]:
+                record["error"] = f"{len(failures[generator.output_dir])} 帧渲染失败"
         print(f"帧序列已生成至: {generator.output_dir}")
 
-    activity_folders = [f for f in os.listdir(CONFIG["input_base_path"]) if os.path.isdir(os.path.join(CONFIG["input_base_path"], f))]
+    activity_folders = stage_inputs("E2", CONFIG["input_base_path"], lambda row: f"{CONFIG['filename_format']}{row['seq']}", lambda f: os.path.isdir(os.path.join(CONFIG["input_base_path"], f)))
+
+    failures = {}
+    metrics = Metrics("F_Frames_02_ProgressBar")
+    with metrics.run(), Scheduler() as scheduler:
+        # 所有活动共享常驻工作进程并发渲染，帧数少的活动优先
+        scheduler.run_jobs([Job(folder, process_folder, i, folder, inline=True) for i, folder in activity_folders])
 
-    for i, folder in enumerate(activity_folders, start=1):
-        process_folder(i, folder)
+    sys.exit(report_failures(failures))
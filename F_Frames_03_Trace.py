@@ -1,12 +1,20 @@
 import pandas as pd
 import matplotlib.pyplot as plt
-import numpy as np
 import os
+import sys
+import threading
 import imageio.v2 as imageio
 from PIL import Image, ImageDraw
 from math import cos, sin, radians
 import matplotlib.colors as mcolors
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from Z_Common_01_Geometry import TrackGeometry, simplify_track
+from Z_Common_02_FrameRunner import render_with_manifest, report_failures, save_frame
+from Z_Common_03_FrameStore import FrameStore, load_frame_timestamps
+from Z_Common_05_Metrics import FrameTimer, Metrics
+from Z_Common_08_Scheduler import Job, Scheduler
+from Z_Common_09_Catalog import stage_inputs, track_stage
+from Z_Common_11_Compositor import Sprite, frame_buffer
+from Z_Common_14_Shards import write_frame_index
 
 # ================== 配置参数 ==================
 CONFIG = {
@@ -18,17 +26,28 @@ CONFIG = {
     "frame_prefix": "frame_",  # 帧序列自动编号前的名称
     "use_multithreading": True,  # 是否使用多线程
     "use_multiprocessing": True,  # 是否使用多核心
+    "resume": True,  # 是否断点续渲染（只补渲染缺失或失败的帧）
+    "frame_shard_size": 1000,  # 每个子目录存放的帧数（0表示不分子目录）
+    "progress_interval": 2.0,  # 进度输出间隔(秒)
+    "progress_format": "text",  # 进度输出格式："text"、"json"（每行一个JSON事件）或 "off"
+    "frame_window": 500,  # 每个渲染任务的最大帧数，工作进程只接收该窗口的数据
+    "encode_workers": 1,  # 每个渲染任务的 PNG 编码线程数（CPU 有空闲核心时可增加），0 表示在渲染线程中同步编码与写入
+    "encode_queue_depth": 4,  # 等待编码的帧数上限（编码跟不上时渲染阻塞）
+    "write_queue_depth": 8,  # 等待写入的帧数上限（磁盘跟不上时编码阻塞）
+    "shard": None,  # 分片渲染："k/n"（全部帧等分为 n 份中的第 k 份）或 "start-end"（帧号闭区间），None 表示全部帧；环境变量 GARMIN_SHARD 优先
 
     # 输入文件配置
     'lon_file': 'LongitudeDegInter.csv',  # 经度数据文件
-    'lat_file': 'latitudeDegInter.csv',  # 纬度数据文件
+    'lat_file': 'LatitudeDegInter.csv',  # 纬度数据文件
 
     # 轨迹图配置
     'map_output_image': 'trajectory_map.png',  # 输出轨迹图路径
     'map_size': (500, 500),  # 图片尺寸（宽，高）
     'map_dpi': 10,  # 图片DPI
+    'projection': 'equirectangular',  # 投影方式：equirectangular（按纬度余弦缩放）或 mercator
     'line_width': 75,  # 轨迹线宽（磅）
     'line_color': '#7472d7',  # RGBA颜色（蓝）
+    'simplify_tolerance': 0.5,  # 轨迹简化容差（像素），0表示不简化
 
     # 视频配置
     'video_size': (1920, 1080),  # 视频尺寸（宽,高）
@@ -44,13 +63,16 @@ CONFIG = {
     'aircraft_radius': 20,  # 圆形半径（像素）
 }
 
+_PLOT_LOCK = threading.Lock()  # pyplot 的全局状态不是线程安全的，并发渲染多个活动时逐个绘制轨迹图
+
 # ================== 功能实现区 ==================
 class GeoVideoGenerator:
     def __init__(self, config, activity_index):
         self.config = config
         self.activity_index = activity_index
-        self.lon_file = os.path.join(config["input_base_path"], f"{config['filename_format']}{activity_index}/{config['lon_file']}")
-        self.lat_file = os.path.join(config["input_base_path"], f"{config['filename_format']}{activity_index}/{config['lat_file']}")
+        self.input_folder_path = os.path.join(config["input_base_path"], f"{config['filename_format']}{activity_index}")
+        self.lon_file = os.path.join(self.input_folder_path, config['lon_file'])
+        self.lat_file = os.path.join(self.input_folder_path, config['lat_file'])
         self.output_dir = os.path.join(config["output_base_path"], f"{config['filename_format']}{activity_index}/Trace")
         self.map_output_image = os.path.join(self.output_dir, config['map_output_image'])
         self.temp_dir = os.path.join(self.output_dir, config['temp_dir'])
@@ -58,10 +80,10 @@ class GeoVideoGenerator:
         # 加载数据
         self._load_data()
         self._calculate_coordinate_system()
-        self._precompute_positions()
 
         # 创建输出目录
         os.makedirs(self.output_dir, exist_ok=True)
+        self.store = FrameStore(self.temp_dir, config["frame_prefix"], self.data_points, config["frame_shard_size"])
 
     def _load_data(self):
         """加载经度纬度数据"""
@@ -74,60 +96,19 @@ class GeoVideoGenerator:
         self.data_points = len(self.lon)
 
     def _calculate_coordinate_system(self):
-        """计算保持原始比例的坐标系统"""
-        # 获取实际地理范围
-        self.lon_min, self.lon_max = np.min(self.lon), np.max(self.lon)
-        self.lat_min, self.lat_max = np.min(self.lat), np.max(self.lat)
-
-        # 增加边距
-        lon_margin = (self.lon_max - self.lon_min) * 0.1
-        lat_margin = (self.lat_max - self.lat_min) * 0.1
-        self.lon_min -= lon_margin
-        self.lon_max += lon_margin
-        self.lat_min -= lat_margin
-        self.lat_max += lat_margin
-
-        # 计算实际宽高比
-        geo_width = self.lon_max - self.lon_min
-        geo_height = self.lat_max - self.lat_min
-        self.aspect_ratio = geo_width / geo_height
-
-        # 计算绘图区域有效尺寸
-        map_width, map_height = self.config['map_size']
-        canvas_aspect = map_width / map_height
-
-        # 调整绘图范围保持原始比例
-        if self.aspect_ratio > canvas_aspect:
-            adj_height = geo_width / canvas_aspect
-            self.lat_center = (self.lat_max + self.lat_min) / 2
-            self.lat_min = self.lat_center - adj_height / 2
-            self.lat_max = self.lat_center + adj_height / 2
-        else:
-            adj_width = geo_height * canvas_aspect
-            self.lon_center = (self.lon_max + self.lon_min) / 2
-            self.lon_min = self.lon_center - adj_width / 2
-            self.lon_max = self.lon_center + adj_width / 2
-
-        # 计算缩放比例
-        self.lon_scale = map_width / (self.lon_max - self.lon_min)
-        self.lat_scale = map_height / (self.lat_max - self.lat_min)
-
-    def _precompute_positions(self):
-        """预计算所有点的坐标位置和方向"""
-        # 计算图片坐标
-        self.x = (self.lon - self.lon_min) * self.lon_scale
-        self.y = (self.lat_max - self.lat) * self.lat_scale
-
-        # 预计算方向
-        self.angles = np.zeros(self.data_points)
-        for i in range(self.data_points - 1):
-            dx = self.lon[i + 1] - self.lon[i]
-            dy = self.lat[i + 1] - self.lat[i]
-            self.angles[i] = np.degrees(np.arctan2(dy, dx))
-        self.angles[-1] = self.angles[-2]
+        """投影经纬度并计算保持原始比例的像素坐标、方向与累计距离"""
+        self.geometry = TrackGeometry(self.lon, self.lat, self.config['map_size'], self.config['projection'])
+        self.x = self.geometry.x
+        self.y = self.geometry.y
+        self.angles = self.geometry.angles
+        self.distance = self.geometry.distance
 
     def generate_trajectory_map(self):
         """生成透明轨迹图"""
+        with _PLOT_LOCK:
+            self._plot_trajectory_map()
+
+    def _plot_trajectory_map(self):
         fig = plt.figure(
             figsize=(
                 self.config['map_size'][0] / self.config['map_dpi'],
@@ -142,8 +123,11 @@ class GeoVideoGenerator:
         # 将颜色值从十六进制字符串转换为RGBA格式
         rgba_color = mcolors.hex2color(self.config['line_color'])
 
+        # 在像素坐标下简化轨迹，仅用于绘制轨迹图；逐帧标记位置仍使用完整数据
+        keep = simplify_track(self.x, self.y, self.config['simplify_tolerance'])
+
         # 绘制轨迹线
-        ax.plot(self.x, self.y,
+        ax.plot(self.x[keep], self.y[keep],
                 linewidth=self.config['line_width'],
                 color=rgba_color)
 
@@ -196,55 +180,65 @@ class GeoVideoGenerator:
 
         return img, img.width // 2, img.height // 2
 
-    def _generate_single_frame(self, i, map_img):
-        video_w, video_h = self.config['video_size']
+    def _generate_single_frame(self, i, map_sprite, aircraft):
+        timer = FrameTimer()
         map_x, map_y = self.config['map_position']
 
-        frame = Image.new('RGBA', (video_w, video_h), (0, 0, 0, 0))
-        frame.paste(map_img, (map_x, map_y), map_img)
+        # 复用本线程的帧缓冲区，只清除上一帧合成过的轨迹图与飞机区域
+        frame = frame_buffer(self.config['video_size'], timer=timer)
+        frame.composite(map_sprite, (map_x, map_y))
+        timer.lap("composite")
 
         # 计算飞机位置
         px = int(map_x + self.x[i])
         py = int(map_y + self.y[i])
 
-        # 生成飞机图形
-        aircraft_img, cx, cy = self._create_aircraft(self.angles[i])
-
         # 定位飞机
-        frame.paste(aircraft_img, (px - cx, py - cy), aircraft_img)
+        aircraft_sprite, cx, cy = aircraft
+        frame.composite(aircraft_sprite, (px - cx, py - cy))
+        timer.lap("composite")
+
+        save_frame(frame.image(), self.store.path(i), timer)
+        return timer.as_dict()
 
-        frame_path = os.path.join(self.temp_dir, f"{self.config['frame_prefix']}{i:04d}.png")
-        frame.save(frame_path)
-        return frame_path
+    def generate_video_frames(self, metrics=None, scheduler=None):
+        """并行生成视频帧，返回失败帧字典"""
+        map_sprite = Sprite(Image.open(self.map_output_image))
 
-    def generate_video_frames(self):
-        """并行生成视频帧"""
-        map_img = Image.open(self.map_output_image).convert('RGBA')
+        # 飞机图形与方向无关，所有帧共用同一个图块
+        aircraft_img, cx, cy = self._create_aircraft(0)
+        aircraft = (Sprite(aircraft_img), cx, cy)
 
-        os.makedirs(self.temp_dir, exist_ok=True)
+        self.store.make_dirs()
 
-        # 使用多线程并行生成帧
-        with ThreadPoolExecutor() as executor:
-            futures = [executor.submit(self._generate_single_frame, i, map_img) for i in range(self.data_points)]
-            for future in as_completed(futures):
-                try:
-                    future.result()  # 检查异常
-                except Exception as e:
-                    print(f"帧生成错误: {e}")
+        # 所有帧共享同一张轨迹图，使用多线程并行生成帧（跳过已完成的帧）
+        config = dict(self.config, use_multithreading=True, use_multiprocessing=False)
+        failures = render_with_manifest(lambda i: self._generate_single_frame(i, map_sprite, aircraft), self.data_points, self.temp_dir, config, metrics,
+                                        label=os.path.relpath(self.temp_dir, self.config["output_base_path"]), scheduler=scheduler, frame_path=self.store.path)
+        write_frame_index(self.store, load_frame_timestamps(self.input_folder_path), self.config, failures)
+        return failures
 
 
 # ================== 执行主程序 ==================
 if __name__ == '__main__':
     # 获取所有分割后的文件夹
     def process_folder(i, folder):
-        generator = GeoVideoGenerator(CONFIG, i)
-        print(f"正在生成轨迹图: {folder}...")
-        generator.generate_trajectory_map()
-        print(f"正在生成视频帧: {folder}...")
-        generator.generate_video_frames()
+        with metrics.activity(folder), track_stage(i, "F3") as record:
+            generator = GeoVideoGenerator(CONFIG, i)
+            print(f"正在生成轨迹图: {folder}...")
+            generator.generate_trajectory_map()
+            print(f"正在生成视频帧: {folder}...")
+            failures[generator.temp_dir] = generator.generate_video_frames(metrics, scheduler)
+            if failures[generator.temp_dir]:
+                record["error"] = f"{len(failures[generator.temp_dir])} 帧渲染失败"
         print(f"帧序列已生成至: {generator.output_dir}")
 
-    activity_folders = [f for f in os.listdir(CONFIG["input_base_path"]) if os.path.isdir(os.path.join(CONFIG["input_base_path"], f))]
+    activity_folders = stage_inputs("E3", CONFIG["input_base_path"], lambda row: f"{CONFIG['filename_format']}{row['seq']}", lambda f: os.path.isdir(os.path.join(CONFIG["input_base_path"], f)))
+
+    failures = {}
+    metrics = Metrics("F_Frames_03_Trace")
+    with metrics.run(), Scheduler() as scheduler:
+        # 所有活动共享常驻工作进程并发渲染，帧数少的活动优先
+        scheduler.run_jobs([Job(folder, process_folder, i, folder, inline=True) for i, folder in activity_folders])
 
-    for i, folder in enumerate(activity_folders, start=1):
-        process_folder(i, folder)
+    sys.exit(report_failures(failures))
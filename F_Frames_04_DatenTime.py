@@ -1,7 +1,17 @@
-import csv
+import copy
+import functools
 import os
-from PIL import Image, ImageDraw, ImageFont
-import concurrent.futures
+import sys
+from Z_Common_02_FrameRunner import render_with_manifest, report_failures, save_frame
+from Z_Common_03_FrameStore import FrameStore, load_frame_timestamps
+from Z_Common_05_Metrics import FrameTimer, Metrics
+from Z_Common_07_Text import draw_text_with_stroke, load_font
+from Z_Common_08_Scheduler import Job, Scheduler
+from Z_Common_09_Catalog import stage_inputs, track_stage
+from Z_Common_10_Stream import column_summary, read_column_windows
+from Z_Common_11_Compositor import frame_buffer, glyph_atlas, text_sprite
+from Z_Common_14_Shards import write_frame_index
+from Z_Common_16_Subtitles import export_subtitles, subtitle_path
 
 # ================== 配置参数 ==================
 CONFIG = {
@@ -13,6 +23,18 @@ CONFIG = {
     "frame_prefix": "frame_",  # 帧序列自动编号前的名称
     "use_multithreading": True,  # 是否使用多线程
     "use_multiprocessing": True,  # 是否使用多核心
+    "resume": True,  # 是否断点续渲染（只补渲染缺失或失败的帧）
+    "frame_shard_size": 1000,  # 每个子目录存放的帧数（0表示不分子目录）
+    "progress_interval": 2.0,  # 进度输出间隔(秒)
+    "progress_format": "text",  # 进度输出格式："text"、"json"（每行一个JSON事件）或 "off"
+    "frame_window": 500,  # 每个渲染任务的最大帧数，工作进程只接收该窗口的数据
+    "encode_workers": 1,  # 每个渲染任务的 PNG 编码线程数（CPU 有空闲核心时可增加），0 表示在渲染线程中同步编码与写入
+    "encode_queue_depth": 4,  # 等待编码的帧数上限（编码跟不上时渲染阻塞）
+    "write_queue_depth": 8,  # 等待写入的帧数上限（磁盘跟不上时编码阻塞）
+    "shard": None,  # 分片渲染："k/n"（全部帧等分为 n 份中的第 k 份）或 "start-end"（帧号闭区间），None 表示全部帧；环境变量 GARMIN_SHARD 优先
+    "output_mode": "frames",  # 输出形式："frames"（逐帧 PNG），或 "ass"、"srt"、"json"（字幕/数据轨道，由视频编辑器渲染文本，连续相同的值合并为一段，不生成帧序列）
+    "subtitle_fps": 1,  # 字幕轨道的帧率（每行数据为一帧）
+    "glyph_atlas": True,  # 只含数字、":"、"/" 等字符的文本由预先绘制的字形图集拼接（等宽数字），其余文本完整排版
 
     # CSV文件配置列表（可配置多个）
     "csv_configs": [
@@ -49,115 +71,137 @@ CONFIG = {
     ]
 }
 
+SPRITE_CACHE_SIZE = 64  # 每个进程缓存的文字图块数量，重复出现的数值不必重新绘制
+
 # ================== 核心功能 ==================
 class TextFrameGenerator:
     def __init__(self, config, activity_index):
         self.config = config
-        self.csv_data = []
+        self.csv_paths = []
+        self.csv_data = []  # 当前窗口的数据，从 window_start 行开始
+        self.window_start = 0
         self.max_rows = 0
         self.input_folder_path = os.path.join(config["input_base_path"], f"{config['filename_format']}{activity_index}")
         self.output_dir = os.path.join(config["output_base_path"], f"{config['filename_format']}{activity_index}/DatenTime")
         
-        # 验证并加载所有CSV数据
+        # 验证所有CSV数据（数据在渲染时按窗口读取）
         self._load_csv_files()
         
-        # 创建输出目录
-        os.makedirs(self.output_dir, exist_ok=True)
+        # 创建输出目录（导出字幕时只写出一个文件）
+        self.store = FrameStore(self.output_dir, config["frame_prefix"], self.max_rows, config["frame_shard_size"])
+        if config["output_mode"] == "frames":
+            self.output_path = self.output_dir
+            self.store.make_dirs()
+        else:
+            self.output_path = subtitle_path(self.output_dir, config["output_mode"])
     
     def _load_csv_files(self):
-        """加载并验证所有CSV文件"""
+        """验证所有CSV文件并流式统计行数"""
+        row_counts = []
         for cfg in self.config["csv_configs"]:
             try:
                 file_path = os.path.join(self.input_folder_path, cfg["file"])
-                with open(file_path, "r") as f:
-                    reader = csv.reader(f)
-                    data = [row[0] for row in reader]  # 假设每行只有一列数据
-                    self.csv_data.append(data)
-                    
-                    # 更新最大行数
-                    if len(data) > self.max_rows:
-                        self.max_rows = len(data)
+                rows, _, _ = column_summary(file_path)  # 假设每行只有一列数据
+                self.csv_paths.append(file_path)
+                row_counts.append(rows)
+
+                # 更新最大行数
+                if rows > self.max_rows:
+                    self.max_rows = rows
             except Exception as e:
                 print(f"读取 {cfg['file']} 时出错: {e}")
                 raise
         
         # 验证所有CSV行数一致
-        for i, data in enumerate(self.csv_data):
-            if len(data) != self.max_rows:
+        for i, rows in enumerate(row_counts):
+            if rows != self.max_rows:
                 raise ValueError(f"文件 {self.config['csv_configs'][i]['file']} 行数不一致")
 
-    def _draw_text_with_stroke(self, draw, position, text, font, fill, stroke_fill, stroke_width):
-        """在指定位置绘制带描边的文本"""
-        x, y = position
-        # 绘制描边
-        for offset in range(-stroke_width, stroke_width + 1):
-            if offset != 0:
-                draw.text((x + offset, y), text, font=font, fill=stroke_fill)
-                draw.text((x - offset, y), text, font=font, fill=stroke_fill)
-                draw.text((x, y + offset), text, font=font, fill=stroke_fill)
-                draw.text((x, y - offset), text, font=font, fill=stroke_fill)
-        # 绘制文本
-        draw.text(position, text, font=font, fill=fill)
-
-    def _create_frame(self, frame_num):
+    def _window(self, start, columns):
+        """只携带一个窗口数据的副本，派发到工作进程时不必序列化整个活动"""
+        window = copy.copy(self)
+        window.window_start = start
+        window.csv_data = columns
+        return window
+
+    def frame_windows(self, frame_nums, size):
+        """按窗口依次读取数据，生成 (窗口帧号列表, 窗口任务)"""
+        for start, frames, columns in read_column_windows(self.csv_paths, frame_nums, size):
+            yield frames, self._window(start, columns).generate_frame
+
+    def _create_frame(self, frame_num, timer):
         """创建单个帧"""
-        # 创建透明画布
-        img = Image.new("RGBA", self.config["frame_size"], self.config["background_color"])
-        draw = ImageDraw.Draw(img)
+        # 复用本进程的帧缓冲区，只清除上一帧写过文字的区域
+        buffer = frame_buffer(self.config["frame_size"], self.config["background_color"], timer)
+        timer.lap("composite")
         
         # 遍历所有CSV配置
         for cfg_idx, cfg in enumerate(self.config["csv_configs"]):
             data = self.csv_data[cfg_idx]
             x, y = cfg["position"]  # 重新设置初始位置
-            font = ImageFont.truetype(cfg["font"], cfg["font_size"])
             
             # 处理当前行数据
-            current_data = f"{data[frame_num]}"
-            
-            # 绘制带描边的文本
-            self._draw_text_with_stroke(draw, (x, y), current_data, font, 
-                                        fill=cfg["font_color"], 
-                                        stroke_fill=cfg["stroke_color"], 
-                                        stroke_width=cfg["stroke_width"])
+            current_data = f"{data[frame_num - self.window_start]}"
             
-            # 更新位置（如果有多行数据）
-            y += cfg["row_spacing"]
+            # 取得（或绘制）带描边的文字图块
+            sprite, (dx, dy) = _text_sprite(current_data, cfg["font"], cfg["font_size"],
+                                            cfg["font_color"], cfg["stroke_color"], cfg["stroke_width"], self.config["glyph_atlas"])
+            timer.lap("draw")
+            buffer.composite(sprite, (x + dx, y + dy))
+            timer.lap("composite")
         
-        return img
+        return buffer.image()
 
     def generate_frame(self, frame_num):
         """生成单个帧并保存"""
-        frame = self._create_frame(frame_num)
-        frame_path = os.path.join(self.output_dir, f"{self.config['frame_prefix']}{frame_num:04d}.png")
-        frame.save(frame_path)
-        if (frame_num + 1) % 100 == 0 or frame_num == self.max_rows - 1:
-            print(f"生成进度: {frame_num+1}/{self.max_rows}")
-        return frame_path
-
-    def generate_frames(self):
-        """生成所有帧"""
-        if self.config["use_multithreading"]:
-            executor_class = concurrent.futures.ProcessPoolExecutor if self.config["use_multiprocessing"] else concurrent.futures.ThreadPoolExecutor
-            with executor_class() as executor:
-                futures = [executor.submit(self.generate_frame, frame_num) for frame_num in range(self.max_rows)]
-                for future in concurrent.futures.as_completed(futures):
-                    try:
-                        future.result()
-                    except Exception as e:
-                        print(f"生成帧时出错: {e}")
-        else:
-            for frame_num in range(self.max_rows):
-                self.generate_frame(frame_num)
+        timer = FrameTimer()
+        frame = self._create_frame(frame_num, timer)
+        save_frame(frame, self.store.path(frame_num), timer)
+        return timer.as_dict()
+
+    def generate_frames(self, metrics=None, scheduler=None):
+        """生成所有帧（跳过已完成的帧），返回失败帧字典；导出字幕时不渲染帧"""
+        if self.config["output_mode"] != "frames":
+            events = export_subtitles(self.csv_paths, self.config["csv_configs"], self.output_path, self.config["output_mode"], self.config["frame_size"], self.config["subtitle_fps"])
+            print(f"已导出 {self.max_rows} 帧的 {events} 条字幕事件")
+            return {}
+        failures = render_with_manifest(self.generate_frame, self.max_rows, self.output_dir, self.config, metrics, scheduler=scheduler, windows=self.frame_windows,
+                                        frame_path=self.store.path)
+        write_frame_index(self.store, load_frame_timestamps(self.input_folder_path), self.config, failures)
+        return failures
+
+def _text_sprite(text, font_path, font_size, fill, stroke_fill, stroke_width, use_atlas=True):
+    """取得带描边的文字图块，返回 (图块, 相对绘制位置的偏移)：每帧都变化的数字文本由字形图集拼接，其余文本完整排版并缓存"""
+    if use_atlas:
+        result = glyph_atlas(font_path, font_size, fill, stroke_fill, stroke_width).text_sprite(text)
+        if result is not None:
+            return result
+    return _shaped_text_sprite(text, font_path, font_size, fill, stroke_fill, stroke_width)
+
+@functools.lru_cache(maxsize=SPRITE_CACHE_SIZE)
+def _shaped_text_sprite(text, font_path, font_size, fill, stroke_fill, stroke_width):
+    """绘制并缓存带描边的文字图块，返回 (图块, 相对绘制位置的偏移)"""
+    font = load_font(font_path, font_size)
+    return text_sprite(text, font, stroke_width, lambda draw, position: draw_text_with_stroke(
+        draw, position, text, font, fill, stroke_fill, stroke_width))
 
 # ================== 执行程序 ==================
 if __name__ == "__main__":
     # 获取所有分割后的文件夹
     def process_folder(i, folder):
-        generator = TextFrameGenerator(CONFIG, i)
-        generator.generate_frames()
-        print(f"帧序列已生成至: {generator.output_dir}")
+        with metrics.activity(folder), track_stage(i, "F4") as record:
+            generator = TextFrameGenerator(CONFIG, i)
+            failures[generator.output_dir] = generator.generate_frames(metrics, scheduler)
+            if failures[generator.output_dir]:
+                record["error"] = f"{len(failures[generator.output_dir])} 帧渲染失败"
+        print(f"输出已生成至: {generator.output_path}")
+
+    activity_folders = stage_inputs("E4", CONFIG["input_base_path"], lambda row: f"{CONFIG['filename_format']}{row['seq']}", lambda f: os.path.isdir(os.path.join(CONFIG["input_base_path"], f)))
 
-    activity_folders = [f for f in os.listdir(CONFIG["input_base_path"]) if os.path.isdir(os.path.join(CONFIG["input_base_path"], f))]
+    failures = {}
+    metrics = Metrics("F_Frames_04_DatenTime")
+    with metrics.run(), Scheduler() as scheduler:
+        # 所有活动共享常驻工作进程并发渲染，帧数少的活动优先
+        scheduler.run_jobs([Job(folder, process_folder, i, folder, inline=True) for i, folder in activity_folders])
 
-    for i, folder in enumerate(activity_folders, start=1):
-        process_folder(i, folder)
+    sys.exit(report_failures(failures))
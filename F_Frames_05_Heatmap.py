@@ -0,0 +1,297 @@
+import os
+import sys
+import time
+
+import matplotlib.colors as mcolors
+import matplotlib.pyplot as plt
+import numpy as np
+from PIL import Image, ImageFilter
+
+from Z_Common_01_Geometry import compute_viewport, project, to_pixels
+from Z_Common_02_FrameRunner import save_frame
+from Z_Common_03_FrameStore import FrameStore
+from Z_Common_05_Metrics import Metrics
+from Z_Common_09_Catalog import Catalog, catalog_exists, stage_inputs
+from Z_Common_10_Stream import read_csv_chunks
+
+# ================== 配置参数 ==================
+CONFIG = {
+    "input_base_path": "./DataProcess/E_ConversedData",  # 输入文件夹路径
+    "output_base_path": "./DataProcess/F_Frames",  # 输出文件夹路径
+    "filename_format": "Activity",  # 文件夹名称格式
+    "output_dir": "Heatmap",  # 输出子目录（所有活动共用一个）
+    "frame_prefix": "frame_",  # 帧序列自动编号前的名称
+    "frame_shard_size": 1000,  # 每个子目录存放的帧数（0表示不分子目录）
+
+    # 输入文件配置（未插值的经纬度，间隙由下方的 densify 在像素坐标下补齐）
+    "lon_file": "LongitudeDeg.csv",  # 经度数据文件
+    "lat_file": "LatitudeDeg.csv",  # 纬度数据文件
+
+    # 活动筛选（需要活动目录；没有活动目录时处理所有活动文件夹）
+    "since": None,  # 开始时间下限（含），如 "2024-01-01"
+    "until": None,  # 开始时间上限（不含），如 "2025-01-01"
+    "activity_type": None,  # 活动类型，如 "running"
+
+    # 视口配置
+    "frame_size": (1920, 1080),  # 输出尺寸(宽,高)
+    "projection": "equirectangular",  # 投影方式：equirectangular 或 mercator
+    "margin": 0.05,  # 边距占数据范围的比例
+    "bounds": None,  # 固定视口 (最小经度, 最小纬度, 最大经度, 最大纬度)，None 表示包含所有活动；范围外的点被丢弃
+
+    # 分箱配置
+    "count_mode": "activities",  # "activities"：每个活动在每个像素最多计 1 次；"samples"：按采样点计数
+    "densify": True,  # 是否在相邻采样点之间按像素补点，使轨迹连续
+    "max_gap_px": 50,  # 相邻采样点超过该像素距离时视为 GPS 跳变，不补点
+    "line_width": 3,  # 轨迹线宽（像素，奇数），仅 activities 模式
+
+    # 着色配置
+    "style": "heatmap",  # "heatmap"：按密度使用色图；"overlay"：单色半透明轨迹叠加
+    "colormap": "hot",  # heatmap 使用的 matplotlib 色图
+    "clip_percentile": 99.5,  # 以非零像素密度的该百分位数作为色图上限，避免少数热点压暗其他区域
+    "log_scale": True,  # 是否对密度取对数后再映射颜色
+    "min_alpha": 96,  # heatmap 中最低密度像素的不透明度(0-255)
+    "blur_radius": 0,  # 着色前的高斯模糊半径（像素），0 表示不模糊
+    "line_color": "#7472d7",  # overlay 的轨迹颜色
+    "overlay_alpha": 0.35,  # overlay 中每条轨迹的不透明度，重叠 n 次后为 1-(1-a)^n
+    "background_color": (0, 0, 0, 0),  # 背景RGBA
+
+    # 输出配置
+    "image_name": "heatmap.png",  # 包含全部活动的单帧图片
+    "animate": True,  # 是否按开始时间逐个叠加活动，输出逐帧累积动画
+    "frames_per_activity": 1,  # 动画中每个活动占用的帧数（叠加完成后重复）
+}
+
+
+# ================== 功能实现区 ==================
+def _coordinate_chunks(folder, config):
+    """按块读取一个活动的经纬度，生成 (经度数组, 纬度数组)；缺失的坐标（空行）保留为 NaN，两列逐行对齐"""
+    lon_path = os.path.join(folder, config["lon_file"])
+    lat_path = os.path.join(folder, config["lat_file"])
+    for lon_chunk, lat_chunk in zip(read_csv_chunks(lon_path, skip_blank_lines=False), read_csv_chunks(lat_path, skip_blank_lines=False)):
+        yield lon_chunk[0].to_numpy(dtype=float), lat_chunk[0].to_numpy(dtype=float)
+
+
+def densify(px, py, max_gap):
+    """
+    在相邻像素坐标之间按 1 像素间隔插入中间点（向量化），返回 (x, y)。
+
+    只补齐两端都有效且距离不超过 max_gap 的线段；原始点各保留一次，插入点不含线段端点。
+    """
+    dx, dy = np.diff(px), np.diff(py)
+    length = np.hypot(dx, dy)
+    ok = np.isfinite(length) & (length > 1) & (length <= max_gap)
+    steps = np.ceil(length[ok]).astype(np.int64) - 1  # 每条线段内部插入的点数
+    if not len(steps) or not steps.sum():
+        return px, py
+    seg = np.repeat(np.flatnonzero(ok), steps)
+    starts = np.cumsum(steps) - steps
+    t = (np.arange(steps.sum()) - np.repeat(starts, steps) + 1) / np.repeat(steps + 1, steps)
+    return np.concatenate([px, px[seg] + t * dx[seg]]), np.concatenate([py, py[seg] + t * dy[seg]])
+
+
+def _bbox(mask, pad=0):
+    """返回覆盖 mask 中所有 True 像素、四周扩展 pad 像素的切片 (行, 列)，没有 True 时返回 None"""
+    rows = np.flatnonzero(mask.any(axis=1))
+    if not len(rows):
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    return (slice(max(rows[0] - pad, 0), rows[-1] + pad + 1), slice(max(cols[0] - pad, 0), cols[-1] + pad + 1))
+
+
+class HeatmapGenerator:
+    """
+    把多个活动投影到共用视口，按像素分箱累积为密度栅格，输出单帧热力图或逐个活动叠加的动画。
+
+    经纬度按块读取，内存只与画面像素数有关，与活动数量和采样点数无关。
+    """
+
+    def __init__(self, config, activities):
+        """
+        :param activities: [(活动编号, 输入文件夹名)]，按叠加顺序排列。
+        """
+        self.config = config
+        self.activities = activities
+        self.width, self.height = config["frame_size"]
+        self.output_dir = os.path.join(config["output_base_path"], config["output_dir"])
+        self.density = np.zeros((self.height, self.width), dtype=np.float64)
+        self.mask = np.zeros(self.height * self.width, dtype=bool)  # activities 模式下当前活动覆盖的像素
+        self.lat0 = None
+        self.viewport = None
+        self.vmax = None
+
+    def _folder(self, name):
+        return os.path.join(self.config["input_base_path"], name)
+
+    # ---------- 视口 ----------
+    def compute_viewport(self):
+        """流式扫描所有活动的经纬度范围，计算共用的参考纬度与视口"""
+        if self.config["bounds"]:
+            lon_min, lat_min, lon_max, lat_max = self.config["bounds"]
+        else:
+            lon_min = lat_min = np.inf
+            lon_max = lat_max = -np.inf
+            for _, name in self.activities:
+                for lon, lat in _coordinate_chunks(self._folder(name), self.config):
+                    valid = np.isfinite(lon) & np.isfinite(lat)
+                    if valid.any():
+                        lon_min, lon_max = min(lon_min, lon[valid].min()), max(lon_max, lon[valid].max())
+                        lat_min, lat_max = min(lat_min, lat[valid].min()), max(lat_max, lat[valid].max())
+            if not np.isfinite(lon_min):
+                raise ValueError("所有活动都没有有效的经纬度数据")
+
+        # 两种投影在经纬度方向上都是单调的，范围的四个角即可确定视口
+        self.lat0 = (lat_min + lat_max) / 2
+        x, y = project([lon_min, lon_max], [lat_min, lat_max], self.config["projection"], self.lat0)
+        self.viewport = compute_viewport(x, y, self.config["frame_size"], self.config["margin"])
+        return self.viewport
+
+    # ---------- 分箱 ----------
+    def _pixel_indices(self, lon, lat, previous):
+        """把一块经纬度转换为像素平面索引；previous 为上一块的最后一个像素坐标，用于补齐块之间的线段"""
+        east, north = project(lon, lat, self.config["projection"], self.lat0)
+        px, py = to_pixels(east, north, self.viewport)
+        last = (px[-1], py[-1]) if len(px) else previous
+        if self.config["densify"]:
+            if previous is not None:
+                px, py = np.concatenate([[previous[0]], px]), np.concatenate([[previous[1]], py])
+            px, py = densify(px, py, self.config["max_gap_px"])
+            if previous is not None:
+                px, py = px[1:], py[1:]  # 上一块的最后一个点已经计数
+        ix, iy = np.floor(px), np.floor(py)
+        inside = (ix >= 0) & (ix < self.width) & (iy >= 0) & (iy < self.height)  # NaN 比较结果为 False
+        return iy[inside].astype(np.int64) * self.width + ix[inside].astype(np.int64), last
+
+    def add_activity(self, name):
+        """把一个活动累积到密度栅格中"""
+        count_samples = self.config["count_mode"] == "samples"
+        previous = None
+        for lon, lat in _coordinate_chunks(self._folder(name), self.config):
+            flat, previous = self._pixel_indices(lon, lat, previous)
+            if count_samples:
+                self.density += np.bincount(flat, minlength=self.density.size).reshape(self.density.shape)
+            else:
+                self.mask[flat] = True
+
+        if not count_samples:
+            # 只在当前活动覆盖的矩形区域内加粗轨迹并累加
+            covered = self.mask.reshape(self.density.shape)
+            area = _bbox(covered, self.config["line_width"] // 2)
+            if area is not None:
+                region = covered[area]
+                if self.config["line_width"] > 1:
+                    img = Image.fromarray(region.astype(np.uint8) * 255, "L").filter(ImageFilter.MaxFilter(self.config["line_width"]))
+                    region = np.asarray(img) > 0
+                self.density[area] += region
+            self.mask[:] = False
+
+    def accumulate(self):
+        """累积所有活动并确定色图上限，返回密度栅格"""
+        self.density[:] = 0
+        for _, name in self.activities:
+            self.add_activity(name)
+        nonzero = self.density[self.density > 0]
+        self.vmax = float(np.percentile(nonzero, self.config["clip_percentile"])) if len(nonzero) else 1.0
+        return self.density
+
+    # ---------- 着色 ----------
+    def render(self):
+        """把当前密度栅格着色为 RGBA 图片，使用 accumulate() 确定的色图上限，动画各帧颜色一致"""
+        rgba = np.zeros(self.density.shape + (4,), dtype=np.uint8)
+        area = _bbox(self.density > 0, int(self.config["blur_radius"] * 3))
+        if area is not None:
+            rgba[area] = self._colorize(np.minimum(self.density[area], self.vmax))
+
+        img = Image.fromarray(rgba, "RGBA")
+        if any(self.config["background_color"]):
+            background = Image.new("RGBA", img.size, tuple(self.config["background_color"]))
+            img = Image.alpha_composite(background, img)
+        return img
+
+    def _colorize(self, density):
+        """把密度区域映射为 RGBA 像素"""
+        if self.config["style"] == "overlay":
+            # 每条轨迹以固定不透明度叠加，重叠越多越不透明
+            alpha = 1 - (1 - self.config["overlay_alpha"]) ** density
+            rgb = np.array(mcolors.to_rgb(self.config["line_color"])) * 255
+            level = np.rint(alpha * 255).astype(np.uint8)
+            rgba = np.empty(density.shape + (4,), dtype=np.uint8)
+            rgba[..., :3] = rgb.astype(np.uint8)
+            rgba[..., 3] = level
+        else:
+            if self.config["log_scale"]:
+                value = np.log1p(density) / np.log1p(self.vmax)
+            else:
+                value = density / self.vmax
+            level = np.rint(value * 255).astype(np.uint8)
+            lut = plt.get_cmap(self.config["colormap"])(np.linspace(0, 1, 256), bytes=True)
+            rgba = lut[level]
+            min_alpha = self.config["min_alpha"]
+            rgba[..., 3] = np.where(density > 0, min_alpha + (level.astype(np.uint16) * (255 - min_alpha) + 127) // 255, 0)
+
+        if self.config["blur_radius"]:
+            # 只模糊不透明度，颜色随密度保持不变
+            blurred = Image.fromarray(rgba[..., 3]).filter(ImageFilter.GaussianBlur(self.config["blur_radius"]))
+            rgba[..., 3] = np.asarray(blurred)
+        rgba[rgba[..., 3] == 0] = 0  # 完全透明的像素统一为 (0, 0, 0, 0)
+        return rgba
+
+    # ---------- 输出 ----------
+    def generate_image(self):
+        """输出包含全部活动的单帧图片，返回路径"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, self.config["image_name"])
+        save_frame(self.render(), path)
+        return path
+
+    def generate_animation(self):
+        """按顺序逐个叠加活动并输出累积帧，返回帧数"""
+        repeat = self.config["frames_per_activity"]
+        store = FrameStore(os.path.join(self.output_dir, "Frames"), self.config["frame_prefix"], len(self.activities) * repeat, self.config["frame_shard_size"])
+        store.make_dirs()
+        self.density[:] = 0
+        frame_num = 0
+        for k, (seq, name) in enumerate(self.activities, start=1):
+            self.add_activity(name)
+            img = self.render()
+            for _ in range(repeat):
+                save_frame(img, store.path(frame_num))
+                frame_num += 1
+            print(f"已叠加 {k}/{len(self.activities)} 个活动（活动 {seq}）", flush=True)
+        store.write_index()
+        return frame_num
+
+
+def select_activities(config):
+    """返回要叠加的 [(活动编号, 输入文件夹名)]；有活动目录时按开始时间筛选并排序"""
+    name_for = lambda row: f"{config['filename_format']}{row['seq']}"
+    is_folder = lambda f: os.path.isdir(os.path.join(config["input_base_path"], f))
+    if not catalog_exists():
+        return stage_inputs("E3", config["input_base_path"], name_for, is_folder)
+
+    with Catalog() as catalog:
+        rows = catalog.activities(config["since"], config["until"], config["activity_type"], stage_done="E3")
+    rows.sort(key=lambda row: (row["start_time"] or "", row["seq"]))
+    return [(row["seq"], name_for(row)) for row in rows if is_folder(name_for(row))]
+
+
+# ================== 执行主程序 ==================
+if __name__ == "__main__":
+    metrics = Metrics("F_Frames_05_Heatmap")
+    with metrics.run():
+        activities = select_activities(CONFIG)
+        if not activities:
+            print("没有可叠加的活动")
+            sys.exit(0)
+
+        start = time.perf_counter()
+        generator = HeatmapGenerator(CONFIG, activities)
+        viewport = generator.compute_viewport()
+        print(f"共 {len(activities)} 个活动，视口比例 {viewport['scale']:.4f} 像素/米")
+
+        generator.accumulate()
+        print(f"热力图已生成至: {generator.generate_image()}")
+        if CONFIG["animate"]:
+            frames = generator.generate_animation()
+            print(f"累积动画 {frames} 帧已生成至: {os.path.join(generator.output_dir, 'Frames')}")
+        print(f"耗时 {time.perf_counter() - start:.1f} 秒")
+    sys.exit(0)
@@ -0,0 +1,290 @@
+import copy
+import os
+import sys
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from Z_Common_02_FrameRunner import render_with_manifest, report_failures, save_frame
+from Z_Common_03_FrameStore import FrameStore, load_frame_timestamps
+from Z_Common_05_Metrics import FrameTimer, Metrics
+from Z_Common_08_Scheduler import Job, Scheduler
+from Z_Common_09_Catalog import stage_inputs, track_stage
+from Z_Common_10_Stream import read_csv_chunks
+from Z_Common_11_Compositor import Sprite, frame_buffer
+from Z_Common_14_Shards import write_frame_index
+
+# ================== 配置参数 ==================
+CONFIG = {
+    "input_base_path": "./DataProcess/E_ConversedData",  # 输入文件夹路径
+    "output_base_path": "./DataProcess/F_Frames",  # 输出文件夹路径
+    "filename_format": "Activity",  # 文件夹名称格式
+    "frame_size": (1920, 1080),  # 帧尺寸(宽,高)
+    "background_color": (0, 0, 0, 0),  # 透明背景RGBA
+    "frame_prefix": "frame_",  # 帧序列自动编号前的名称
+    "use_multithreading": True,  # 是否使用多线程
+    "use_multiprocessing": True,  # 是否使用多核心
+    "resume": True,  # 是否断点续渲染（只补渲染缺失或失败的帧）
+    "frame_shard_size": 1000,  # 每个子目录存放的帧数（0表示不分子目录）
+    "progress_interval": 2.0,  # 进度输出间隔(秒)
+    "progress_format": "text",  # 进度输出格式："text"、"json"（每行一个JSON事件）或 "off"
+    "frame_window": 500,  # 每个渲染任务的最大帧数，工作进程只接收该窗口的数据
+    "encode_workers": 1,  # 每个渲染任务的 PNG 编码线程数（CPU 有空闲核心时可增加），0 表示在渲染线程中同步编码与写入
+    "encode_queue_depth": 4,  # 等待编码的帧数上限（编码跟不上时渲染阻塞）
+    "write_queue_depth": 8,  # 等待写入的帧数上限（磁盘跟不上时编码阻塞）
+    "shard": None,  # 分片渲染："k/n"（全部帧等分为 n 份中的第 k 份）或 "start-end"（帧号闭区间），None 表示全部帧；环境变量 GARMIN_SHARD 优先
+    "charts": [
+        {
+            "file": "AltitudeValue.csv",  # 数值文件（E_Conversion_05 输出）
+            "x_file": "DistanceValue.csv",  # 横轴数值文件，None 表示按时间（帧号）
+            "position": (1440, 360),  # 图表左上角坐标(x,y)
+            "size": (440, 180),  # 图表尺寸(宽,高)
+            "value_range": None,  # 纵轴范围 (最小值, 最大值)，None 表示按数据自动确定
+            "padding": 0.1,  # 自动纵轴范围上下留出的比例
+            "line_color": (255, 255, 255, 255),  # 曲线颜色
+            "line_width": 3,  # 曲线宽度
+            "fill_color": (255, 255, 255, 90),  # 曲线下方填充颜色，None 表示不填充
+            "played_line_color": (0, 255, 255, 255),  # 已经过部分的曲线颜色，None 表示不区分
+            "played_fill_color": (0, 255, 255, 120),  # 已经过部分的填充颜色
+            "cursor_color": None,  # 当前位置竖线颜色，None 表示不绘制
+            "cursor_width": 2,  # 当前位置竖线宽度
+            "marker_color": (0, 255, 255, 255),  # 当前位置圆点颜色，None 表示不绘制
+            "marker_outline_color": (0, 0, 0, 255),  # 圆点描边颜色
+            "marker_radius": 8,  # 圆点半径
+        },
+        {
+            "file": "HeartRateValue.csv",  # 数值文件（E_Conversion_05 输出）
+            "x_file": None,  # 横轴数值文件，None 表示按时间（帧号）
+            "position": (1440, 200),  # 图表左上角坐标(x,y)
+            "size": (440, 110),  # 图表尺寸(宽,高)
+            "value_range": None,  # 纵轴范围 (最小值, 最大值)，None 表示按数据自动确定
+            "padding": 0.1,  # 自动纵轴范围上下留出的比例
+            "line_color": (247, 76, 76, 200),  # 曲线颜色
+            "line_width": 2,  # 曲线宽度
+            "fill_color": None,  # 曲线下方填充颜色，None 表示不填充
+            "played_line_color": None,  # 已经过部分的曲线颜色，None 表示不区分
+            "played_fill_color": None,  # 已经过部分的填充颜色
+            "cursor_color": (255, 255, 255, 200),  # 当前位置竖线颜色，None 表示不绘制
+            "cursor_width": 2,  # 当前位置竖线宽度
+            "marker_color": (247, 76, 76, 255),  # 当前位置圆点颜色，None 表示不绘制
+            "marker_outline_color": (255, 255, 255, 255),  # 圆点描边颜色
+            "marker_radius": 6,  # 圆点半径
+        },
+    ],
+}
+
+NO_VALUE = np.iinfo(np.int16).min  # 当前帧没有数值时的纵坐标，不绘制圆点
+
+
+# ================== 核心功能 ==================
+def _value_chunks(path):
+    """按块读取单列数值文件，空行保留为 NaN"""
+    for df in read_csv_chunks(path, skip_blank_lines=False):
+        yield df[0].to_numpy(dtype=float)
+
+
+def _nan_range(path):
+    """流式统计单列数值文件的 (行数, 最小值, 最大值)，忽略 NaN"""
+    rows, lo, hi = 0, np.inf, -np.inf
+    for values in _value_chunks(path):
+        rows += len(values)
+        if np.isfinite(values).any():
+            lo, hi = min(lo, np.nanmin(values)), max(hi, np.nanmax(values))
+    return rows, lo, hi
+
+
+class ChartFrameGenerator:
+    """
+    图表图层（海拔剖面、心率走势等）：每个活动按图表宽度把数据流式降采样为逐像素列的最大/最小值，
+    整条曲线只栅格化一次；逐帧只合成预先绘制的图块、裁剪已经过的部分并绘制当前位置。
+    """
+
+    def __init__(self, config, activity_index):
+        self.config = config
+        self.window_start = 0
+        self.input_folder_path = os.path.join(config["input_base_path"], f"{config['filename_format']}{activity_index}")
+        self.output_dir = os.path.join(config["output_base_path"], f"{config['filename_format']}{activity_index}/Chart")
+
+        self.total_frames = None
+        self.charts = [self._prepare_chart(cfg) for cfg in config["charts"]]
+
+        # 创建输出目录
+        self.store = FrameStore(self.output_dir, config["frame_prefix"], self.total_frames, config["frame_shard_size"])
+        self.store.make_dirs()
+
+    # ---------- 预处理 ----------
+    def _prepare_chart(self, cfg):
+        """流式扫描一个图表的数据，返回预先绘制的图块与逐帧的当前位置"""
+        value_path = os.path.join(self.input_folder_path, cfg["file"])
+        x_path = os.path.join(self.input_folder_path, cfg["x_file"]) if cfg["x_file"] else None
+        width, height = cfg["size"]
+
+        rows, lo, hi = _nan_range(value_path)
+        if self.total_frames is None:
+            self.total_frames = rows
+        elif rows != self.total_frames:
+            raise ValueError(f"文件 {cfg['file']} 行数不一致")
+        if cfg["value_range"]:
+            lo, hi = cfg["value_range"]
+        elif not np.isfinite(lo):
+            lo, hi = 0.0, 1.0
+        else:
+            pad = (hi - lo) * cfg["padding"] or 1.0
+            lo, hi = lo - pad, hi + pad
+        if x_path:
+            _, x_lo, x_hi = _nan_range(x_path)
+            x_span = (x_hi - x_lo) if np.isfinite(x_lo) and x_hi > x_lo else None
+
+        # 第二遍：按像素列统计最大/最小值，并记录每帧的当前位置
+        top = np.full(width, np.nan)
+        bottom = np.full(width, np.nan)
+        count = np.zeros(width, dtype=np.int64)
+        cursor_x = np.zeros(rows, dtype=np.int16)
+        cursor_y = np.full(rows, NO_VALUE, dtype=np.int16)
+        x_chunks = _value_chunks(x_path) if x_path else None
+        start, last_px = 0, 0
+        for values in _value_chunks(value_path):
+            if x_chunks is None:
+                px = (np.arange(start, start + len(values)) * width) // max(rows, 1)
+            else:
+                xs = next(x_chunks)
+                px = np.full(len(xs), np.nan) if x_span is None else np.rint((xs - x_lo) / x_span * (width - 1))
+                # 缺失的横轴数值沿用上一个位置
+                valid = np.isfinite(px)
+                filled = np.maximum.accumulate(np.where(valid, np.arange(len(px)), -1))
+                px = np.where(filled >= 0, px[np.maximum(filled, 0)], last_px)
+            px = np.clip(px, 0, width - 1).astype(np.int64)
+            if len(px):
+                last_px = px[-1]
+
+            np.fmax.at(top, px, values)
+            np.fmin.at(bottom, px, values)
+            count += np.bincount(px, minlength=width)
+            ys = np.rint((height - 1) - (values - lo) / (hi - lo) * (height - 1))
+            cursor_x[start:start + len(values)] = px
+            cursor_y[start:start + len(values)] = np.where(np.isfinite(ys), np.clip(ys, -height, 2 * height), NO_VALUE)
+            start += len(values)
+
+        y_top = (height - 1) - (top - lo) / (hi - lo) * (height - 1)
+        y_bottom = (height - 1) - (bottom - lo) / (hi - lo) * (height - 1)
+        margin = max(cfg["line_width"], cfg["marker_radius"]) + 1  # 图块四周留出线宽，曲线不会被裁掉
+        chart = {
+            "cfg": cfg,
+            "origin": (cfg["position"][0] - margin, cfg["position"][1] - margin),
+            "margin": margin,
+            "base": self._rasterize(y_top, y_bottom, count, cfg, cfg["line_color"], cfg["fill_color"], margin),
+            "played": None,
+            "cursor": None,
+            "marker": None,
+            "cursor_x": cursor_x,
+            "cursor_y": cursor_y,
+        }
+        if cfg["played_line_color"]:
+            chart["played"] = self._rasterize(y_top, y_bottom, count, cfg, cfg["played_line_color"], cfg["played_fill_color"], margin)
+        if cfg["cursor_color"]:
+            img = Image.new("RGBA", (cfg["cursor_width"], height), cfg["cursor_color"])
+            chart["cursor"] = Sprite(img)
+        if cfg["marker_color"]:
+            r = cfg["marker_radius"]
+            img = Image.new("RGBA", (2 * r + 1, 2 * r + 1), (0, 0, 0, 0))
+            ImageDraw.Draw(img).ellipse((0, 0, 2 * r, 2 * r), fill=cfg["marker_color"], outline=cfg["marker_outline_color"], width=2)
+            chart["marker"] = Sprite(img)
+        return chart
+
+    @staticmethod
+    def _rasterize(y_top, y_bottom, count, cfg, line_color, fill_color, margin):
+        """把逐像素列的最大/最小值绘制为曲线图块（只在每个活动开始时执行一次）"""
+        width, height = cfg["size"]
+        img = Image.new("RGBA", (width + 2 * margin, height + 2 * margin), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(img)
+        columns = np.flatnonzero(count > 0)
+
+        # 数值缺失的列把曲线分成若干段
+        breaks = np.flatnonzero(np.isnan(y_top[columns]))
+        for segment in np.split(columns, breaks):
+            segment = segment[np.isfinite(y_top[segment])]
+            if not len(segment):
+                continue
+            points = [(margin + x, margin + y) for x, y in zip(segment.tolist(), y_top[segment].tolist())]
+            if fill_color:
+                baseline = margin + height - 1
+                draw.polygon(points + [(points[-1][0], baseline), (points[0][0], baseline)], fill=fill_color)
+            # 一列对应多个采样点时，用竖线表示该列的数值范围，降采样后不丢失尖峰
+            for x in segment[y_bottom[segment] - y_top[segment] >= 1].tolist():
+                draw.line([(margin + x, margin + y_top[x]), (margin + x, margin + y_bottom[x])], fill=line_color, width=1)
+            if len(points) > 1:
+                draw.line(points, fill=line_color, width=cfg["line_width"], joint="curve")
+            else:
+                draw.point(points, fill=line_color)
+        return Sprite(img)
+
+    # ---------- 逐帧渲染 ----------
+    def _window(self, start, end):
+        """只携带一个窗口当前位置的副本，派发到工作进程时不必序列化整个活动"""
+        window = copy.copy(self)
+        window.window_start = start
+        window.charts = [dict(chart, cursor_x=chart["cursor_x"][start:end], cursor_y=chart["cursor_y"][start:end]) for chart in self.charts]
+        return window
+
+    def frame_windows(self, frame_nums, size):
+        """按窗口依次切分当前位置，生成 (窗口帧号列表, 窗口任务)"""
+        for i in range(0, len(frame_nums), size):
+            frames = list(frame_nums[i:i + size])
+            yield frames, self._window(frames[0], frames[-1] + 1).generate_frame
+
+    def _create_frame(self, frame_num, timer):
+        """创建单个帧"""
+        # 复用本进程的帧缓冲区，只清除上一帧合成过的区域
+        buffer = frame_buffer(self.config["frame_size"], self.config["background_color"], timer)
+        k = frame_num - self.window_start
+        for chart in self.charts:
+            ox, oy = chart["origin"]
+            margin = chart["margin"]
+            x = int(chart["cursor_x"][k])
+            buffer.composite(chart["base"], (ox, oy))
+            if chart["played"]:
+                # 已经过的部分：同一图块裁剪到当前位置
+                buffer.composite(chart["played"], (ox, oy), clip=(ox, oy, ox + margin + x + 1, oy + 2 * margin + chart["cfg"]["size"][1]))
+            if chart["cursor"]:
+                buffer.composite(chart["cursor"], (ox + margin + x - chart["cfg"]["cursor_width"] // 2, oy + margin))
+            y = int(chart["cursor_y"][k])
+            if chart["marker"] and y != NO_VALUE:
+                r = chart["cfg"]["marker_radius"]
+                buffer.composite(chart["marker"], (ox + margin + x - r, oy + margin + y - r))
+        timer.lap("composite")
+        return buffer.image()
+
+    def generate_frame(self, frame_num):
+        """生成单个帧并保存"""
+        timer = FrameTimer()
+        frame = self._create_frame(frame_num, timer)
+        save_frame(frame, self.store.path(frame_num), timer)
+        return timer.as_dict()
+
+    def generate_frames(self, metrics=None, scheduler=None):
+        """生成所有帧（跳过已完成的帧），返回失败帧字典"""
+        failures = render_with_manifest(self.generate_frame, self.total_frames, self.output_dir, self.config, metrics, scheduler=scheduler, windows=self.frame_windows,
+                                        frame_path=self.store.path)
+        write_frame_index(self.store, load_frame_timestamps(self.input_folder_path), self.config, failures)
+        return failures
+
+# ================== 执行程序 ==================
+if __name__ == "__main__":
+    # 获取所有转换后的文件夹
+    def process_folder(i, folder):
+        with metrics.activity(folder), track_stage(i, "F6") as record:
+            generator = ChartFrameGenerator(CONFIG, i)
+            failures[generator.output_dir] = generator.generate_frames(metrics, scheduler)
+            if failures[generator.output_dir]:
+                record["error"] = f"{len(failures[generator.output_dir])} 帧渲染失败"
+        print(f"帧序列已生成至: {generator.output_dir}")
+
+    activity_folders = stage_inputs("E5", CONFIG["input_base_path"], lambda row: f"{CONFIG['filename_format']}{row['seq']}", lambda f: os.path.isdir(os.path.join(CONFIG["input_base_path"], f)))
+
+    failures = {}
+    metrics = Metrics("F_Frames_06_Chart")
+    with metrics.run(), Scheduler() as scheduler:
+        # 所有活动共享常驻工作进程并发渲染，帧数少的活动优先
+        scheduler.run_jobs([Job(folder, process_folder, i, folder, inline=True) for i, folder in activity_folders])
+
+    sys.exit(report_failures(failures))
@@ -0,0 +1,267 @@
+import json
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+import traceback
+import zipfile
+
+# 常驻进程只导入一次各阶段模块（pandas、fitparse、PIL 等），之后每个新活动直接复用
+import B_Unzip_01_ZIP2FIT as B
+import F_Frames_01_Speed_HeartRate_Cadence_Power as F1
+import F_Frames_02_ProgressBar as F2
+import F_Frames_04_DatenTime as F4
+from S_Service_02_Pipeline import activity_jobs, prepare_output_dirs
+from Z_Common_02_FrameRunner import atomic_write_bytes
+from Z_Common_05_Metrics import Metrics
+from Z_Common_07_Text import preload_fonts
+from Z_Common_08_Scheduler import Scheduler
+from Z_Common_09_Catalog import Catalog
+
+# ================== 配置参数 ==================
+CONFIG = {
+    "watch_path": B.zip_files_path,  # 监视的 .zip 文件夹
+    "state_file": "./DataProcess/watch_state.json",  # 已处理压缩包及其活动编号的记录
+    "poll_interval": 2.0,  # 轮询间隔(秒)
+    "stable_checks": 2,  # 文件大小与修改时间连续几次轮询不变才视为写入完成
+    "queue_size": 8,  # 待处理队列上限，队列满时新文件留到下一次轮询再入队
+    "max_active": 2,  # 同时处理的活动数量，各活动的任务共享同一个调度器
+    "max_workers": None,  # CPU 预算（工作进程数），None 表示使用全部核心
+    "process_existing": False,  # 首次启动（没有记录文件）时是否处理文件夹中已有的压缩包
+    "garmin_poll_interval": None,  # 轮询 Garmin Connect 新活动的间隔(秒)，None 表示只监视文件夹
+    "garmin_recent": 5,  # 每次同步检查最近的活动数量
+}
+
+metrics = Metrics("S_Service_01_WatchFolder")  # 服务运行指标，每处理完一个活动导出一次
+
+
+# ================== 状态记录 ==================
+class WatchState:
+    """
+    记录每个压缩包分配到的活动编号和处理状态，重启后据此跳过已完成的活动、续做中断的活动。
+
+    活动编号由活动目录分配，这里只保存服务自身的处理状态。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.exists = os.path.exists(path)
+        self.archives = {}
+        self.lock = threading.Lock()
+        if self.exists:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.archives = data.get("archives", {})
+
+    def save(self):
+        with self.lock:
+            data = {"archives": self.archives}
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            atomic_write_bytes(json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8"), self.path)
+
+    def update(self, name, **fields):
+        with self.lock:
+            self.archives.setdefault(name, {}).update(fields)
+        self.save()
+
+
+# ================== 服务 ==================
+class WatchService:
+    def __init__(self, config):
+        self.config = config
+        self.state = WatchState(config["state_file"])
+        self.queue = queue.Queue(maxsize=config["queue_size"])
+        self.stop_event = threading.Event()
+        self.pending = set()  # 已入队或正在处理的压缩包
+        self.candidates = {}  # 压缩包 -> (大小, 修改时间, 连续未变化次数)
+        self.active = threading.BoundedSemaphore(config["max_active"])  # 正在处理的活动名额
+        self.scheduler = None
+        self.worker = threading.Thread(target=self._worker_loop, name="pipeline-worker", daemon=True)
+        self._last_garmin_sync = 0.0
+
+    # ---------- 启动 ----------
+    def warm_up(self):
+        """预加载各渲染阶段的字体，工作进程派生后直接继承"""
+        count = sum(preload_fonts(module.CONFIG) for module in (F1, F2, F4))
+        print(f"已预加载 {count} 个字体")
+
+    def _baseline(self):
+        """首次启动时把文件夹中已有的压缩包记为已处理，只处理之后新到达的活动"""
+        if self.state.exists or self.config["process_existing"] or not os.path.isdir(self.config["watch_path"]):
+            return
+        for name in os.listdir(self.config["watch_path"]):
+            if name.endswith(".zip"):
+                self.state.archives[name] = {"status": "skipped"}
+        self.state.save()
+
+    # ---------- 监视 ----------
+    def scan(self):
+        """轮询监视文件夹，把写入完成的新压缩包放入队列"""
+        watch_path = self.config["watch_path"]
+        if not os.path.isdir(watch_path):
+            return
+        for name in sorted(os.listdir(watch_path)):
+            if not name.endswith(".zip") or name in self.pending:
+                continue
+            entry = self.state.archives.get(name)
+            if entry and entry.get("status") in ("done", "failed", "skipped"):
+                continue
+
+            path = os.path.join(watch_path, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            size, mtime, stable = self.candidates.get(name, (None, None, 0))
+            stable = stable + 1 if (st.st_size, st.st_mtime) == (size, mtime) else 0
+            self.candidates[name] = (st.st_size, st.st_mtime, stable)
+            if stable < self.config["stable_checks"] or not zipfile.is_zipfile(path):
+                continue
+
+            try:
+                self.queue.put_nowait((name, path))
+            except queue.Full:
+                return  # 队列已满，下次轮询再入队
+            self.pending.add(name)
+            del self.candidates[name]
+            print(f"发现新活动: {name}（队列中 {self.queue.qsize()} 个）", flush=True)
+
+    def sync_garmin(self):
+        """按间隔检查 Garmin Connect 最近的活动，把未下载过的活动下载到监视文件夹"""
+        interval = self.config["garmin_poll_interval"]
+        if not interval or time.monotonic() - self._last_garmin_sync < interval:
+            return
+        self._last_garmin_sync = time.monotonic()
+
+        import A_Download_01_GarminActivity as A
+
+        if not A.api:
+            A.api = A.init_api(A.email, A.password)
+        if not A.api:
+            print("无法登录Garmin Connect，稍后重试。")
+            return
+        # 活动目录记录了已下载的活动；下载先写临时文件再改名，监视线程不会读到写了一半的压缩包
+        try:
+            A.download_new_activities(A.api, self.config["garmin_recent"], self.config["watch_path"])
+        except Exception as err:
+            print(f"同步 Garmin 活动失败: {err}")
+
+    # ---------- 处理 ----------
+    def _resume_interrupted(self):
+        """上次退出时尚未完成的活动沿用原编号重新入队（已渲染的帧会被跳过）"""
+        for name, entry in sorted(self.state.archives.items(), key=lambda item: item[1].get("index", 0)):
+            path = os.path.join(self.config["watch_path"], name)
+            if entry.get("status") == "processing" and os.path.exists(path):
+                self.queue.put((name, path))
+                self.pending.add(name)
+                print(f"继续处理上次中断的活动: {name}", flush=True)
+
+    def _worker_loop(self):
+        while True:
+            self.active.acquire()
+            item = self.queue.get()
+            self.queue.task_done()
+            if item is None:
+                self.active.release()
+                return
+            name, path = item
+            if self.stop_event.is_set():
+                # 正在退出，剩余的活动留到下次启动
+                self.pending.discard(name)
+                self.active.release()
+                continue
+            try:
+                self._start(name, path)
+            except Exception as err:
+                traceback.print_exc()
+                self.state.update(name, status="failed", finished=time.time(), error=str(err))
+                self.pending.discard(name)
+                self.active.release()
+
+    def _start(self, name, path):
+        """把一个活动的作业图交给调度器，不等待其完成"""
+        entry = self.state.archives.get(name, {})
+        if not entry.get("index"):
+            with Catalog() as catalog:
+                entry["index"] = catalog.register_archive(path)
+                catalog.set_stage(entry["index"], "A", "done", path)
+        index = entry["index"]
+        self.state.update(name, index=index, status="processing", started=time.time())
+        print(f"开始处理 {name} -> 活动 {index}", flush=True)
+        # 以压缩包大小为优先级，小活动的任务排在大活动之前
+        jobs, renders = activity_jobs(path, index, self.scheduler, priority=os.path.getsize(path))
+        futures = self.scheduler.start_jobs(jobs)
+        self.scheduler.coordinators.submit(self._finish, name, index, futures, renders, time.perf_counter())
+
+    def _finish(self, name, index, futures, renders, start):
+        """等待一个活动的全部作业结束，记录结果并释放名额"""
+        try:
+            failed_frames = 0
+            errors = []
+            for job_name, future in futures.items():
+                try:
+                    result = future.result()
+                except Exception as err:
+                    errors.append(f"{job_name}: {err}")
+                    continue
+                if job_name in renders:
+                    failed_frames += sum(len(f) for f in result.values())
+            if errors:
+                self.state.update(name, status="failed", finished=time.time(), error=errors[0])
+                print(f"处理 {name} 时出错: {errors[0]}", flush=True)
+            else:
+                status = "failed" if failed_frames else "done"
+                self.state.update(name, status=status, finished=time.time(), failed_frames=failed_frames)
+                print(f"活动 {index} 处理完成，耗时 {time.perf_counter() - start:.1f} 秒" + (f"，失败帧 {failed_frames}" if failed_frames else ""), flush=True)
+            # 多个活动并发执行，无法区分各自的 CPU 时间，只记录墙钟时间
+            metrics.activities[name] = {"wall_s": time.perf_counter() - start}
+            if metrics.enabled:
+                metrics.export()
+        finally:
+            self.pending.discard(name)
+            self.active.release()
+
+    # ---------- 主循环 ----------
+    def request_stop(self, signum=None, frame=None):
+        if self.stop_event.is_set():
+            print("再次收到退出信号，立即退出", flush=True)
+            raise SystemExit(1)
+        print("收到退出信号，处理完正在处理的活动后退出（再按一次 Ctrl+C 立即退出）", flush=True)
+        self.stop_event.set()
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.request_stop)
+        signal.signal(signal.SIGTERM, self.request_stop)
+        self.warm_up()
+        self._baseline()
+        prepare_output_dirs()
+        with Scheduler(self.config["max_workers"]) as self.scheduler:
+            self.worker.start()
+            self._resume_interrupted()
+            print(f"正在监视 {self.config['watch_path']}（每 {self.config['poll_interval']} 秒轮询一次，CPU 预算 {self.scheduler.max_workers}）", flush=True)
+
+            while not self.stop_event.is_set():
+                try:
+                    self.sync_garmin()
+                    self.scan()
+                except Exception as err:
+                    print(f"轮询时出错: {err}", flush=True)
+                self.stop_event.wait(self.config["poll_interval"])
+
+            self.queue.put(None)
+            while self.worker.is_alive():
+                self.worker.join(0.5)
+            # 等待正在处理的活动完成
+            for _ in range(self.config["max_active"]):
+                while not self.active.acquire(timeout=0.5):
+                    pass
+        print("服务已停止")
+
+
+# ================== 执行程序 ==================
+if __name__ == "__main__":
+    with metrics.run():
+        WatchService(CONFIG).run()
+    sys.exit(0)
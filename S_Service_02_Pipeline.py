@@ -0,0 +1,140 @@
+import os
+import sys
+
+import B_Unzip_01_ZIP2FIT as B
+import C_Transverse_01_Fit2CSV as C
+import D_Divide_01_CSV2CSVs as D
+import E_Conversion_01_Speed_HeartRate_Cadence_Power as E1
+import E_Conversion_02_Distance as E2
+import E_Conversion_03_Latitude_Longitude as E3
+import E_Conversion_04_DatenTime as E4
+import E_Conversion_05_Channels as E5
+import F_Frames_01_Speed_HeartRate_Cadence_Power as F1
+import F_Frames_02_ProgressBar as F2
+import F_Frames_03_Trace as F3
+import F_Frames_04_DatenTime as F4
+import F_Frames_06_Chart as F6
+from Z_Common_02_FrameRunner import report_failures
+from Z_Common_05_Metrics import Metrics
+from Z_Common_08_Scheduler import Job, Scheduler
+from Z_Common_09_Catalog import Catalog, track_stage
+
+# ================== 配置参数 ==================
+CONFIG = {
+    "max_workers": None,  # CPU 预算（工作进程数），None 表示使用全部核心
+}
+
+metrics = Metrics("S_Service_02_Pipeline")  # 流水线运行指标
+
+
+# ================== 作业函数 ==================
+def tracked(index, stage, output, fn, *args):
+    """执行一个转换阶段，并在活动目录中记录其状态"""
+    with track_stage(index, stage, output):
+        return fn(*args)
+
+
+def _record_failures(record, failures):
+    failed = sum(len(f) for f in failures.values())
+    if failed:
+        record["error"] = f"{failed} 帧渲染失败"
+    return failures
+
+
+def render_layer(stage, generator_class, config, index, scheduler):
+    """在协调线程中加载一个图层的数据，并把帧任务派发给调度器"""
+    with track_stage(index, stage) as record:
+        generator = generator_class(config, index)
+        return _record_failures(record, {generator.output_dir: generator.generate_frames(metrics, scheduler)})
+
+
+def render_trace(stage, index, scheduler):
+    with track_stage(index, stage) as record:
+        generator = F3.GeoVideoGenerator(F3.CONFIG, index)
+        generator.generate_trajectory_map()
+        return _record_failures(record, {generator.temp_dir: generator.generate_video_frames(metrics, scheduler)})
+
+
+# ================== 作业图 ==================
+def activity_jobs(zip_path, index, scheduler, priority=0):
+    """
+    一个活动从压缩包到帧序列的作业图：B → C → D → E1~E5 并发 → F1~F4、F6 并发。
+
+    每个渲染图层只依赖自己的数据和 E4（帧索引需要时间戳），先完成转换的图层可以先开始渲染。
+
+    :param priority: 优先级，一般取压缩包大小，小活动先执行。
+    :return: (作业列表, 渲染作业名称列表)。
+    """
+    fit_name = f"{B.filename_format}{index}.fit"
+    csv_name = f"{C.filename_format}{index}.csv"
+    divided_folder = os.path.join(D.output_base_path, f"{D.filename_format}{index}")
+    conversed_folder = os.path.join(E1.output_base_path, f"{E1.filename_format}{index}")
+
+    def name(stage):
+        return f"{index}/{stage}"
+
+    fit_path = os.path.join(B.extract_path, fit_name)
+    csv_path = os.path.join(C.save_path, csv_name)
+    jobs = [
+        Job(name("B"), tracked, index, "B", fit_path, B.unzip_and_rename, zip_path, fit_name, priority=priority),
+        Job(name("C"), tracked, index, "C", csv_path, C.convert_activity, index, fit_path, csv_name, deps=[name("B")], priority=priority),
+        Job(name("D"), tracked, index, "D", divided_folder, D.process_activity, csv_path, divided_folder, deps=[name("C")], priority=priority),
+    ]
+    for stage, module in (("E1", E1), ("E2", E2), ("E3", E3), ("E4", E4), ("E5", E5)):
+        jobs.append(Job(name(stage), tracked, index, stage, conversed_folder, module.process_activity, divided_folder, conversed_folder, deps=[name("D")], priority=priority))
+
+    renders = [
+        Job(name("F1"), render_layer, "F1", F1.TextFrameGenerator, F1.CONFIG, index, scheduler, deps=[name("E1"), name("E4")], inline=True),
+        Job(name("F2"), render_layer, "F2", F2.ProgressGenerator, F2.CONFIG, index, scheduler, deps=[name("E2"), name("E4")], inline=True),
+        Job(name("F3"), render_trace, "F3", index, scheduler, deps=[name("E3"), name("E4")], inline=True),
+        Job(name("F4"), render_layer, "F4", F4.TextFrameGenerator, F4.CONFIG, index, scheduler, deps=[name("E4")], inline=True),
+        Job(name("F6"), render_layer, "F6", F6.ChartFrameGenerator, F6.CONFIG, index, scheduler, deps=[name("E5"), name("E4")], inline=True),
+    ]
+    return jobs + renders, [job.name for job in renders]
+
+
+def prepare_output_dirs():
+    for path in (B.extract_path, C.save_path, D.output_base_path, E1.output_base_path):
+        os.makedirs(path, exist_ok=True)
+
+
+def main():
+    prepare_output_dirs()
+
+    # 与 B 阶段相同的编号方式：活动目录中的 seq
+    with Catalog() as catalog:
+        catalog.register_archives(B.zip_files_path)
+        zip_files = [(row["seq"], row["archive"]) for row in catalog.activities(stage_done="A")]
+    zip_files = [(i, f) for i, f in zip_files if os.path.exists(os.path.join(B.zip_files_path, f))]
+    # 作业协调线程按提交顺序执行，小活动先提交，长活动不会先占满协调线程
+    zip_files.sort(key=lambda item: os.path.getsize(os.path.join(B.zip_files_path, item[1])))
+
+    jobs, render_names = [], []
+    failures = {}
+    errors = 0
+    with Scheduler(CONFIG["max_workers"]) as scheduler:
+        for i, zip_file in zip_files:
+            zip_path = os.path.join(B.zip_files_path, zip_file)
+            activity, renders = activity_jobs(zip_path, i, scheduler, priority=os.path.getsize(zip_path))
+            jobs.extend(activity)
+            render_names.extend(renders)
+
+        futures = scheduler.start_jobs(jobs)
+        for job_name, future in futures.items():
+            try:
+                result = future.result()
+            except Exception as e:
+                errors += 1
+                print(f"作业 {job_name} 失败: {e}")
+                continue
+            if job_name in render_names:
+                failures.update(result)
+
+    print(f"已完成 {len(zip_files)} 个活动")
+    return max(report_failures(failures), 1 if errors else 0)
+
+
+if __name__ == "__main__":
+    with metrics.run():
+        exit_code = main()
+    sys.exit(exit_code)
@@ -0,0 +1,216 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+from Z_Common_03_FrameStore import INDEX_NAME
+from Z_Common_04_FitFile import ALL_SENSORS, write_synthetic_fit
+
+# ================== 配置参数 ==================
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CONFIG = {
+    "activities": 2,  # 合成活动数量
+    "duration": 600,  # 每个活动时长(秒)
+    "sample_rate": 1.0,  # 采样率(Hz)
+    "sensors": list(ALL_SENSORS),  # 传感器组合
+    "font": os.path.join(REPO_DIR, "SourceHanSans-Heavy.ttc"),  # F 阶段使用的字体文件
+    "workdir": None,  # 工作目录，None 表示使用临时目录
+    "keep_workdir": False,  # 结束后是否保留工作目录
+    "output": "benchmark_result.json",  # 结果 JSON 路径
+    "tolerance": 0.1,  # 与基线比较时允许的吞吐量下降比例
+}
+
+# 阶段: (名称, 脚本, 计量单位, F 阶段帧目录)
+STAGES = [
+    ("B", "B_Unzip_01_ZIP2FIT.py", "rows", None),
+    ("C", "C_Transverse_01_Fit2CSV.py", "rows", None),
+    ("D", "D_Divide_01_CSV2CSVs.py", "rows", None),
+    ("E1", "E_Conversion_01_Speed_HeartRate_Cadence_Power.py", "rows", None),
+    ("E2", "E_Conversion_02_Distance.py", "rows", None),
+    ("E3", "E_Conversion_03_Latitude_Longitude.py", "rows", None),
+    ("E4", "E_Conversion_04_DatenTime.py", "rows", None),
+    ("E5", "E_Conversion_05_Channels.py", "rows", None),
+    ("F1", "F_Frames_01_Speed_HeartRate_Cadence_Power.py", "frames", "Speed_HeartRate_Cadence_Power"),
+    ("F2", "F_Frames_02_ProgressBar.py", "frames", "ProgressBar"),
+    ("F3", "F_Frames_03_Trace.py", "frames", "Trace/TraceFrames"),
+    ("F4", "F_Frames_04_DatenTime.py", "frames", "DatenTime"),
+    ("F6", "F_Frames_06_Chart.py", "frames", "Chart"),
+]
+
+# ================== 功能实现 ==================
+def prepare_workspace(workdir, config):
+    """在工作目录中生成合成的 .zip 活动，返回总采样行数"""
+    zip_dir = os.path.join(workdir, "DataProcess", "A_OriginZIPData")
+    os.makedirs(zip_dir, exist_ok=True)
+    total_rows = 0
+    for i in range(1, config["activities"] + 1):
+        fit_path = os.path.join(workdir, f"synthetic_{i}.fit")
+        total_rows += write_synthetic_fit(fit_path, config["duration"], config["sample_rate"], config["sensors"], seed=i)
+        with zipfile.ZipFile(os.path.join(zip_dir, f"OriginZIPData{i}.zip"), "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.write(fit_path, f"{i}_ACTIVITY.fit")
+        os.remove(fit_path)
+
+    # F 阶段按相对路径查找字体
+    if os.path.exists(config["font"]):
+        font_link = os.path.join(workdir, "SourceHanSans-Heavy.ttc")
+        if not os.path.exists(font_link):
+            shutil.copyfile(config["font"], font_link)
+    return total_rows
+
+
+def run_stage(script, workdir):
+    """在工作目录中以子进程执行阶段脚本，返回 (返回码, 墙钟时间, CPU 时间, 峰值内存MB, 错误输出)"""
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, script)], cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    stderr = proc.stderr.read()
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    # Linux 下 ru_maxrss 单位为 KB，macOS 下为字节
+    peak_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return proc.returncode, wall, usage.ru_utime + usage.ru_stime, peak_mb, stderr.decode("utf-8", "replace")
+
+
+def count_frames(workdir, layer):
+    """根据帧索引统计某一图层生成的帧数"""
+    total = 0
+    frames_root = os.path.join(workdir, "DataProcess", "F_Frames")
+    if not os.path.isdir(frames_root):
+        return 0
+    for activity in os.listdir(frames_root):
+        index_path = os.path.join(frames_root, activity, layer, INDEX_NAME)
+        if os.path.exists(index_path):
+            with open(index_path, "r", encoding="utf-8") as f:
+                total += sum(1 for _ in f) - 1
+    return total
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def run_benchmark(config, stages):
+    """执行基准测试，返回结果字典"""
+    workdir = config["workdir"] or tempfile.mkdtemp(prefix="garmin_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    print(f"工作目录: {workdir}")
+    total_rows = prepare_workspace(workdir, config)
+    print(f"已生成 {config['activities']} 个合成活动，共 {total_rows} 行")
+
+    results = []
+    for name, script, unit, layer in STAGES:
+        if stages and name not in stages:
+            continue
+        if unit == "frames" and not os.path.exists(os.path.join(workdir, "SourceHanSans-Heavy.ttc")):
+            print(f"字体文件 {config['font']} 不存在，跳过阶段 {name}")
+            continue
+
+        print(f"正在执行: {name} ({script})")
+        returncode, wall, cpu, peak_mb, stderr = run_stage(script, workdir)
+        count = count_frames(workdir, layer) if unit == "frames" else total_rows
+        result = {
+            "stage": name,
+            "script": script,
+            "returncode": returncode,
+            "wall_s": round(wall, 4),
+            "cpu_s": round(cpu, 4),
+            "peak_rss_mb": round(peak_mb, 1),
+            unit: count,
+            f"{unit}_per_s": round(count / wall, 2) if wall > 0 else None,
+        }
+        results.append(result)
+        print(f"  耗时 {wall:.2f}s, CPU {cpu:.2f}s, 峰值内存 {peak_mb:.1f}MB, {result[f'{unit}_per_s']} {unit}/s")
+        if returncode != 0:
+            print(f"执行 {name} 时出错: {stderr.strip().splitlines()[-1] if stderr.strip() else returncode}")
+            break
+
+    if not config["keep_workdir"] and not config["workdir"]:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": {k: config[k] for k in ("activities", "duration", "sample_rate", "sensors")},
+        },
+        "stages": results,
+    }
+
+
+def compare_with_baseline(result, baseline, tolerance):
+    """与基线结果比较吞吐量，返回退化的阶段列表"""
+    baseline_stages = {s["stage"]: s for s in baseline.get("stages", [])}
+    regressions = []
+    for stage in result["stages"]:
+        base = baseline_stages.get(stage["stage"])
+        if not base:
+            continue
+        for key in ("rows_per_s", "frames_per_s"):
+            if stage.get(key) and base.get(key):
+                ratio = stage[key] / base[key]
+                print(f"{stage['stage']}: {key} {base[key]} -> {stage[key]} ({ratio:.2%})")
+                if ratio < 1 - tolerance:
+                    regressions.append(stage["stage"])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="使用合成 FIT 活动对整个处理流程进行基准测试")
+    parser.add_argument("--activities", type=int, default=CONFIG["activities"], help="合成活动数量")
+    parser.add_argument("--duration", type=float, default=CONFIG["duration"], help="每个活动时长(秒)")
+    parser.add_argument("--sample-rate", type=float, default=CONFIG["sample_rate"], help="采样率(Hz)")
+    parser.add_argument("--sensors", default=",".join(CONFIG["sensors"]), help=f"传感器组合，可选: {','.join(ALL_SENSORS)}")
+    parser.add_argument("--stages", default="", help="只执行指定阶段，如 B,C,D,F1")
+    parser.add_argument("--font", default=CONFIG["font"], help="F 阶段使用的字体文件")
+    parser.add_argument("--workdir", default=CONFIG["workdir"], help="工作目录（默认临时目录）")
+    parser.add_argument("--keep-workdir", action="store_true", help="结束后保留临时工作目录")
+    parser.add_argument("--output", default=CONFIG["output"], help="结果 JSON 路径")
+    parser.add_argument("--baseline", help="用于比较的基线结果 JSON")
+    parser.add_argument("--tolerance", type=float, default=CONFIG["tolerance"], help="允许的吞吐量下降比例")
+    args = parser.parse_args()
+
+    config = dict(CONFIG)
+    config.update(
+        activities=args.activities,
+        duration=args.duration,
+        sample_rate=args.sample_rate,
+        sensors=[s for s in args.sensors.split(",") if s],
+        font=os.path.abspath(args.font),
+        workdir=args.workdir,
+        keep_workdir=args.keep_workdir,
+    )
+    stages = [s for s in args.stages.split(",") if s]
+
+    result = run_benchmark(config, stages)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"基准测试结果已保存到 '{args.output}'")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(result, baseline, args.tolerance)
+        if regressions:
+            print(f"以下阶段性能退化超过 {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+    if any(stage["returncode"] != 0 for stage in result["stages"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import argparse
+import sys
+
+from Z_Common_09_Catalog import Catalog, catalog_exists, catalog_path
+
+# ================== 配置参数 ==================
+STAGES = ["A", "B", "C", "D", "E1", "E2", "E3", "E4", "E5", "F1", "F2", "F3", "F4", "F6"]  # 显示的阶段顺序
+STATUS_MARKS = {"done": "✓", "failed": "✗", "running": "…"}  # 阶段状态的显示符号
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询本地活动目录（不访问网络、不扫描文件夹）")
+    parser.add_argument("--since", help="开始时间下限（含），如 2024-05-01")
+    parser.add_argument("--until", help="开始时间上限（不含），如 2024-06-01")
+    parser.add_argument("--type", dest="activity_type", help="活动类型，如 running、cycling")
+    parser.add_argument("--stage-done", help="只显示该阶段已完成的活动，如 E4")
+    parser.add_argument("--seq-only", action="store_true", help="只输出活动编号，便于脚本使用")
+    args = parser.parse_args()
+
+    if not catalog_exists():
+        print(f"活动目录 {catalog_path()} 不存在，请先运行下载或解压阶段。")
+        return 1
+
+    with Catalog() as catalog:
+        rows = catalog.activities(args.since, args.until, args.activity_type, args.stage_done)
+        if args.seq_only:
+            for row in rows:
+                print(row["seq"])
+            return 0
+
+        print(f"{'编号':>4}  {'开始时间':<19}  {'类型':<12}  {'阶段':<{sum(len(s) + 2 for s in STAGES) - 1}}  名称")
+        for row in rows:
+            stages = catalog.stages(row["seq"])
+            marks = " ".join(f"{stage}{STATUS_MARKS.get(stages.get(stage), '-')}" for stage in STAGES)
+            print(f"{row['seq']:>4}  {(row['start_time'] or '')[:19]:<19}  {(row['activity_type'] or ''):<12}  {marks}  {row['name'] or row['archive'] or ''}")
+    print(f"共 {len(rows)} 个活动")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+import argparse
+import csv
+import math
+import os
+import sys
+import time
+
+from PIL import Image, ImageDraw, ImageFont
+
+import F_Frames_01_Speed_HeartRate_Cadence_Power as F1
+import F_Frames_02_ProgressBar as F2
+import F_Frames_03_Trace as F3
+import F_Frames_04_DatenTime as F4
+import F_Frames_06_Chart as F6
+from Z_Common_07_Text import load_font
+from Z_Common_09_Catalog import stage_inputs
+
+# ================== 配置参数 ==================
+CONFIG = {
+    "layers": ["F3", "F2", "F6", "F1", "F4"],  # 叠加顺序，先列出的图层在下面
+    "scale": 0.5,  # 缩放比例，字体、位置、线宽等一并缩放
+    "count": 12,  # 未指定间隔时在时间窗口内均匀选取的帧数
+    "stride": None,  # 每隔多少帧渲染一帧，None 表示按 count 自动确定
+    "start": None,  # 时间窗口起点（相对活动开始，如 "00:10:00"），None 表示从头开始
+    "end": None,  # 时间窗口终点，None 表示到结尾
+    "output": "sheet",  # 输出形式："sheet"（联系表 PNG）或 "gif"（低分辨率动图）
+    "output_path": "./DataProcess/Preview",  # 预览输出文件夹（与正式帧序列分开）
+    "columns": 4,  # 联系表每行的帧数
+    "background_color": (48, 48, 48, 255),  # 预览背景色（正式帧为透明背景）
+    "label_font": "SourceHanSans-Heavy.ttc",  # 联系表标签字体，不存在时使用默认字体
+    "label_font_size": 20,  # 联系表标签字号
+    "gif_fps": 4,  # 动图帧率
+}
+
+# 随缩放比例一起缩放的配置项（像素或磅为单位的尺寸、坐标、字号与线宽）
+SCALED_KEYS = {
+    "frame_size", "video_size", "map_size", "map_position", "position", "size",
+    "font_size", "dynamic_font_size", "stroke_width", "text_stroke_width", "row_spacing",
+    "line_width", "split_marker_width", "split_font_size", "split_label_gap", "total_length", "start_x", "short_height", "long_height", "text_offset",
+    "progress_height", "progress_radius", "dynamic_offset", "vertical_offset",
+    "aircraft_outline_width", "aircraft_radius", "cursor_width", "marker_radius",
+}
+
+# 图层: (模块, 生成器类名)
+LAYERS = {
+    "F1": (F1, "TextFrameGenerator"),
+    "F2": (F2, "ProgressGenerator"),
+    "F3": (F3, "GeoVideoGenerator"),
+    "F4": (F4, "TextFrameGenerator"),
+    "F6": (F6, "ChartFrameGenerator"),
+}
+
+
+# ================== 配置缩放 ==================
+def _scale_value(value, scale):
+    if isinstance(value, (tuple, list)):
+        return type(value)(_scale_value(v, scale) for v in value)
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int):
+        scaled = round(value * scale)
+        return max(scaled, 1) if value > 0 else scaled  # 线宽、字号等至少保留 1 像素
+    if isinstance(value, float):
+        return value * scale
+    return value
+
+
+def scale_config(config, scale):
+    """返回按比例缩放几何尺寸后的配置副本（递归处理 csv_configs、charts 等子配置列表）"""
+    scaled = {}
+    for key, value in config.items():
+        if isinstance(value, list) and value and isinstance(value[0], dict):
+            scaled[key] = [scale_config(item, scale) for item in value]
+        elif key in SCALED_KEYS:
+            scaled[key] = _scale_value(value, scale)
+        else:
+            scaled[key] = value
+    return scaled
+
+
+# ================== 帧选取 ==================
+def parse_time(text):
+    """把 "HH:MM:SS"、"MM:SS" 或秒数解析为秒"""
+    seconds = 0.0
+    for part in str(text).split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def select_frames(input_folder_path, start=None, end=None, stride=None, count=12, delta_file="DateDelta.csv"):
+    """
+    按相对时间窗口与间隔选取帧号，返回 (帧号列表, {帧号: 相对时间}, 总帧数)。
+
+    流式读取相对时间文件一次，只保留选中帧的标签。
+    """
+    start = parse_time(start) if start is not None else None
+    end = parse_time(end) if end is not None else None
+    path = os.path.join(input_folder_path, delta_file)
+
+    first = last = None
+    total = 0
+    with open(path, "r", newline="") as f:
+        for total, row in enumerate(csv.reader(f), start=1):
+            t = parse_time(row[0])
+            if (start is None or t >= start) and (end is None or t <= end):
+                first = total - 1 if first is None else first
+                last = total - 1
+    if first is None:
+        return [], {}, total
+
+    span = last - first + 1
+    stride = stride or max(1, math.ceil(span / count))
+    frames = list(range(first, last + 1, stride))
+
+    wanted = set(frames)
+    labels = {}
+    with open(path, "r", newline="") as f:
+        for k, row in enumerate(csv.reader(f)):
+            if k in wanted:
+                labels[k] = row[0]
+    return frames, labels, total
+
+
+def layer_frames(frames, total, layer_total):
+    """把基准帧号按比例映射到图层自己的帧号（与帧索引的时间戳对应方式一致）"""
+    if total <= 1 or layer_total <= 1:
+        return [0 for _ in frames]
+    return [round(k * (layer_total - 1) / (total - 1)) for k in frames]
+
+
+# ================== 渲染 ==================
+def build_layer(name, config, index):
+    """创建图层的生成器（加载数据、确定总帧数）"""
+    module, class_name = LAYERS[name]
+    return getattr(module, class_name)(config, index)
+
+
+def render_layer(name, generator, frame_selection):
+    """只渲染选中的帧，返回失败帧字典"""
+    generator.config = dict(generator.config, frame_selection=frame_selection)
+    if name == "F3":
+        generator.generate_trajectory_map()
+        return generator.generate_video_frames()
+    return generator.generate_frames()
+
+
+def preview_config(module, scale, output_base_path):
+    """预览使用的图层配置：缩放几何尺寸、输出到预览文件夹、渲染帧序列、不续渲染、在本进程内多线程渲染"""
+    config = scale_config(module.CONFIG, scale)
+    config.update({
+        "output_base_path": output_base_path,
+        "resume": False,
+        "output_mode": "frames",
+        "use_multiprocessing": False,
+        "progress_format": "off",
+    })
+    return config
+
+
+def compose(layers, frames, size, background):
+    """按图层顺序叠加各图层的选中帧，生成预览图片"""
+    images = []
+    for i, k in enumerate(frames):
+        canvas = Image.new("RGBA", size, background)
+        for generator, mapped in layers:
+            path = generator.store.path(mapped[i])
+            if os.path.exists(path):
+                with Image.open(path) as img:
+                    canvas.alpha_composite(img.convert("RGBA").crop((0, 0) + size))
+        images.append(canvas.convert("RGB"))
+    return images
+
+
+def contact_sheet(images, captions, columns, font):
+    """把预览图片排列为带标签的联系表"""
+    width, height = images[0].size
+    label_height = int(font.size * 1.6) if hasattr(font, "size") else 16
+    rows = math.ceil(len(images) / columns)
+    sheet = Image.new("RGB", (columns * width, rows * (height + label_height)), (0, 0, 0))
+    draw = ImageDraw.Draw(sheet)
+    for i, (img, caption) in enumerate(zip(images, captions)):
+        x, y = (i % columns) * width, (i // columns) * (height + label_height)
+        sheet.paste(img, (x, y))
+        draw.text((x + 4, y + height + 2), caption, font=font, fill=(255, 255, 255))
+    return sheet
+
+
+def main():
+    parser = argparse.ArgumentParser(description="快速预览：缩小尺寸、间隔取帧，输出联系表或动图，用于调整版式")
+    parser.add_argument("--activity", type=int, help="活动编号，默认取第一个已完成转换的活动")
+    parser.add_argument("--layers", default=",".join(CONFIG["layers"]), help=f"图层（叠加顺序），可选: {','.join(LAYERS)}")
+    parser.add_argument("--scale", type=float, default=CONFIG["scale"], help="缩放比例")
+    parser.add_argument("--stride", type=int, default=CONFIG["stride"], help="每隔多少帧渲染一帧")
+    parser.add_argument("--count", type=int, default=CONFIG["count"], help="未指定 --stride 时均匀选取的帧数")
+    parser.add_argument("--start", default=CONFIG["start"], help="时间窗口起点，如 00:10:00")
+    parser.add_argument("--end", default=CONFIG["end"], help="时间窗口终点，如 00:20:00")
+    parser.add_argument("--output", choices=("sheet", "gif"), default=CONFIG["output"], help="输出联系表或动图")
+    args = parser.parse_args()
+
+    input_base_path = F1.CONFIG["input_base_path"]
+    if args.activity is None:
+        activities = stage_inputs("E4", input_base_path, lambda row: f"{F1.CONFIG['filename_format']}{row['seq']}", lambda f: os.path.isdir(os.path.join(input_base_path, f)))
+        if not activities:
+            print("没有可预览的活动")
+            return 1
+        args.activity = activities[0][0]
+    input_folder_path = os.path.join(input_base_path, f"{F1.CONFIG['filename_format']}{args.activity}")
+
+    start_time = time.perf_counter()
+    frames, labels, total = select_frames(input_folder_path, args.start, args.end, args.stride, args.count)
+    if not frames:
+        print("时间窗口内没有帧")
+        return 1
+    print(f"活动 {args.activity}: 共 {total} 帧，预览 {len(frames)} 帧（缩放 {args.scale}）")
+
+    output_base_path = os.path.join(CONFIG["output_path"], "Frames")
+    layers = []
+    for name in args.layers.split(","):
+        name = name.strip()
+        config = preview_config(LAYERS[name][0], args.scale, output_base_path)
+        try:
+            generator = build_layer(name, config, args.activity)
+            mapped = layer_frames(frames, total, generator.store.total_frames)
+            failures = render_layer(name, generator, sorted(set(mapped)))
+        except FileNotFoundError as err:
+            print(f"跳过图层 {name}: {err}")
+            continue
+        if failures:
+            print(f"图层 {name} 有 {len(failures)} 帧渲染失败")
+        layers.append((generator, mapped))
+
+    size = scale_config({"frame_size": F1.CONFIG["frame_size"]}, args.scale)["frame_size"]
+    images = compose(layers, frames, tuple(size), CONFIG["background_color"])
+
+    os.makedirs(CONFIG["output_path"], exist_ok=True)
+    if args.output == "gif":
+        path = os.path.join(CONFIG["output_path"], f"preview_{args.activity}.gif")
+        images[0].save(path, save_all=True, append_images=images[1:], duration=int(1000 / CONFIG["gif_fps"]), loop=0)
+    else:
+        try:
+            font = load_font(CONFIG["label_font"], CONFIG["label_font_size"])
+        except FileNotFoundError:
+            font = ImageFont.load_default()
+        path = os.path.join(CONFIG["output_path"], f"preview_{args.activity}.png")
+        contact_sheet(images, [f"帧 {k}  {labels.get(k, '')}" for k in frames], CONFIG["columns"], font).save(path)
+    print(f"预览已保存到: {path}（耗时 {time.perf_counter() - start_time:.1f} 秒）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
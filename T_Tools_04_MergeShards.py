@@ -0,0 +1,161 @@
+import argparse
+import csv
+import json
+import os
+import sys
+
+from Z_Common_02_FrameRunner import MANIFEST_NAME, RenderManifest, merge_ranges
+from Z_Common_03_FrameStore import INDEX_NAME
+from Z_Common_14_Shards import find_shard_files
+
+# ================== 配置参数 ==================
+CONFIG = {
+    "search_path": "./DataProcess/F_Frames",  # 未指定目录时在此目录下查找含分片清单的帧目录
+    "check_frames": True,  # 合并前逐帧确认图片文件存在
+}
+
+
+# ================== 校验 ==================
+def find_sharded_dirs(paths):
+    """在给定目录（递归）中查找含分片清单的帧目录"""
+    found = []
+    for path in paths:
+        for root, _, _ in os.walk(path):
+            if find_shard_files(root, MANIFEST_NAME):
+                found.append(root)
+    return sorted(found)
+
+
+def load_shards(root):
+    """读取帧目录中的全部分片清单，返回 [(start, end, 清单字典, 清单路径)]"""
+    shards = []
+    for start, end, path in find_shard_files(root, MANIFEST_NAME):
+        with open(path, "r", encoding="utf-8") as f:
+            shards.append((start, end, json.load(f), path))
+    return shards
+
+
+def validate(root, shards, check_frames=True):
+    """
+    校验一个帧目录的各分片：总帧数与配置签名一致、分片区间覆盖全部帧、每个分片都已完成且没有失败帧、
+    分片索引存在且覆盖分片区间（可选逐帧确认图片存在）。
+
+    :return: 问题描述列表，为空表示可以合并。
+    """
+    problems = []
+    totals = {data.get("total_frames") for _, _, data, _ in shards}
+    signatures = {data.get("signature") for _, _, data, _ in shards}
+    if len(totals) != 1:
+        problems.append(f"各分片的总帧数不一致: {sorted(totals, key=str)}")
+    if len(signatures) != 1:
+        problems.append("各分片的配置签名不一致（渲染时使用了不同的配置）")
+    if problems:
+        return problems
+    total = totals.pop()
+
+    covered = merge_ranges([[start, end - 1] for start, end, _, _ in shards])
+    if covered != [[0, total - 1]]:
+        gaps, position = [], 0
+        for start, end in covered:
+            if start > position:
+                gaps.append(f"{position}-{start - 1}")
+            position = end + 1
+        if position < total:
+            gaps.append(f"{position}-{total - 1}")
+        problems.append(f"分片没有覆盖全部 {total} 帧，缺少帧区间: {', '.join(gaps)}")
+
+    indexes = {(start, end): path for start, end, path in find_shard_files(root, INDEX_NAME)}
+    for start, end, data, path in shards:
+        name = os.path.basename(path)
+        completed = merge_ranges(data.get("completed", []))
+        if not any(s <= start and end - 1 <= e for s, e in completed):
+            done = sum(min(e, end - 1) - max(s, start) + 1 for s, e in completed if s <= end - 1 and e >= start)
+            problems.append(f"{name}（{data.get('host', '?')}）未完成: {done}/{end - start} 帧")
+        if data.get("failed"):
+            problems.append(f"{name} 有 {len(data['failed'])} 帧渲染失败: {sorted(int(k) for k in data['failed'])[:10]}")
+        index_path = indexes.get((start, end))
+        if index_path is None:
+            problems.append(f"{name} 缺少分片索引（分片渲染可能在写出索引前中断）")
+            continue
+        with open(index_path, "r", encoding="utf-8") as f:
+            frames = 0
+            for row in csv.DictReader(f):
+                frames += 1
+                if check_frames and not os.path.exists(os.path.join(root, row["path"])):
+                    problems.append(f"{os.path.basename(index_path)} 中的帧 {row['frame']} 不存在: {row['path']}")
+                    break
+        expected = end - start - len(data.get("failed", {}))  # 失败帧不写入索引
+        if frames != expected:
+            problems.append(f"{os.path.basename(index_path)} 有 {frames} 行，应为 {expected} 行")
+    return problems
+
+
+# ================== 合并 ==================
+def merge(root, shards):
+    """按帧号顺序拼接各分片索引为 frame_index.csv（重叠的帧只保留一次），并写出全部完成的渲染清单"""
+    _, _, first, _ = shards[0]
+    index_path = os.path.join(root, INDEX_NAME)
+    tmp_path = f"{index_path}.tmp"
+    next_frame = 0
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f_out:
+        writer = csv.writer(f_out, lineterminator="\n")
+        writer.writerow(["frame", "timestamp", "path"])
+        for _, _, path in find_shard_files(root, INDEX_NAME):
+            with open(path, "r", newline="", encoding="utf-8") as f_in:
+                reader = csv.reader(f_in)
+                next(reader)
+                for row in reader:
+                    if int(row[0]) >= next_frame:
+                        writer.writerow(row)
+                        next_frame = int(row[0]) + 1
+    os.replace(tmp_path, index_path)
+
+    # 合并后的清单与不分片渲染完成时相同，之后不分片续渲染不会重复渲染
+    manifest = RenderManifest(root, first["total_frames"], first["signature"])
+    manifest.reset()
+    manifest.completed = [[0, first["total_frames"] - 1]]
+    manifest.save()
+
+
+def clean(root):
+    """删除已合并的分片清单与分片索引"""
+    for name in (MANIFEST_NAME, INDEX_NAME):
+        for _, _, path in find_shard_files(root, name):
+            os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="校验分片渲染是否全部完成，并合并各分片的帧索引与渲染清单")
+    parser.add_argument("paths", nargs="*", default=[CONFIG["search_path"]], help="帧目录或其上级目录（递归查找含分片清单的帧目录）")
+    parser.add_argument("--clean", action="store_true", help="合并成功后删除分片清单与分片索引")
+    parser.add_argument("--no-check-frames", dest="check_frames", action="store_false", default=CONFIG["check_frames"], help="不逐帧确认图片存在")
+    args = parser.parse_args()
+
+    roots = find_sharded_dirs(args.paths)
+    if not roots:
+        print(f"在 {', '.join(args.paths)} 中没有找到分片渲染的帧目录")
+        return 1
+
+    incomplete = 0
+    for root in roots:
+        shards = load_shards(root)
+        problems = validate(root, shards, args.check_frames)
+        if problems:
+            incomplete += 1
+            print(f"{root}: {len(shards)} 个分片，不能合并")
+            for problem in problems:
+                print(f"  {problem}")
+            continue
+        merge(root, shards)
+        if args.clean:
+            clean(root)
+        print(f"{root}: 已合并 {len(shards)} 个分片（{shards[0][2]['total_frames']} 帧）")
+
+    if incomplete:
+        print(f"{incomplete}/{len(roots)} 个帧目录的分片不完整")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
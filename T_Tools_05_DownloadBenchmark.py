@@ -0,0 +1,160 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import A_Download_01_GarminActivity as A
+from Z_Common_15_FakeGarmin import DEFAULTS, FakeGarmin
+
+# ================== 配置参数 ==================
+CONFIG = {
+    "activities": 20,  # 下载的活动数量
+    "latency": DEFAULTS["latency"],  # 每次调用的基础延迟(秒)
+    "jitter": DEFAULTS["jitter"],  # 延迟的随机抖动上限(秒)
+    "bandwidth": DEFAULTS["bandwidth"],  # 下载带宽(字节/秒)，0 表示不限
+    "payload": DEFAULTS["payload"],  # 下载内容："fit" 或 "random"
+    "payload_size": DEFAULTS["payload_size"],  # payload 为 "random" 时的下载大小(字节)
+    "requests_per_second": DEFAULTS["requests_per_second"],  # 服务端限流(请求/秒)，None 表示不限
+    "too_many_requests_rate": 0.0,  # 随机注入 429 的概率
+    "failure_rate": 0.0,  # 随机注入连接错误的概率
+    "seed": DEFAULTS["seed"],  # 随机数种子
+    "retry_backoff": 0.05,  # 覆盖 A 阶段的首次重试等待时间(秒)，基准测试中缩短以免等待过久
+    "max_retries": A.max_retries,  # A 阶段的最多重试次数
+    "workdir": None,  # 工作目录，None 表示使用临时目录
+    "keep_workdir": False,  # 结束后是否保留工作目录
+    "output": "download_benchmark_result.json",  # 结果 JSON 路径
+}
+
+# 传给离线替身的配置项
+FAKE_KEYS = ["latency", "jitter", "bandwidth", "payload", "payload_size", "requests_per_second", "too_many_requests_rate", "failure_rate", "seed"]
+
+
+def run_pass(api, config, folder):
+    """执行一次 A 阶段的增量下载，返回本轮的统计"""
+    A.retry_stats.update(retries=0, backoff_s=0.0)
+    calls_before = dict(api.stats["calls"])
+    injected_before = (api.stats["too_many_requests"], api.stats["failures"], api.stats["bytes_sent"])
+
+    start = time.perf_counter()
+    try:
+        downloaded = A.download_new_activities(api, config["activities"], folder)
+        error = None
+    except Exception as err:  # 活动列表在重试后仍获取失败
+        downloaded, error = [], f"{type(err).__name__}: {err}"
+    wall = time.perf_counter() - start
+
+    bytes_sent = api.stats["bytes_sent"] - injected_before[2]
+    return {
+        "wall_s": round(wall, 4),
+        "downloaded": len(downloaded),
+        "downloads_per_s": round(len(downloaded) / wall, 2) if wall > 0 else None,
+        "mb_per_s": round(bytes_sent / wall / 1e6, 3) if wall > 0 else None,
+        "bytes": bytes_sent,
+        "calls": {k: v - calls_before.get(k, 0) for k, v in api.stats["calls"].items()},
+        "injected_429": api.stats["too_many_requests"] - injected_before[0],
+        "injected_failures": api.stats["failures"] - injected_before[1],
+        "retries": A.retry_stats["retries"],
+        "backoff_s": round(A.retry_stats["backoff_s"], 3),
+        "error": error,
+    }
+
+
+def run_benchmark(config):
+    """在工作目录中对离线替身执行两轮下载：第一轮全部下载，第二轮验证增量下载跳过已下载的活动"""
+    workdir = config["workdir"] or tempfile.mkdtemp(prefix="garmin_download_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    print(f"工作目录: {workdir}")
+
+    A.retry_backoff = config["retry_backoff"]
+    A.max_retries = config["max_retries"]
+    api = FakeGarmin(activities=config["activities"], **{k: config[k] for k in FAKE_KEYS})
+
+    cwd = os.getcwd()
+    os.chdir(workdir)  # 活动目录与下载文件都使用相对路径
+    try:
+        passes = []
+        for name in ("initial", "incremental"):
+            print(f"正在执行: {name}")
+            result = run_pass(api, config, A.save_path)
+            result["pass"] = name
+            passes.append(result)
+            print(
+                f"  耗时 {result['wall_s']:.2f}s, 下载 {result['downloaded']} 个 ({result['downloads_per_s']}/s, {result['mb_per_s']} MB/s), "
+                f"注入 429 {result['injected_429']} 次、连接错误 {result['injected_failures']} 次, "
+                f"重试 {result['retries']} 次 (等待 {result['backoff_s']:.2f}s)"
+            )
+            if result["error"]:
+                print(f"  {result['error']}")
+        downloaded = len(os.listdir(A.save_path)) if os.path.isdir(A.save_path) else 0
+    finally:
+        os.chdir(cwd)
+        if not config["keep_workdir"] and not config["workdir"]:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": {k: config[k] for k in ["activities", "retry_backoff", "max_retries"] + FAKE_KEYS},
+        },
+        "passes": passes,
+        "missing": config["activities"] - downloaded,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="使用离线 Garmin Connect 替身测量 A 阶段的下载吞吐量与重试行为")
+    parser.add_argument("--activities", type=int, default=CONFIG["activities"], help="下载的活动数量")
+    parser.add_argument("--latency", type=float, default=CONFIG["latency"], help="每次调用的基础延迟(秒)")
+    parser.add_argument("--jitter", type=float, default=CONFIG["jitter"], help="延迟的随机抖动上限(秒)")
+    parser.add_argument("--bandwidth", type=float, default=CONFIG["bandwidth"], help="下载带宽(字节/秒)，0 表示不限")
+    parser.add_argument("--payload", choices=("fit", "random"), default=CONFIG["payload"], help="下载内容")
+    parser.add_argument("--payload-size", type=int, default=CONFIG["payload_size"], help="payload 为 random 时的下载大小(字节)")
+    parser.add_argument("--rps", type=float, default=CONFIG["requests_per_second"], help="服务端限流(请求/秒)")
+    parser.add_argument("--too-many-requests-rate", type=float, default=CONFIG["too_many_requests_rate"], help="随机注入 429 的概率")
+    parser.add_argument("--failure-rate", type=float, default=CONFIG["failure_rate"], help="随机注入连接错误的概率")
+    parser.add_argument("--seed", type=int, default=CONFIG["seed"], help="随机数种子")
+    parser.add_argument("--retry-backoff", type=float, default=CONFIG["retry_backoff"], help="首次重试等待时间(秒)")
+    parser.add_argument("--max-retries", type=int, default=CONFIG["max_retries"], help="最多重试次数")
+    parser.add_argument("--workdir", default=CONFIG["workdir"], help="工作目录（默认临时目录）")
+    parser.add_argument("--keep-workdir", action="store_true", help="结束后保留临时工作目录")
+    parser.add_argument("--output", default=CONFIG["output"], help="结果 JSON 路径")
+    args = parser.parse_args()
+
+    config = dict(CONFIG)
+    config.update(
+        activities=args.activities,
+        latency=args.latency,
+        jitter=args.jitter,
+        bandwidth=args.bandwidth,
+        payload=args.payload,
+        payload_size=args.payload_size,
+        requests_per_second=args.rps,
+        too_many_requests_rate=args.too_many_requests_rate,
+        failure_rate=args.failure_rate,
+        seed=args.seed,
+        retry_backoff=args.retry_backoff,
+        max_retries=args.max_retries,
+        workdir=args.workdir and os.path.abspath(args.workdir),
+        keep_workdir=args.keep_workdir,
+    )
+
+    result = run_benchmark(config)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"下载基准测试结果已保存到 '{args.output}'")
+
+    if result["missing"]:
+        print(f"有 {result['missing']} 个活动在重试后仍未下载")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
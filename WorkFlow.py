@@ -1,4 +1,7 @@
+import os
 import subprocess
+import time
+from Z_Common_05_Metrics import METRICS_DIR_ENV, PROFILE_ENV, write_report
 
 # 文件名列表
 filenames = [
@@ -10,17 +13,39 @@ filenames = [
     "E_Conversion_02_Distance.py",
     "E_Conversion_03_Latitude_Longitude.py",
     "E_Conversion_04_DatenTime.py",
+    "E_Conversion_05_Channels.py",
     "F_Frames_01_Speed_HeartRate_Cadence_Power.py",
     "F_Frames_02_ProgressBar.py",
     "F_Frames_03_Trace.py",
-    "F_Frames_04_DatenTime.py"
+    "F_Frames_04_DatenTime.py",
+    "F_Frames_06_Chart.py"
 ]
 
-# 依次执行每个.py文件
+# 调度配置
+use_scheduler = False  # True 时 B~F 阶段在同一进程中由全局调度器并发执行（见 S_Service_02_Pipeline.py）
+
+# 指标配置
+metrics_dir = f"./DataProcess/Metrics/{time.strftime('%Y%m%d_%H%M%S')}"  # 各阶段指标及汇总报告的保存路径，设为 None 则不导出
+prometheus_textfile = None  # Prometheus textfile 路径（如 "./DataProcess/Metrics/workflow.prom"），None 表示不导出
+profile_mode = None  # 性能剖析模式: None、"cprofile" 或 "pyspy"
+
+env = os.environ.copy()
+if metrics_dir:
+    env[METRICS_DIR_ENV] = metrics_dir
+if profile_mode:
+    env[PROFILE_ENV] = profile_mode
+
+if use_scheduler:
+    filenames = filenames[:1] + ["S_Service_02_Pipeline.py"]
+
+# 依次执行每个.py文件，实时输出各阶段日志
 for filename in filenames:
-    print(f"正在执行: {filename}")
-    result = subprocess.run(["python", filename], capture_output=True, text=True)
-    print(result.stdout)
+    print(f"正在执行: {filename}", flush=True)
+    start = time.perf_counter()
+    result = subprocess.run(["python", filename], env=env)
     if result.returncode != 0:
-        print(f"执行 {filename} 时出错: {result.stderr}")
-    print(f"完成: {filename}\n")
+        print(f"执行 {filename} 时出错，返回码: {result.returncode}")
+    print(f"完成: {filename}（耗时 {time.perf_counter() - start:.1f} 秒）\n", flush=True)
+
+if metrics_dir and os.path.isdir(metrics_dir):
+    print(f"指标报告已保存到: {write_report(metrics_dir, prometheus_textfile)}")
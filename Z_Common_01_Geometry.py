@@ -0,0 +1,200 @@
+import numpy as np
+
+# ================== 常量 ==================
+EARTH_RADIUS = 6371008.8  # 地球平均半径(米)
+MERCATOR_MAX_LAT = 85.05112878  # Web Mercator 有效纬度范围
+
+
+# ================== 投影 ==================
+def project(lon, lat, method="equirectangular", lat0=None):
+    """
+    将经纬度(度)整体投影为平面坐标(米)，X 向东为正，Y 向北为正。
+
+    :param lon: 经度数组。
+    :param lat: 纬度数组。
+    :param method: 投影方式，"equirectangular"（按 cos(纬度) 缩放的等距圆柱投影）或 "mercator"（Web Mercator）。
+    :param lat0: 等距圆柱投影的参考纬度，默认取数据纬度范围的中点；多个活动共用视口时应传入同一值。
+    :return: (x, y) 两个数组。
+    """
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    lon_rad = np.radians(lon)
+
+    if method == "equirectangular":
+        if lat0 is None:
+            lat0 = (np.nanmin(lat) + np.nanmax(lat)) / 2 if len(lat) else 0.0
+        x = EARTH_RADIUS * lon_rad * np.cos(np.radians(lat0))
+        y = EARTH_RADIUS * np.radians(lat)
+    elif method == "mercator":
+        lat_rad = np.radians(np.clip(lat, -MERCATOR_MAX_LAT, MERCATOR_MAX_LAT))
+        x = EARTH_RADIUS * lon_rad
+        y = EARTH_RADIUS * np.log(np.tan(np.pi / 4 + lat_rad / 2))
+    else:
+        raise ValueError(f"不支持的投影方式: {method}")
+
+    return x, y
+
+
+def headings(x, y):
+    """
+    计算每个点指向下一个点的方向角(度)，以 X 轴正向为 0，逆时针为正。
+    最后一个点沿用前一个点的方向。
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    angles = np.zeros(len(x))
+    if len(x) < 2:
+        return angles
+    angles[:-1] = np.degrees(np.arctan2(np.diff(y), np.diff(x)))
+    angles[-1] = angles[-2]
+    return angles
+
+
+def cumulative_distance(lon, lat):
+    """使用 haversine 公式计算沿轨迹的累计距离(米)，首点为 0。"""
+    lon_rad = np.radians(np.asarray(lon, dtype=float))
+    lat_rad = np.radians(np.asarray(lat, dtype=float))
+    distance = np.zeros(len(lon_rad))
+    if len(lon_rad) < 2:
+        return distance
+
+    dlat = np.diff(lat_rad)
+    dlon = np.diff(lon_rad)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat_rad[:-1]) * np.cos(lat_rad[1:]) * np.sin(dlon / 2) ** 2
+    step = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+    np.cumsum(step, out=distance[1:])
+    return distance
+
+
+# ================== 视口 ==================
+def compute_viewport(x, y, size, margin=0.1):
+    """
+    计算把平面坐标等比例放入画布的视口，四周留出 margin 比例的边距，并在较短方向上居中。
+
+    :param x: 平面 X 坐标数组（或多个活动合并后的范围端点）。
+    :param y: 平面 Y 坐标数组。
+    :param size: 画布尺寸 (宽, 高)。
+    :param margin: 边距占数据范围的比例。
+    :return: 视口字典 {"x_min", "x_max", "y_min", "y_max", "scale"}，scale 为像素/米。
+    """
+    width, height = size
+    x_min, x_max = float(np.nanmin(x)), float(np.nanmax(x))
+    y_min, y_max = float(np.nanmin(y)), float(np.nanmax(y))
+
+    # 增加边距，并避免数据范围为零
+    x_margin = max((x_max - x_min) * margin, 1.0)
+    y_margin = max((y_max - y_min) * margin, 1.0)
+    x_min, x_max = x_min - x_margin, x_max + x_margin
+    y_min, y_max = y_min - y_margin, y_max + y_margin
+
+    # 调整绘图范围保持原始比例
+    geo_width = x_max - x_min
+    geo_height = y_max - y_min
+    canvas_aspect = width / height
+    if geo_width / geo_height > canvas_aspect:
+        adj_height = geo_width / canvas_aspect
+        y_center = (y_max + y_min) / 2
+        y_min, y_max = y_center - adj_height / 2, y_center + adj_height / 2
+    else:
+        adj_width = geo_height * canvas_aspect
+        x_center = (x_max + x_min) / 2
+        x_min, x_max = x_center - adj_width / 2, x_center + adj_width / 2
+
+    return {
+        "x_min": x_min,
+        "x_max": x_max,
+        "y_min": y_min,
+        "y_max": y_max,
+        "scale": width / (x_max - x_min),
+    }
+
+
+def to_pixels(x, y, viewport):
+    """把平面坐标转换为图片像素坐标（Y 轴向下）。"""
+    px = (np.asarray(x, dtype=float) - viewport["x_min"]) * viewport["scale"]
+    py = (viewport["y_max"] - np.asarray(y, dtype=float)) * viewport["scale"]
+    return px, py
+
+
+# ================== 折线简化 ==================
+def simplify_track(x, y, tolerance):
+    """
+    在像素坐标系下简化轨迹折线，返回保留点的索引。
+
+    先将点量化到容差大小的网格并去除连续重复点，再对剩余点执行 Douglas-Peucker 简化，
+    因此耗时与内存取决于轨迹覆盖的像素数，而不是采样点数。
+
+    :param x: 像素 X 坐标数组。
+    :param y: 像素 Y 坐标数组。
+    :param tolerance: 允许的最大偏差（像素）。
+    :return: 保留点的索引数组（升序，包含首尾点）。
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n <= 2 or tolerance <= 0:
+        return np.arange(n)
+
+    # 量化到网格，去除落在同一网格内的连续点
+    gx = np.floor(x / tolerance).astype(np.int64)
+    gy = np.floor(y / tolerance).astype(np.int64)
+    keep = np.ones(n, dtype=bool)
+    keep[1:] = (gx[1:] != gx[:-1]) | (gy[1:] != gy[:-1])
+    keep[-1] = True
+    candidates = np.flatnonzero(keep)
+    if len(candidates) <= 2:
+        return candidates
+
+    # Douglas-Peucker（栈迭代，每段距离计算向量化）
+    cx = x[candidates]
+    cy = y[candidates]
+    m = len(candidates)
+    selected = np.zeros(m, dtype=bool)
+    selected[0] = selected[-1] = True
+    tol_sq = tolerance * tolerance
+    stack = [(0, m - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dx = cx[end] - cx[start]
+        dy = cy[end] - cy[start]
+        px = cx[start + 1:end] - cx[start]
+        py = cy[start + 1:end] - cy[start]
+        seg_sq = dx * dx + dy * dy
+        if seg_sq == 0:
+            dist_sq = px * px + py * py
+        else:
+            cross = px * dy - py * dx
+            dist_sq = cross * cross / seg_sq
+        idx = int(np.argmax(dist_sq))
+        if dist_sq[idx] > tol_sq:
+            split = start + 1 + idx
+            selected[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+
+    return candidates[selected]
+
+
+class TrackGeometry:
+    """
+    一条轨迹的整体几何预计算结果，供任意需要位置的渲染器复用。
+
+    属性：x/y（像素坐标）、angles（方向角，度）、distance（累计距离，米）、viewport（视口）。
+    """
+
+    def __init__(self, lon, lat, size, projection="equirectangular", margin=0.1, viewport=None, lat0=None):
+        self.lon = np.asarray(lon, dtype=float)
+        self.lat = np.asarray(lat, dtype=float)
+        if len(self.lon) != len(self.lat):
+            raise ValueError("经度与纬度数据长度不一致")
+
+        self.east, self.north = project(self.lon, self.lat, projection, lat0)
+        self.viewport = viewport or compute_viewport(self.east, self.north, size, margin)
+        self.x, self.y = to_pixels(self.east, self.north, self.viewport)
+        self.angles = headings(self.east, self.north)
+        self.distance = cumulative_distance(self.lon, self.lat)
+
+    def __len__(self):
+        return len(self.lon)
@@ -0,0 +1,514 @@
+import concurrent.futures
+import hashlib
+import io
+import itertools
+import json
+import os
+import queue
+import signal
+import socket
+import threading
+import time
+
+from Z_Common_06_Progress import ProgressReporter
+from Z_Common_14_Shards import shard_file_name, shard_range, shard_spec
+
+# ================== 断点续渲染清单 ==================
+MANIFEST_NAME = "render_manifest.json"  # 清单文件名
+RUNTIME_KEYS = ("use_multithreading", "use_multiprocessing", "resume", "progress_interval", "progress_format", "frame_window", "frame_selection", "shard",
+                "encode_workers", "encode_queue_depth", "write_queue_depth", "output_mode", "subtitle_fps")  # 不影响画面内容的配置项
+
+
+def config_signature(config):
+    """计算配置的签名，影响画面的配置变化后旧的清单自动失效"""
+    items = sorted((k, v) for k, v in config.items() if k not in RUNTIME_KEYS)
+    return hashlib.sha1(repr(items).encode("utf-8")).hexdigest()
+
+
+def atomic_write_bytes(data, path):
+    """先写入临时文件再重命名，保证目标文件要么完整要么不存在"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def save_frame(img, path, timer=None, format="PNG"):
+    """
+    编码并原子地保存帧图片。
+
+    在 run_frames 的帧任务中调用时交给当前窗口的 FramePipeline 放入编码队列，由编码线程与写入线程异步完成，
+    渲染线程立即继续下一帧。帧图片来自 frame_buffer 轮流提供的缓冲区时不复制像素，否则先复制一份。
+
+    :param timer: 可选的 FrameTimer，分别记录编码与写入耗时及写入字节数。
+    """
+    pipeline = getattr(_current, "pipeline", None)
+    if pipeline is not None:
+        pipeline.submit(_current.frame_num, img, path, format, timer)
+        return
+    buf = io.BytesIO()
+    img.save(buf, format=format)
+    data = buf.getvalue()
+    if timer:
+        timer.lap("encode")
+    atomic_write_bytes(data, path)
+    if timer:
+        timer.lap("write")
+        timer.add("bytes_written", len(data))
+
+
+# ================== 渲染 → 编码 → 写入流水线 ==================
+ENCODE_WORKERS = 1  # 每个渲染任务的编码线程数（PNG 编码时释放 GIL，与渲染并行），0 表示在渲染线程中同步编码与写入
+ENCODE_QUEUE_DEPTH = 4  # 等待编码的帧数上限，编码跟不上时渲染线程阻塞
+WRITE_QUEUE_DEPTH = 8  # 等待写入的已编码帧数上限，磁盘跟不上时编码线程阻塞
+
+_current = threading.local()  # 当前线程正在执行的流水线与帧号
+_STOP = object()
+
+
+def current_pipeline():
+    """当前线程正在执行的帧任务所在的 FramePipeline，不在异步流水线中时返回 None"""
+    return getattr(_current, "pipeline", None)
+
+
+def pipeline_settings(config):
+    """从配置中读取流水线参数 (编码线程数, 编码队列深度, 写入队列深度)"""
+    return (
+        config.get("encode_workers", ENCODE_WORKERS),
+        config.get("encode_queue_depth", ENCODE_QUEUE_DEPTH),
+        config.get("write_queue_depth", WRITE_QUEUE_DEPTH),
+    )
+
+
+class FramePipeline:
+    """
+    一个渲染任务内的 渲染 → 编码 → 写入 流水线。
+
+    渲染线程把帧放入有界的编码队列，编码线程池把 PNG 数据放入有界的写入队列，写入线程依次原子地落盘。
+    帧缓冲区（见 Z_Common_11_Compositor.frame_buffer）由 buffer_count 个缓冲区轮流使用，编码线程编码完成后
+    归还，编码器直接读取缓冲区的像素；没有空闲缓冲区或队列满时上游阻塞，阻塞时间计入单帧计时的
+    backpressure_encode（编码跟不上渲染）与 backpressure_write（写入跟不上编码），据此调整线程数与队列深度。
+    """
+
+    def __init__(self, encode_workers=ENCODE_WORKERS, encode_queue_depth=ENCODE_QUEUE_DEPTH, write_queue_depth=WRITE_QUEUE_DEPTH):
+        self.encode_queue = queue.Queue(max(1, encode_queue_depth))
+        self.write_queue = queue.Queue(max(1, write_queue_depth))
+        self.timings = {}  # 帧号 -> 编码与写入线程记录的计时
+        self.errors = {}  # 帧号 -> 编码或写入时的错误信息
+        self.buffer_count = max(1, encode_queue_depth) + max(1, encode_workers)  # 排队与编码中的帧各占一个缓冲区
+        self._held = {}  # 帧号 -> 编码完成后归还帧缓冲区的函数列表
+        self._lock = threading.Lock()
+        self.encoders = [threading.Thread(target=self._encode_loop, daemon=True) for _ in range(max(1, encode_workers))]
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        for thread in self.encoders + [self.writer]:
+            thread.start()
+
+    def _add(self, frame_num, key, value):
+        with self._lock:
+            timings = self.timings.setdefault(frame_num, {})
+            timings[key] = timings.get(key, 0) + value
+
+    def _fail(self, frame_num, error):
+        with self._lock:
+            self.errors[frame_num] = str(error)
+
+    def hold(self, release):
+        """登记当前帧使用的帧缓冲区：该帧编码完成（或未提交就结束）后调用 release 归还，提交时不再复制像素"""
+        with self._lock:
+            self._held.setdefault(_current.frame_num, []).append(release)
+
+    def release(self, frame_num):
+        """归还帧任务登记但没有提交编码的帧缓冲区"""
+        with self._lock:
+            releases = self._held.pop(frame_num, ())
+        for release in releases:
+            release()
+
+    def submit(self, frame_num, img, path, format="PNG", timer=None):
+        """
+        放入编码队列，队列满时阻塞。
+
+        帧图片不是登记过的帧缓冲区时先复制像素（调用方随后可能修改或复用该图片）。
+        """
+        with self._lock:
+            releases = self._held.pop(frame_num, None)
+        if releases is None:
+            img = img.copy()
+            if timer:
+                timer.lap("snapshot")
+        self.encode_queue.put((frame_num, img, path, format, releases or ()))
+        if timer:
+            timer.lap("backpressure_encode")
+
+    def _encode_loop(self):
+        while True:
+            item = self.encode_queue.get()
+            if item is _STOP:
+                return
+            frame_num, img, path, format, releases = item
+            start = time.perf_counter()
+            try:
+                buf = io.BytesIO()
+                img.save(buf, format=format)
+            except Exception as e:
+                self._fail(frame_num, e)
+                continue
+            finally:
+                for release in releases:
+                    release()
+            encoded = time.perf_counter()
+            self._add(frame_num, "encode", encoded - start)
+            self.write_queue.put((frame_num, buf.getvalue(), path))
+            self._add(frame_num, "backpressure_write", time.perf_counter() - encoded)
+
+    def _write_loop(self):
+        while True:
+            item = self.write_queue.get()
+            if item is _STOP:
+                return
+            frame_num, data, path = item
+            start = time.perf_counter()
+            try:
+                atomic_write_bytes(data, path)
+            except Exception as e:
+                self._fail(frame_num, e)
+                continue
+            self._add(frame_num, "write", time.perf_counter() - start)
+            self._add(frame_num, "bytes_written", len(data))
+
+    def close(self):
+        """等待已提交的帧全部编码并写入"""
+        for _ in self.encoders:
+            self.encode_queue.put(_STOP)
+        for thread in self.encoders:
+            thread.join()
+        self.write_queue.put(_STOP)
+        self.writer.join()
+
+    def result(self, frame_num):
+        """返回 (错误信息或 None, 编码与写入计时)"""
+        with self._lock:
+            return self.errors.get(frame_num), self.timings.get(frame_num, {})
+
+
+def merge_ranges(ranges):
+    """合并重叠或相邻的闭区间 [start, end]"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class RenderManifest:
+    """
+    记录已完成的帧区间和失败帧，用于中断后只补渲染缺失或失败的帧。
+
+    清单保存在输出目录下，写入采用临时文件加重命名，进程被杀死时也不会损坏。
+    分片渲染时每个分片使用各自的清单文件（见 Z_Common_14_Shards.py），并记录分片区间与渲染主机。
+    """
+
+    def __init__(self, output_dir, total_frames, signature="", flush_interval=5.0, name=MANIFEST_NAME, frame_range=None):
+        self.path = os.path.join(output_dir, name)
+        self.total_frames = total_frames
+        self.signature = signature
+        self.frame_range = frame_range  # 分片区间 (start, end)，None 表示全部帧
+        self.flush_interval = flush_interval  # 自动保存的最小间隔(秒)
+        self.completed = []  # 已完成的闭区间列表 [[start, end], ...]
+        self.failed = {}  # 失败帧 {帧号: 错误信息}
+        self._pending_done = []
+        self._last_flush = time.monotonic()
+        self._load()
+
+    def _load(self):
+        """加载已有清单，总帧数或配置签名不一致时视为新任务"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取渲染清单 {self.path} 时出错，将重新渲染: {e}")
+            return
+        if data.get("total_frames") != self.total_frames or data.get("signature") != self.signature:
+            print(f"渲染清单 {self.path} 与当前任务不匹配，将重新渲染")
+            return
+        self.completed = merge_ranges(data.get("completed", []))
+        self.failed = {int(k): v for k, v in data.get("failed", {}).items()}
+
+    def _flush_done(self):
+        if self._pending_done:
+            self.completed = merge_ranges(self.completed + [[n, n] for n in self._pending_done])
+            self._pending_done = []
+
+    def reset(self):
+        """清空已完成与失败的记录（不续渲染时重新开始）"""
+        self.completed, self.failed, self._pending_done = [], {}, []
+
+    def pending(self, frame_nums, exists=None):
+        """
+        返回尚未完成的帧号列表。
+
+        :param exists: 可选的 exists(帧号) -> 帧文件是否完好；记为完成但文件缺失或为空的帧从清单中移除并视为未完成。
+        """
+        self._flush_done()
+        done = set()
+        for start, end in self.completed:
+            done.update(range(start, end + 1))
+        if exists is not None:
+            missing = {n for n in frame_nums if n in done and not exists(n)}
+            if missing:
+                print(f"渲染清单中有 {len(missing)} 帧的文件缺失或为空，将重新渲染")
+                done -= missing
+                self.completed = merge_ranges([n, n] for n in done)
+        return [n for n in frame_nums if n not in done]
+
+    def mark_done(self, frame_num):
+        self._pending_done.append(frame_num)
+        self.failed.pop(frame_num, None)
+
+    def mark_failed(self, frame_num, error):
+        self.failed[frame_num] = str(error)
+
+    def maybe_save(self):
+        """距上次保存超过 flush_interval 时保存"""
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.save()
+
+    def save(self):
+        self._flush_done()
+        data = {
+            "total_frames": self.total_frames,
+            "signature": self.signature,
+            "completed": self.completed,
+            "failed": {str(k): v for k, v in sorted(self.failed.items())},
+        }
+        if self.frame_range is not None:
+            data["range"] = [self.frame_range[0], self.frame_range[1] - 1]
+            data["host"] = socket.gethostname()
+        atomic_write_bytes(json.dumps(data, ensure_ascii=False, indent=1).encode("utf-8"), self.path)
+        self._last_flush = time.monotonic()
+
+
+# ================== 帧任务执行 ==================
+WINDOWS_PER_WORKER = 4  # 每个工作进程平均分到的窗口数下限，窗口过大时单个活动无法并行
+PENDING_PER_WORKER = 2  # 每个工作进程最多排队的窗口数，限制同时驻留内存的窗口数据
+
+
+def _raise_system_exit(signum, frame):
+    raise SystemExit(128 + signum)
+
+
+def _run_window(task, frame_nums, pipeline=None):
+    """
+    在工作进程中依次渲染一个窗口内的帧，逐帧捕获异常，返回 [(帧号, 错误信息或 None, 计时字典)]。
+
+    :param pipeline: 流水线参数，见 pipeline_settings；编码线程数大于 0 时帧任务中的 save_frame 交给
+                     本窗口的 FramePipeline 异步编码与写入，窗口结束时等待全部写完再汇总结果。
+    """
+    frame_pipeline = FramePipeline(*pipeline) if pipeline and pipeline[0] > 0 else None
+    _current.pipeline = frame_pipeline
+    results = []
+    try:
+        for frame_num in frame_nums:
+            _current.frame_num = frame_num
+            try:
+                results.append((frame_num, None, task(frame_num)))
+            except Exception as e:
+                results.append((frame_num, str(e), None))
+            if frame_pipeline:
+                frame_pipeline.release(frame_num)
+    finally:
+        _current.pipeline = None
+        if frame_pipeline:
+            frame_pipeline.close()
+    if frame_pipeline is None:
+        return results
+
+    merged = []
+    for frame_num, error, timings in results:
+        pipeline_error, pipeline_timings = frame_pipeline.result(frame_num)
+        if error is None and pipeline_error is not None:
+            error, timings = pipeline_error, None
+        elif timings is not None:
+            timings.update(pipeline_timings)
+        merged.append((frame_num, error, timings))
+    return merged
+
+
+def window_size(total, config, workers):
+    """窗口大小：不超过 frame_window，且保证每个工作进程至少分到 WINDOWS_PER_WORKER 个窗口"""
+    limit = config.get("frame_window") or 1
+    return max(1, min(limit, -(-total // (workers * WINDOWS_PER_WORKER))))
+
+
+def run_frames(task, frame_nums, config, manifest=None, metrics=None, progress=None, scheduler=None, priority=0, windows=None):
+    """
+    按配置的并行方式执行帧任务，捕获每一帧的异常而不中断整体渲染。
+
+    :param task: 渲染单帧的函数，参数为帧号，可返回单帧计时字典。
+    :param frame_nums: 需要渲染的帧号列表。
+    :param config: 含 use_multithreading / use_multiprocessing / frame_window 的配置字典，
+                   可选 encode_workers / encode_queue_depth / write_queue_depth（见 FramePipeline）。
+    :param manifest: 可选的 RenderManifest，用于记录完成与失败的帧。
+    :param metrics: 可选的 Metrics，用于汇总单帧计时。
+    :param progress: 可选的 ProgressReporter，用于输出进度。
+    :param scheduler: 可选的全局 Scheduler，提供时帧任务派发到其常驻工作进程，而不是新建进程池。
+    :param priority: 提交给调度器的优先级，数值越小越先执行。
+    :param windows: 可选的窗口生成函数 windows(帧号列表, 窗口大小)，按帧号顺序生成 (窗口帧号列表, 窗口任务)，
+                    窗口任务只携带该窗口的数据；不提供时每个窗口都使用 task。
+                    同一时间只有有限个窗口在排队，数据按需读取，内存占用与活动长度无关。
+    :return: 失败帧字典 {帧号: 错误信息}。
+    """
+    failed = {}
+    in_worker_process = bool(config["use_multithreading"] and config["use_multiprocessing"])
+
+    def on_result(frame_num, error, timings=None):
+        if error is None:
+            if metrics:
+                metrics.record_frame(timings, in_worker_process)
+            if manifest:
+                manifest.mark_done(frame_num)
+        else:
+            print(f"生成帧 {frame_num} 时出错: {error}")
+            failed[frame_num] = str(error)
+            if manifest:
+                manifest.mark_failed(frame_num, error)
+        if manifest:
+            manifest.maybe_save()
+        if progress:
+            progress.update(failed=error is not None)
+
+    def on_window(window, results=None, error=None):
+        if error is not None:
+            for frame_num in window:
+                on_result(frame_num, error)
+            return
+        for frame_num, frame_error, timings in results:
+            on_result(frame_num, frame_error, timings)
+
+    # 被抢占时通常收到 SIGTERM，转换为 SystemExit 以便保存清单
+    previous_handler = None
+    if threading.current_thread() is threading.main_thread():
+        previous_handler = signal.signal(signal.SIGTERM, _raise_system_exit)
+
+    workers = scheduler.max_workers if scheduler is not None else (os.cpu_count() or 1)
+    size = window_size(len(frame_nums), config, workers) if config["use_multithreading"] else config.get("frame_window") or 1
+    pipeline = pipeline_settings(config)
+    if windows is None:
+        units = ((list(frame_nums[i:i + size]), task) for i in range(0, len(frame_nums), size))
+    else:
+        units = iter(windows(frame_nums, size))
+
+    executor = None
+    futures = {}
+    try:
+        if config["use_multithreading"]:
+            if scheduler is not None:
+                submit = lambda unit: scheduler.submit(_run_window, unit[1], unit[0], pipeline, priority=priority, use_processes=config["use_multiprocessing"])
+            else:
+                executor_class = concurrent.futures.ProcessPoolExecutor if config["use_multiprocessing"] else concurrent.futures.ThreadPoolExecutor
+                executor = executor_class()
+                submit = lambda unit: executor.submit(_run_window, unit[1], unit[0], pipeline)
+            # 只保持有限个窗口在排队，完成一个再读取并提交下一个
+            max_pending = workers * PENDING_PER_WORKER
+            for unit in itertools.islice(units, max_pending):
+                futures[submit(unit)] = unit[0]
+            while futures:
+                done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    window = futures.pop(future)
+                    if future.cancelled():
+                        continue  # 调度器关闭时取消的帧，留待下次续渲染
+                    try:
+                        on_window(window, future.result())
+                    except Exception as e:
+                        on_window(window, error=e)
+                for unit in itertools.islice(units, len(done)):
+                    futures[submit(unit)] = unit[0]
+        else:
+            for window, window_task in units:
+                on_window(window, _run_window(window_task, window, pipeline))
+    finally:
+        # 中断时取消排队中的帧，并保存已完成的进度
+        if executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+        elif futures:
+            for future in futures:
+                future.cancel()
+        if manifest:
+            manifest.save()
+        if previous_handler is not None:
+            signal.signal(signal.SIGTERM, previous_handler)
+
+    return failed
+
+
+def frame_file_ok(path):
+    """帧文件存在且不为空"""
+    try:
+        return os.path.getsize(path) > 0
+    except OSError:
+        return False
+
+
+def render_with_manifest(task, total_frames, output_dir, config, metrics=None, label=None, scheduler=None, windows=None, frame_path=None):
+    """
+    带断点续渲染的帧生成入口：读取清单，只渲染缺失或失败的帧，并输出进度。
+
+    配置中的 frame_selection（升序帧号列表）不为 None 时只渲染这些帧，用于预览；
+    配置中的 shard（或环境变量 GARMIN_SHARD）不为空时只渲染该分片的帧，清单写入分片各自的文件，
+    各分片完成后用 T_Tools_04_MergeShards.py 校验并合并。
+
+    :param label: 进度输出中的名称，默认取输出目录的最后两级。
+    :param scheduler: 可选的全局 Scheduler，帧任务以总帧数为优先级派发，帧数少的活动先完成。
+    :param windows: 可选的窗口生成函数，见 run_frames。
+    :param frame_path: 可选的 frame_path(帧号) -> 帧文件路径，续渲染时检查清单记为完成的帧文件，缺失或为空的帧重新渲染。
+    :return: 失败帧字典 {帧号: 错误信息}。
+    """
+    label = label or "/".join(os.path.normpath(output_dir).split(os.sep)[-2:])
+    start, end = 0, total_frames
+    manifest_name, frame_range = MANIFEST_NAME, None
+    spec = shard_spec(config)
+    if spec:
+        start, end = frame_range = shard_range(spec, total_frames)
+        manifest_name = shard_file_name(MANIFEST_NAME, start, end)
+        label = f"{label} [{start}-{end - 1}]"
+    frame_nums = range(start, end)
+    if config.get("frame_selection") is not None:
+        frame_nums = [i for i in config["frame_selection"] if start <= i < end]
+    selected = len(frame_nums)
+    manifest = None
+    if config.get("resume", True) or frame_range is not None:
+        # 分片始终写出清单，合并命令据此确认分片已完成
+        manifest = RenderManifest(output_dir, total_frames, config_signature(config), name=manifest_name, frame_range=frame_range)
+        if config.get("resume", True):
+            frame_nums = manifest.pending(frame_nums, frame_path and (lambda n: frame_file_ok(frame_path(n))))
+            if len(frame_nums) < selected:
+                print(f"从断点继续渲染: 已完成 {selected - len(frame_nums)}/{selected} 帧")
+        else:
+            manifest.reset()
+
+    progress = ProgressReporter(label, selected, selected - len(frame_nums), config.get("progress_interval", 2.0), config.get("progress_format", "text"))
+    failures = run_frames(task, frame_nums, config, manifest, metrics, progress, scheduler, total_frames, windows)
+    progress.finish()
+    return failures
+
+
+def report_failures(failures):
+    """
+    汇总所有活动的失败帧并返回退出码。
+
+    :param failures: {输出目录: {帧号: 错误信息}}。
+    :return: 没有失败帧时为 0，否则为 1。
+    """
+    total_failed = sum(len(frames) for frames in failures.values())
+    if total_failed == 0:
+        return 0
+    print(f"共有 {total_failed} 帧生成失败:")
+    for output_dir, frames in failures.items():
+        if frames:
+            print(f"  {output_dir}: {sorted(frames)}")
+    return 1
@@ -0,0 +1,117 @@
+import csv
+import itertools
+import os
+
+# ================== 帧存储 ==================
+INDEX_NAME = "frame_index.csv"  # 帧索引文件名
+
+
+class FrameStore:
+    """
+    按帧号区间分子目录存放帧序列，并写出帧号/时间戳到路径的索引文件。
+
+    帧号补零位数由总帧数决定（至少 4 位），保证任意长度的活动都能按文件名正确排序；
+    每 shard_size 帧放入一个子目录（如 "00000-00999"），shard_size 为 0 时所有帧放在同一目录。
+    """
+
+    def __init__(self, root, prefix, total_frames, shard_size=1000, ext="png"):
+        self.root = root
+        self.prefix = prefix
+        self.total_frames = total_frames
+        self.shard_size = shard_size
+        self.ext = ext
+        self.width = max(4, len(str(max(total_frames - 1, 0))))
+
+    def shard_name(self, frame_num):
+        """帧所在子目录名"""
+        if not self.shard_size:
+            return ""
+        start = frame_num // self.shard_size * self.shard_size
+        end = min(start + self.shard_size, self.total_frames) - 1
+        return f"{start:0{self.width}d}-{end:0{self.width}d}"
+
+    def relpath(self, frame_num):
+        """帧相对于存储根目录的路径"""
+        return os.path.join(self.shard_name(frame_num), f"{self.prefix}{frame_num:0{self.width}d}.{self.ext}")
+
+    def path(self, frame_num):
+        return os.path.join(self.root, self.relpath(frame_num))
+
+    def make_dirs(self):
+        """预先创建所有子目录，避免渲染进程重复检查"""
+        os.makedirs(self.root, exist_ok=True)
+        if self.shard_size:
+            for start in range(0, self.total_frames, self.shard_size):
+                os.makedirs(os.path.join(self.root, self.shard_name(start)), exist_ok=True)
+
+    def write_index(self, timestamps=None, frame_nums=None, name=INDEX_NAME):
+        """
+        写出帧索引文件（frame,timestamp,path），路径相对于存储根目录。
+
+        逐行写入临时文件后再重命名，不在内存中拼接整个索引。
+
+        :param timestamps: 可选的时间戳序列（列表或 load_frame_timestamps 返回的 TimestampColumn），
+                           长度与采样点数一致；帧数多于采样点数（如插值轨迹）时按比例对应。
+        :param frame_nums: 要写入的帧号（升序），默认全部帧。
+        :param name: 索引文件名，分片渲染时写出各自的分片索引。
+        """
+        frame_nums = range(self.total_frames) if frame_nums is None else frame_nums
+        path = os.path.join(self.root, name)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(["frame", "timestamp", "path"])
+            for frame_num, timestamp in zip(frame_nums, _frame_timestamps(timestamps, frame_nums, self.total_frames)):
+                writer.writerow([frame_num, timestamp, self.relpath(frame_num).replace(os.sep, "/")])
+        os.replace(tmp_path, path)
+
+
+def _frame_timestamps(timestamps, frame_nums, total_frames):
+    """按升序帧号依次给出对应的时间戳，只向前遍历一次时间戳序列"""
+    count = len(timestamps) if timestamps else 0
+    if not count:
+        yield from itertools.repeat("")
+        return
+    ratio = (total_frames - 1) / (count - 1) if total_frames > 1 and count > 1 else None
+    values = iter(timestamps)
+    current, position = next(values), 0
+    for frame_num in frame_nums:
+        target = min(int(frame_num / ratio), count - 1) if ratio else 0
+        while position < target:
+            current, position = next(values), position + 1
+        yield current
+
+
+class TimestampColumn:
+    """转换后的日期与时间文件的惰性视图：len() 流式计数，迭代时逐行组合为 YYYY/MM/DD HH:MM:SS"""
+
+    def __init__(self, day_path, time_path):
+        self.day_path = day_path
+        self.time_path = time_path
+        self._count = None
+
+    def __len__(self):
+        if self._count is None:
+            with open(self.day_path, "r") as f:
+                self._count = sum(1 for _ in f)
+        return self._count
+
+    def __iter__(self):
+        with open(self.day_path, "r") as f_day, open(self.time_path, "r") as f_time:
+            for day, clock in zip(csv.reader(f_day), csv.reader(f_time)):
+                yield f"{day[0]} {clock[0]}"
+
+
+def load_frame_timestamps(input_folder_path, day_file="DateDay.csv", time_file="DateTime.csv"):
+    """返回转换后日期与时间的 TimestampColumn；文件不存在时返回 None"""
+    day_path = os.path.join(input_folder_path, day_file)
+    time_path = os.path.join(input_folder_path, time_file)
+    if not (os.path.exists(day_path) and os.path.exists(time_path)):
+        return None
+    return TimestampColumn(day_path, time_path)
+
+
+def read_index(root):
+    """读取帧索引，返回 {帧号: (时间戳, 绝对路径)}"""
+    with open(os.path.join(root, INDEX_NAME), "r", encoding="utf-8") as f:
+        return {int(row["frame"]): (row["timestamp"], os.path.join(root, row["path"])) for row in csv.DictReader(f)}
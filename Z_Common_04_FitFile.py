@@ -0,0 +1,195 @@
+import datetime
+import os
+import struct
+
+import numpy as np
+
+# ================== FIT 文件常量 ==================
+FIT_EPOCH = datetime.datetime(1989, 12, 31, tzinfo=datetime.timezone.utc)  # FIT 时间戳起点
+SEMICIRCLES_PER_DEGREE = 2**31 / 180  # 经纬度：度 -> semicircles
+CRC_CHUNK_SIZE = 1 << 16  # 校验 CRC 时每次读取的字节数
+
+# record 消息字段: 名称 -> (字段号, numpy 类型, FIT 基础类型, 缩放, 偏移)
+RECORD_FIELDS = {
+    "timestamp": (253, "<u4", 0x86, 1, 0),
+    "position_lat": (0, "<i4", 0x85, SEMICIRCLES_PER_DEGREE, 0),
+    "position_long": (1, "<i4", 0x85, SEMICIRCLES_PER_DEGREE, 0),
+    "distance": (5, "<u4", 0x86, 100, 0),
+    "enhanced_speed": (73, "<u4", 0x86, 1000, 0),
+    "enhanced_altitude": (78, "<u4", 0x86, 5, 500),
+    "heart_rate": (3, "u1", 0x02, 1, 0),
+    "cadence": (4, "u1", 0x02, 1, 0),
+    "fractional_cadence": (53, "u1", 0x02, 128, 0),
+    "power": (7, "<u2", 0x84, 1, 0),
+    "vertical_oscillation": (39, "<u2", 0x84, 10, 0),
+    "stance_time": (41, "<u2", 0x84, 10, 0),
+    "vertical_ratio": (83, "<u2", 0x84, 100, 0),
+    "step_length": (85, "<u2", 0x84, 10, 0),
+}
+
+# 传感器组合 -> 对应的 record 字段
+SENSOR_FIELDS = {
+    "gps": ["position_lat", "position_long", "distance", "enhanced_speed"],
+    "altitude": ["enhanced_altitude"],
+    "heart_rate": ["heart_rate"],
+    "cadence": ["cadence", "fractional_cadence"],
+    "power": ["power"],
+    "running_dynamics": ["vertical_oscillation", "stance_time", "vertical_ratio", "step_length"],
+}
+ALL_SENSORS = tuple(SENSOR_FIELDS)
+
+
+# ================== CRC ==================
+def _build_crc_table():
+    """FIT 协议的 CRC-16（多项式 0xA001，反射），展开为按字节查表"""
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+_CRC_TABLE = _build_crc_table()
+
+
+def fit_crc16(data, crc=0):
+    """计算 FIT 协议使用的 CRC-16"""
+    table = _CRC_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+class FitValidationError(ValueError):
+    """FIT 文件不完整或已损坏（文件头、长度或 CRC 校验失败）"""
+
+
+def validate_fit(path, check_crc=True):
+    """
+    只检查文件头、数据长度与 CRC，不解码任何消息，用于在解码前廉价地排除截断或损坏的下载。
+
+    :param check_crc: False 时只检查文件头与长度（截断的文件长度不足），不读取数据区。
+    :return: 错误描述，文件完整时返回 None。
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.read(14)
+        if len(header) < 12:
+            return f"文件过短（{size} 字节）"
+        header_size = header[0]
+        if header_size not in (12, 14) or len(header) < header_size or header[8:12] != b".FIT":
+            return "不是 FIT 文件（文件头无效）"
+        data_size = struct.unpack_from("<I", header, 4)[0]
+        expected = header_size + data_size + 2
+        if size < expected:
+            return f"文件被截断（应至少为 {expected} 字节，实际 {size} 字节）"
+        if not check_crc:
+            return None
+
+        if header_size == 14:
+            header_crc = struct.unpack_from("<H", header, 12)[0]
+            if header_crc and header_crc != fit_crc16(header[:12]):
+                return "文件头 CRC 校验失败"
+        # 文件 CRC 覆盖文件头与数据区（含文件头 CRC）
+        f.seek(0)
+        crc, remaining = 0, header_size + data_size
+        while remaining:
+            chunk = f.read(min(CRC_CHUNK_SIZE, remaining))
+            crc = fit_crc16(chunk, crc)
+            remaining -= len(chunk)
+        file_crc = struct.unpack("<H", f.read(2))[0]
+        if crc != file_crc:
+            return f"文件 CRC 校验失败（计算值 0x{crc:04X}，记录值 0x{file_crc:04X}）"
+    return None
+
+
+# ================== 合成 FIT 活动 ==================
+def synthetic_samples(duration, sample_rate=1.0, start_time=None, seed=0):
+    """
+    生成一段模拟跑步活动的采样数据（物理单位），用于基准测试。
+
+    :param duration: 活动时长(秒)。
+    :param sample_rate: 采样率(Hz)。
+    :param start_time: 开始时间（带时区的 datetime），默认 2024-05-01 00:00 UTC。
+    :param seed: 随机种子，保证结果可复现。
+    :return: {字段名: numpy 数组}。
+    """
+    rng = np.random.default_rng(seed)
+    start_time = start_time or datetime.datetime(2024, 5, 1, tzinfo=datetime.timezone.utc)
+    n = max(int(duration * sample_rate), 2)
+    t = np.arange(n) / sample_rate
+
+    speed = np.clip(3.0 + 0.3 * np.sin(t / 120) + rng.normal(0, 0.1, n), 0.5, None)  # m/s
+    distance = np.concatenate([[0.0], np.cumsum(speed[1:] / sample_rate)])
+    # 沿一个近似圆形的路线前进
+    radius = max(distance[-1], 1.0) / (2 * np.pi)
+    theta = distance / radius
+    lat = 31.2 + radius * np.sin(theta) / 111320
+    lon = 121.4 + radius * (1 - np.cos(theta)) / (111320 * np.cos(np.radians(31.2)))
+    cadence_spm = 170 + 6 * np.sin(t / 60) + rng.normal(0, 1, n)
+
+    return {
+        "timestamp": (start_time - FIT_EPOCH).total_seconds() + np.floor(t),
+        "position_lat": lat,
+        "position_long": lon,
+        "distance": distance,
+        "enhanced_speed": speed,
+        "enhanced_altitude": 10 + 5 * np.sin(t / 300),
+        "heart_rate": np.clip(120 + 40 * (1 - np.exp(-t / 300)) + rng.normal(0, 2, n), 60, 200),
+        "cadence": np.floor(cadence_spm / 2),
+        "fractional_cadence": cadence_spm / 2 - np.floor(cadence_spm / 2),
+        "power": np.clip(250 + 30 * np.sin(t / 90) + rng.normal(0, 10, n), 0, None),
+        "vertical_oscillation": 80 + rng.normal(0, 3, n),
+        "stance_time": 250 + rng.normal(0, 5, n),
+        "vertical_ratio": 8 + rng.normal(0, 0.3, n),
+        "step_length": 1100 + rng.normal(0, 20, n),
+    }
+
+
+def _definition_message(local_type, global_num, fields):
+    body = struct.pack("<BBHB", 0, 0, global_num, len(fields))
+    for num, dtype, base_type in fields:
+        body += struct.pack("BBB", num, np.dtype(dtype).itemsize, base_type)
+    return bytes([0x40 | local_type]) + body
+
+
+def write_synthetic_fit(path, duration, sample_rate=1.0, sensors=ALL_SENSORS, seed=0):
+    """
+    写出一个合成的 FIT 活动文件（file_id + record 消息），可被 fitparse 正常解析。
+
+    :param path: 输出文件路径。
+    :param duration: 活动时长(秒)。
+    :param sample_rate: 采样率(Hz)。
+    :param sensors: 包含的传感器组合，取自 SENSOR_FIELDS 的键。
+    :param seed: 随机种子。
+    :return: 写入的 record 数量。
+    """
+    for sensor in sensors:
+        if sensor not in SENSOR_FIELDS:
+            raise ValueError(f"未知的传感器类型: {sensor}")
+    names = ["timestamp"] + [name for sensor in sensors for name in SENSOR_FIELDS[sensor]]
+    samples = synthetic_samples(duration, sample_rate, seed=seed)
+    n = len(samples["timestamp"])
+
+    # file_id 消息
+    data = _definition_message(0, 0, [(0, "u1", 0x00), (1, "<u2", 0x84), (4, "<u4", 0x86)])
+    data += bytes([0]) + struct.pack("<BHI", 4, 1, int(samples["timestamp"][0]))
+
+    # record 定义 + 向量化打包所有数据消息
+    data += _definition_message(1, 20, [(RECORD_FIELDS[name][0], RECORD_FIELDS[name][1], RECORD_FIELDS[name][2]) for name in names])
+    records = np.zeros(n, dtype=[("header", "u1")] + [(name, RECORD_FIELDS[name][1]) for name in names])
+    records["header"] = 1
+    for name in names:
+        _, dtype, _, scale, offset = RECORD_FIELDS[name]
+        records[name] = np.round((samples[name] + offset) * scale).astype(dtype)
+    data += records.tobytes()
+
+    header = struct.pack("<BBHI4s", 14, 0x20, 2132, len(data), b".FIT")
+    header += struct.pack("<H", fit_crc16(header))
+    with open(path, "wb") as f:
+        f.write(header)
+        f.write(data)
+        f.write(struct.pack("<H", fit_crc16(data, fit_crc16(header))))
+    return n
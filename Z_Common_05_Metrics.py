@@ -0,0 +1,297 @@
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from Z_Common_02_FrameRunner import atomic_write_bytes
+
+# ================== 配置参数 ==================
+METRICS_DIR_ENV = "GARMIN_METRICS_DIR"  # 设置后各阶段把指标 JSON 写入该目录
+PROFILE_ENV = "GARMIN_PROFILE"  # "cprofile" 或 "pyspy"，开启性能剖析
+PROFILE_WAIT_ENV = "GARMIN_PROFILE_WAIT"  # pyspy 模式下等待附加的秒数
+HISTOGRAM_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)  # 帧耗时直方图分桶(秒)
+FRAME_PHASES = ("font_load", "draw", "composite", "snapshot", "backpressure_encode", "encode", "backpressure_write", "write")  # 单帧渲染的阶段（backpressure_* 为流水线队列满时的等待时间）
+
+
+# ================== 单帧计时 ==================
+class FrameTimer:
+    """
+    按阶段累计单帧耗时。每次 lap(phase) 把距上一次打点的时间计入该阶段，
+    结果是普通字典，可以从进程池返回给主进程汇总。
+    """
+
+    __slots__ = ("timings", "_last")
+
+    def __init__(self):
+        self.timings = {}
+        self._last = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.timings[phase] = self.timings.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    def add(self, key, value):
+        """记录非时间类的数值（如写入字节数）"""
+        self.timings[key] = self.timings.get(key, 0) + value
+
+    def as_dict(self):
+        return self.timings
+
+
+class Histogram:
+    """Prometheus 风格的累计直方图"""
+
+    def __init__(self, buckets=HISTOGRAM_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def to_dict(self):
+        cumulative = []
+        total = 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            total += count
+            cumulative.append([bound, total])
+        return {"count": self.count, "sum": round(self.sum, 6), "buckets": cumulative}
+
+
+# ================== 阶段指标 ==================
+def _cpu_seconds():
+    """本进程及已回收子进程（如进程池工作进程）的 CPU 时间"""
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def _peak_rss_bytes():
+    """本进程与已回收子进程的峰值内存(字节)"""
+    if resource is not None:
+        scale = 1 if sys.platform == "darwin" else 1024
+        self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+        children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+        return self_rss, children_rss
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss), 0
+    return 0, 0
+
+
+def _io_bytes():
+    """本进程读写的字节数，优先使用 /proc/self/io"""
+    try:
+        with open("/proc/self/io", "r") as f:
+            values = dict(line.split(": ") for line in f.read().splitlines())
+        return int(values["rchar"]), int(values["wchar"])
+    except (OSError, KeyError, ValueError):
+        pass
+    if psutil is not None:
+        try:
+            counters = psutil.Process().io_counters()
+            return counters.read_bytes, counters.write_bytes
+        except (AttributeError, psutil.Error):
+            pass
+    return 0, 0
+
+
+class Metrics:
+    """
+    一个阶段脚本的运行指标：阶段与每个活动的墙钟/CPU 时间、逐帧分阶段耗时直方图、
+    峰值内存与读写字节数。设置环境变量 GARMIN_METRICS_DIR 后在结束时导出 JSON。
+    """
+
+    def __init__(self, stage, output_dir=None):
+        self.stage = stage
+        self.output_dir = output_dir if output_dir is not None else os.getenv(METRICS_DIR_ENV)
+        self.activities = {}
+        self.frame_histograms = {}
+        self.frames = 0
+        self.frame_bytes_written = 0
+        self.worker_bytes_written = 0  # 其中由工作进程写出的字节数（不计入本进程的 /proc/self/io）
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self._lock = threading.Lock()  # 调度器并发执行多个活动时，多个线程同时汇总
+
+    @property
+    def enabled(self):
+        return bool(self.output_dir)
+
+    @contextlib.contextmanager
+    def activity(self, name):
+        """统计单个活动的墙钟与 CPU 时间（多个活动并发执行时，CPU 时间是整个进程在该时段内的增量）"""
+        wall_start, cpu_start = time.perf_counter(), _cpu_seconds()
+        try:
+            yield
+        finally:
+            with self._lock:
+                entry = self.activities.setdefault(str(name), {"wall_s": 0.0, "cpu_s": 0.0})
+                entry["wall_s"] += time.perf_counter() - wall_start
+                entry["cpu_s"] += _cpu_seconds() - cpu_start
+
+    def record_frame(self, timings, in_worker_process=False):
+        """
+        汇总单帧计时。
+
+        :param in_worker_process: 该帧是否在工作进程中渲染；本进程（线程池或串行）写出的字节
+                                  已包含在 /proc/self/io 中，只有工作进程写出的字节需要另外累加。
+        """
+        if not timings:
+            return
+        with self._lock:
+            self.frames += 1
+            for phase, value in timings.items():
+                if phase == "bytes_written":
+                    self.frame_bytes_written += value
+                    if in_worker_process:
+                        self.worker_bytes_written += value
+                    continue
+                histogram = self.frame_histograms.get(phase)
+                if histogram is None:
+                    histogram = self.frame_histograms[phase] = Histogram()
+                histogram.observe(value)
+
+    @contextlib.contextmanager
+    def run(self):
+        """统计整个阶段，按需开启性能剖析，结束时导出指标"""
+        wall_start, cpu_start = time.perf_counter(), _cpu_seconds()
+        try:
+            with profile_hook(self.stage, self.output_dir):
+                yield self
+        finally:
+            self.wall_s = time.perf_counter() - wall_start
+            self.cpu_s = _cpu_seconds() - cpu_start
+            if self.enabled:
+                self.export()
+
+    def to_dict(self):
+        self_rss, children_rss = _peak_rss_bytes()
+        read_bytes, written_bytes = _io_bytes()
+        return {
+            "stage": self.stage,
+            "pid": os.getpid(),
+            "wall_s": round(self.wall_s, 6),
+            "cpu_s": round(self.cpu_s, 6),
+            "peak_rss_bytes": self_rss,
+            "peak_rss_children_bytes": children_rss,
+            "read_bytes": read_bytes,
+            "written_bytes": written_bytes + self.worker_bytes_written,
+            "activities": {k: {kk: round(vv, 6) for kk, vv in v.items()} for k, v in self.activities.items()},
+            "frames": self.frames,
+            "frame_phases": {phase: h.to_dict() for phase, h in self.frame_histograms.items()},
+        }
+
+    def export(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"{self.stage}.json")
+        atomic_write_bytes(json.dumps(self.to_dict(), ensure_ascii=False, indent=2).encode("utf-8"), path)
+        return path
+
+
+# ================== 性能剖析 ==================
+@contextlib.contextmanager
+def profile_hook(stage, output_dir=None):
+    """
+    可选的性能剖析钩子，由环境变量 GARMIN_PROFILE 开启：
+    "cprofile" 时把 cProfile 结果写入 <输出目录>/<阶段>.prof；
+    "pyspy" 时打印 py-spy 附加命令，并等待 GARMIN_PROFILE_WAIT 秒后再开始执行。
+    """
+    mode = os.getenv(PROFILE_ENV, "").lower()
+    if mode == "cprofile":
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            out_dir = output_dir or "."
+            os.makedirs(out_dir, exist_ok=True)
+            profiler.dump_stats(os.path.join(out_dir, f"{stage}.prof"))
+        return
+    if mode == "pyspy":
+        out_dir = output_dir or "."
+        print(f"py-spy record -o {os.path.join(out_dir, stage)}.svg --subprocesses --pid {os.getpid()}", flush=True)
+        time.sleep(float(os.getenv(PROFILE_WAIT_ENV, "0")))
+    yield
+
+
+# ================== 报告导出 ==================
+def load_reports(metrics_dir):
+    """读取目录下所有阶段的指标 JSON"""
+    reports = []
+    for name in sorted(os.listdir(metrics_dir)):
+        if name.endswith(".json") and name != "report.json":
+            with open(os.path.join(metrics_dir, name), "r", encoding="utf-8") as f:
+                reports.append(json.load(f))
+    return reports
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def prometheus_text(reports, prefix="garmin"):
+    """把阶段报告转换为 Prometheus textfile 格式"""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{k}="{_label(v)}"' for k, v in labels.items())
+            lines.append(f"{prefix}_{name}{{{label_text}}} {value}")
+
+    metric("stage_wall_seconds", "gauge", "Stage wall-clock time.", [({"stage": r["stage"]}, r["wall_s"]) for r in reports])
+    metric("stage_cpu_seconds", "gauge", "Stage CPU time including reaped workers.", [({"stage": r["stage"]}, r["cpu_s"]) for r in reports])
+    metric("stage_peak_rss_bytes", "gauge", "Peak resident set size.",
+           [({"stage": r["stage"], "scope": "self"}, r["peak_rss_bytes"]) for r in reports]
+           + [({"stage": r["stage"], "scope": "children"}, r["peak_rss_children_bytes"]) for r in reports])
+    metric("stage_read_bytes", "gauge", "Bytes read by the stage.", [({"stage": r["stage"]}, r["read_bytes"]) for r in reports])
+    metric("stage_written_bytes", "gauge", "Bytes written by the stage.", [({"stage": r["stage"]}, r["written_bytes"]) for r in reports])
+    metric("activity_wall_seconds", "gauge", "Per-activity wall-clock time.",
+           [({"stage": r["stage"], "activity": a}, v["wall_s"]) for r in reports for a, v in r["activities"].items()])
+    metric("activity_cpu_seconds", "gauge", "Per-activity CPU time.",
+           [({"stage": r["stage"], "activity": a}, v["cpu_s"]) for r in reports for a, v in r["activities"].items() if "cpu_s" in v])
+
+    name = f"{prefix}_frame_phase_seconds"
+    lines.append(f"# HELP {name} Per-frame render time by phase.")
+    lines.append(f"# TYPE {name} histogram")
+    for r in reports:
+        for phase, h in r["frame_phases"].items():
+            for bound, count in h["buckets"]:
+                lines.append(f'{name}_bucket{{stage="{_label(r["stage"])}",phase="{phase}",le="{bound}"}} {count}')
+            lines.append(f'{name}_sum{{stage="{_label(r["stage"])}",phase="{phase}"}} {h["sum"]}')
+            lines.append(f'{name}_count{{stage="{_label(r["stage"])}",phase="{phase}"}} {h["count"]}')
+    return "\n".join(lines) + "\n"
+
+
+def write_report(metrics_dir, prometheus_path=None):
+    """合并各阶段指标为 report.json，并可选写出 Prometheus textfile"""
+    reports = load_reports(metrics_dir)
+    report_path = os.path.join(metrics_dir, "report.json")
+    atomic_write_bytes(json.dumps({"stages": reports}, ensure_ascii=False, indent=2).encode("utf-8"), report_path)
+    if prometheus_path:
+        atomic_write_bytes(prometheus_text(reports).encode("utf-8"), prometheus_path)
+    return report_path
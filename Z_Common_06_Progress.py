@@ -0,0 +1,109 @@
+import json
+import os
+import sys
+import time
+
+# ================== 配置参数 ==================
+PROGRESS_FORMAT_ENV = "GARMIN_PROGRESS"  # 覆盖进度输出格式: "text"、"json" 或 "off"
+PROGRESS_INTERVAL_ENV = "GARMIN_PROGRESS_INTERVAL"  # 覆盖进度输出间隔(秒)
+PROGRESS_FILE_ENV = "GARMIN_PROGRESS_FILE"  # 设置后 JSON 进度追加写入该文件，而不是标准输出
+RATE_SMOOTHING = 0.3  # 速率指数平滑系数
+
+
+def _format_duration(seconds):
+    if seconds is None:
+        return "--:--:--"
+    seconds = int(seconds)
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours:02}:{minutes:02}:{seconds:02}"
+
+
+class ProgressReporter:
+    """
+    在主进程中统计成功与失败的帧数，按固定间隔输出进度、帧率与预计剩余时间（只按成功的帧计算）。
+
+    计数由主进程在收到每个任务结果时完成，工作进程无需任何同步，不增加渲染开销。
+    输出格式为 "text"（人类可读）或 "json"（每行一个 JSON 事件，便于接入任务面板）。
+    """
+
+    def __init__(self, label, total, initial=0, interval=2.0, fmt="text"):
+        self.label = label
+        self.total = total
+        self.done = initial
+        self.failed = 0
+        self.initial = initial
+        self.interval = float(os.getenv(PROGRESS_INTERVAL_ENV, interval))
+        self.fmt = os.getenv(PROGRESS_FORMAT_ENV, fmt)
+        self.start_time = time.monotonic()
+        self._last_emit = self.start_time
+        self._last_done = initial
+        self._rate = None
+        self.emit("running")
+
+    def update(self, n=1, failed=False):
+        """记录成功（或失败）的帧，到达输出间隔时输出一次进度"""
+        if failed:
+            self.failed += n
+        else:
+            self.done += n
+        now = time.monotonic()
+        if now - self._last_emit >= self.interval:
+            self._update_rate(now)
+            self.emit("running")
+
+    def _update_rate(self, now):
+        elapsed = now - self._last_emit
+        if elapsed <= 0:
+            return
+        instant = (self.done - self._last_done) / elapsed
+        self._rate = instant if self._rate is None else RATE_SMOOTHING * instant + (1 - RATE_SMOOTHING) * self._rate
+        self._last_emit = now
+        self._last_done = self.done
+
+    def finish(self):
+        status = "failed" if self.failed else "done"
+        self.emit(status)
+        return status
+
+    def snapshot(self, status):
+        elapsed = time.monotonic() - self.start_time
+        average = (self.done - self.initial) / elapsed if elapsed > 0 else 0.0
+        rate = self._rate if self._rate is not None else average
+        remaining = self.total - self.done - self.failed
+        return {
+            "event": "progress",
+            "label": self.label,
+            "status": status,
+            "done": self.done,
+            "failed": self.failed,
+            "total": self.total,
+            "fps": round(rate, 2),
+            "avg_fps": round(average, 2),
+            "elapsed_s": round(elapsed, 1),
+            "eta_s": round(remaining / rate, 1) if rate > 0 else None,
+            "time": time.time(),
+        }
+
+    def emit(self, status):
+        if self.fmt == "off":
+            return
+        snap = self.snapshot(status)
+        if self.fmt == "json":
+            line = json.dumps(snap, ensure_ascii=False)
+            progress_file = os.getenv(PROGRESS_FILE_ENV)
+            if progress_file:
+                with open(progress_file, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+                return
+        else:
+            percent = snap["done"] / snap["total"] * 100 if snap["total"] else 100.0
+            status_text = {"running": "生成中", "done": "已完成", "failed": "有失败帧"}[status]
+            line = (
+                f"[{self.label}] {status_text} {snap['done']}/{snap['total']} ({percent:.1f}%)"
+                f" {snap['fps']:.1f} 帧/秒 已用 {_format_duration(snap['elapsed_s'])}"
+                f" 预计剩余 {_format_duration(snap['eta_s'] if status == 'running' else 0)}"
+            )
+            if snap["failed"]:
+                line += f" 失败 {snap['failed']}"
+        print(line, file=sys.stdout, flush=True)
@@ -0,0 +1,42 @@
+import functools
+import os
+
+from PIL import ImageFont
+
+# ================== 配置参数 ==================
+FONT_CACHE_SIZE = 32  # 每个进程缓存的字体对象数量
+
+
+@functools.lru_cache(maxsize=FONT_CACHE_SIZE)
+def load_font(font_path, font_size):
+    """
+    加载并缓存字体。同一进程内相同的 (字体, 字号) 只解析一次字体文件，
+    常驻服务在派生工作进程前预加载后，工作进程可直接复用已加载的字体。
+    """
+    if not os.path.isfile(font_path):
+        raise FileNotFoundError(f"字体文件 {font_path} 不存在。")
+    return ImageFont.truetype(font_path, font_size)
+
+
+def draw_text_with_stroke(draw, position, text, font, fill, stroke_fill, stroke_width):
+    """
+    绘制带描边的文本：由 Pillow 栅格化一次字形并按描边宽度扩展出轮廓，描边与填充在同一次调用中合成，
+    绘制次数与描边宽度无关，轮廓各方向宽度一致。
+    """
+    draw.text(position, text, font=font, fill=fill, stroke_width=stroke_width, stroke_fill=stroke_fill)
+
+
+def preload_fonts(config):
+    """预加载配置中引用的全部字体（含 csv_configs 中的字体），返回加载的数量"""
+    fonts = set()
+    entries = [config] + list(config.get("csv_configs", []))
+    for entry in entries:
+        for key, value in entry.items():
+            if not key.endswith("font") or not isinstance(value, str):
+                continue
+            size_key = "font_size" if key in ("font", "start_font", "end_font") else f"{key}_size"
+            if size_key in entry:
+                fonts.add((value, entry[size_key]))
+    for font_path, font_size in fonts:
+        load_font(font_path, font_size)
+    return len(fonts)
@@ -0,0 +1,154 @@
+import concurrent.futures
+import heapq
+import itertools
+import os
+import signal
+import threading
+
+# ================== 配置参数 ==================
+MAX_WORKERS_ENV = "GARMIN_MAX_WORKERS"  # 覆盖 CPU 预算（工作进程数）
+IN_FLIGHT_FACTOR = 2  # 每个工作进程最多预先派发的任务数，保证工作进程不空闲又不过早占满队列
+COORDINATORS = 64  # 作业协调线程数（只等待依赖与派发帧，不占 CPU 预算）
+
+
+def _raise_system_exit(signum, frame):
+    raise SystemExit(128 + signum)
+
+
+def _cancel(future):
+    """取消尚未执行的 Future，并通知 as_completed / wait 中的等待者"""
+    future.cancel()
+    future.set_running_or_notify_cancel()
+
+
+class Job:
+    """
+    调度器中的一个作业。
+
+    :param name: 作业名称，用于依赖引用。
+    :param fn: 作业函数。
+    :param args: 传给作业函数的参数。
+    :param deps: 依赖的作业名称，全部成功后才开始执行。
+    :param priority: 优先级，数值越小越先执行（一般取活动的大小，小活动不必排在马拉松之后）。
+    :param inline: True 时在协调线程中执行（函数自身再向调度器派发帧任务），
+                   False 时作为一个任务放到工作进程中执行。
+    """
+
+    def __init__(self, name, fn, *args, deps=(), priority=0, inline=False):
+        self.name = name
+        self.fn = fn
+        self.args = args
+        self.deps = tuple(deps)
+        self.priority = priority
+        self.inline = inline
+
+
+class Scheduler:
+    """
+    全局调度器：持有一个常驻的进程池和线程池，按固定的 CPU 预算并发执行各阶段、各活动的任务。
+
+    任务先进入按优先级排序的队列，只有在执行中的任务少于预算时才派发给工作进程，
+    因此后提交的小活动可以插到大活动剩余的帧之前执行。工作进程在整个运行期间复用，
+    不再为每个活动重新创建进程池。
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = int(os.getenv(MAX_WORKERS_ENV) or max_workers or os.cpu_count() or 1)
+        self.max_in_flight = self.max_workers * IN_FLIGHT_FACTOR
+        self.process_pool = concurrent.futures.ProcessPoolExecutor(self.max_workers)
+        self.thread_pool = concurrent.futures.ThreadPoolExecutor(self.max_workers)
+        self.coordinators = concurrent.futures.ThreadPoolExecutor(COORDINATORS, thread_name_prefix="scheduler-job")
+        self._queue = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._closed = False
+        self._previous_handler = None
+
+    # ---------- 任务 ----------
+    def submit(self, fn, *args, priority=0, use_processes=True):
+        """
+        提交一个任务，返回 Future。
+
+        :param use_processes: True 时在工作进程中执行（参数需可 pickle），
+                              False 时在线程池中执行（适合共享大对象或不可 pickle 的任务）。
+        """
+        future = concurrent.futures.Future()
+        with self._lock:
+            if self._closed:
+                _cancel(future)
+                return future
+            heapq.heappush(self._queue, (priority, next(self._seq), fn, args, use_processes, future))
+            self._dispatch_locked()
+        return future
+
+    def _dispatch_locked(self):
+        while self._in_flight < self.max_in_flight and self._queue:
+            _, _, fn, args, use_processes, future = heapq.heappop(self._queue)
+            if not future.set_running_or_notify_cancel():
+                continue  # 已被取消
+            pool = self.process_pool if use_processes else self.thread_pool
+            try:
+                inner = pool.submit(fn, *args)
+            except RuntimeError as e:  # 进程池已关闭
+                future.set_exception(e)
+                continue
+            self._in_flight += 1
+            inner.add_done_callback(lambda inner, future=future: self._on_done(inner, future))
+
+    def _on_done(self, inner, future):
+        try:
+            future.set_result(inner.result())
+        except BaseException as e:
+            future.set_exception(e)
+        with self._lock:
+            self._in_flight -= 1
+            self._dispatch_locked()
+
+    # ---------- 作业 ----------
+    def _run_job(self, job, dep_futures):
+        for dep in dep_futures:
+            dep.result()  # 依赖失败时本作业也失败
+        if job.inline:
+            return job.fn(*job.args)
+        return self.submit(job.fn, *job.args, priority=job.priority).result()
+
+    def start_jobs(self, jobs):
+        """按依赖关系启动一组作业（依赖须排在前面），返回 {作业名称: Future}"""
+        futures = {}
+        for job in jobs:
+            dep_futures = [futures[name] for name in job.deps]
+            futures[job.name] = self.coordinators.submit(self._run_job, job, dep_futures)
+        return futures
+
+    def run_jobs(self, jobs):
+        """执行一组作业并等待全部结束，有作业失败时抛出第一个异常，否则返回 {作业名称: 结果}"""
+        futures = self.start_jobs(jobs)
+        concurrent.futures.wait(futures.values())
+        return {name: future.result() for name, future in futures.items()}
+
+    # ---------- 生命周期 ----------
+    def cancel_pending(self):
+        """取消所有尚未派发的任务，之后提交的任务直接取消"""
+        with self._lock:
+            self._closed = True
+            while self._queue:
+                _cancel(heapq.heappop(self._queue)[-1])
+
+    def shutdown(self):
+        self.cancel_pending()
+        self.coordinators.shutdown(wait=True)
+        self.thread_pool.shutdown(wait=True)
+        self.process_pool.shutdown(wait=True)
+
+    def __enter__(self):
+        # 被抢占时通常收到 SIGTERM，转换为 SystemExit 以便各渲染任务保存清单
+        if threading.current_thread() is threading.main_thread():
+            self._previous_handler = signal.signal(signal.SIGTERM, _raise_system_exit)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
+        if self._previous_handler is not None:
+            signal.signal(signal.SIGTERM, self._previous_handler)
+        return False
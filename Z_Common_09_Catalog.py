@@ -0,0 +1,266 @@
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+# ================== 配置参数 ==================
+CATALOG_ENV = "GARMIN_CATALOG"  # 覆盖活动目录数据库路径
+CATALOG_PATH = "./DataProcess/catalog.sqlite"  # 活动目录数据库路径
+HASH_CHUNK_SIZE = 1 << 20  # 计算文件哈希时每次读取的字节数
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS activities (
+    seq INTEGER PRIMARY KEY,            -- 本地活动编号，各阶段文件名中的 {i}
+    activity_id INTEGER UNIQUE,         -- Garmin activityId，本地导入的压缩包为 NULL
+    name TEXT,
+    activity_type TEXT,
+    start_time TEXT,                    -- 本地开始时间 YYYY-MM-DD HH:MM:SS
+    start_time_gmt TEXT,
+    duration REAL,
+    distance REAL,
+    archive TEXT UNIQUE,                -- A_OriginZIPData 中的压缩包文件名
+    archive_sha256 TEXT,
+    archive_size INTEGER,
+    metadata TEXT,                      -- 下载时的原始元数据 JSON
+    created REAL
+);
+CREATE INDEX IF NOT EXISTS idx_activities_start ON activities(start_time);
+CREATE INDEX IF NOT EXISTS idx_activities_type_start ON activities(activity_type, start_time);
+
+CREATE TABLE IF NOT EXISTS stages (
+    seq INTEGER NOT NULL REFERENCES activities(seq),
+    stage TEXT NOT NULL,                -- "A"、"B"、"C"、"D"、"E1"~"E5"、"F1"~"F4"、"F6"
+    status TEXT NOT NULL,               -- "running"、"done" 或 "failed"
+    output TEXT,
+    output_sha256 TEXT,
+    error TEXT,
+    updated REAL,
+    PRIMARY KEY (seq, stage)
+);
+CREATE INDEX IF NOT EXISTS idx_stages_status ON stages(stage, status);
+"""
+
+
+def catalog_path():
+    return os.getenv(CATALOG_ENV) or CATALOG_PATH
+
+
+def file_sha256(path):
+    """分块计算文件的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Catalog:
+    """
+    本地 SQLite 活动目录：记录每个活动的元数据、文件哈希和各阶段的处理状态。
+
+    活动编号 seq 在下载或首次导入时分配后不再改变，OriginZIPData{seq}、FITData{seq}、
+    CSVData{seq} 与 Activity{seq} 始终对应同一个活动；各阶段按索引查询活动列表，
+    不再依赖 os.listdir 的顺序。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or catalog_path()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    # ---------- 活动 ----------
+    def upsert_activity(self, activity):
+        """
+        按 Garmin activityId 登记或更新一个活动，返回其 seq。
+
+        :param activity: get_activities 返回的活动字典。
+        """
+        activity_type = activity.get("activityType")
+        if isinstance(activity_type, dict):
+            activity_type = activity_type.get("typeKey")
+        fields = {
+            "name": activity.get("activityName"),
+            "activity_type": activity_type,
+            "start_time": activity.get("startTimeLocal"),
+            "start_time_gmt": activity.get("startTimeGMT"),
+            "duration": activity.get("duration"),
+            "distance": activity.get("distance"),
+            "metadata": json.dumps(activity, ensure_ascii=False),
+        }
+        with self.conn:
+            row = self.conn.execute("SELECT seq FROM activities WHERE activity_id = ?", (activity["activityId"],)).fetchone()
+            if row:
+                self.conn.execute(
+                    f"UPDATE activities SET {', '.join(f'{k} = ?' for k in fields)} WHERE seq = ?",
+                    (*fields.values(), row["seq"]),
+                )
+                return row["seq"]
+            cursor = self.conn.execute(
+                f"INSERT INTO activities (activity_id, created, {', '.join(fields)}) VALUES (?, ?, {', '.join('?' * len(fields))})",
+                (activity["activityId"], time.time(), *fields.values()),
+            )
+            return cursor.lastrowid
+
+    def register_archive(self, archive_path, seq=None):
+        """
+        登记压缩包（记录文件名、大小与哈希），返回 seq。
+
+        :param seq: 已知的活动编号（下载时）；为 None 时按文件名查找，找不到则分配新的编号。
+        """
+        archive = os.path.basename(archive_path)
+        size = os.path.getsize(archive_path)
+        sha256 = file_sha256(archive_path)
+        with self.conn:
+            if seq is None:
+                row = self.conn.execute("SELECT seq FROM activities WHERE archive = ?", (archive,)).fetchone()
+                if row is None:
+                    cursor = self.conn.execute(
+                        "INSERT INTO activities (archive, archive_size, archive_sha256, created) VALUES (?, ?, ?, ?)",
+                        (archive, size, sha256, time.time()),
+                    )
+                    return cursor.lastrowid
+                seq = row["seq"]
+            self.conn.execute(
+                "UPDATE activities SET archive = ?, archive_size = ?, archive_sha256 = ? WHERE seq = ?",
+                (archive, size, sha256, seq),
+            )
+        return seq
+
+    def archive_of(self, seq):
+        """活动已登记的压缩包文件名，没有时返回 None"""
+        row = self.conn.execute("SELECT archive FROM activities WHERE seq = ?", (seq,)).fetchone()
+        return row["archive"] if row else None
+
+    def archive_owner(self, archive):
+        """登记了该压缩包文件名的活动编号，没有时返回 None"""
+        row = self.conn.execute("SELECT seq FROM activities WHERE archive = ?", (os.path.basename(archive),)).fetchone()
+        return row["seq"] if row else None
+
+    def register_archives(self, folder):
+        """登记文件夹中尚未入库的压缩包（按目录顺序分配编号，与旧的 enumerate 编号一致），返回新登记的数量"""
+        known = {row["archive"] for row in self.conn.execute("SELECT archive FROM activities WHERE archive IS NOT NULL")}
+        added = 0
+        for name in os.listdir(folder):
+            if name.endswith(".zip") and name not in known:
+                path = os.path.join(folder, name)
+                self.set_stage(self.register_archive(path), "A", "done", path)
+                added += 1
+        return added
+
+    def fill_start_time(self, seq, start_time):
+        """本地导入的活动没有元数据时，用解析出的第一个时间戳补全开始时间"""
+        with self.conn:
+            self.conn.execute("UPDATE activities SET start_time_gmt = ? WHERE seq = ? AND start_time_gmt IS NULL", (str(start_time), seq))
+            self.conn.execute("UPDATE activities SET start_time = ? WHERE seq = ? AND start_time IS NULL", (str(start_time), seq))
+
+    def activities(self, since=None, until=None, activity_type=None, stage_done=None):
+        """
+        按条件查询活动，按 seq 排序返回字典列表。
+
+        :param since: 开始时间下限（含），如 "2024-05-01"。
+        :param until: 开始时间上限（不含）。
+        :param activity_type: 活动类型，如 "running"。
+        :param stage_done: 只返回该阶段已完成的活动。
+        """
+        where, params = [], []
+        if since:
+            where.append("a.start_time >= ?")
+            params.append(since)
+        if until:
+            where.append("a.start_time < ?")
+            params.append(until)
+        if activity_type:
+            where.append("a.activity_type = ?")
+            params.append(activity_type)
+        join = ""
+        if stage_done:
+            join = "JOIN stages s ON s.seq = a.seq AND s.stage = ? AND s.status = 'done'"
+            params.insert(0, stage_done)
+        sql = f"SELECT a.* FROM activities a {join} {'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY a.seq"
+        return [dict(row) for row in self.conn.execute(sql, params)]
+
+    # ---------- 阶段状态 ----------
+    def set_stage(self, seq, stage, status, output=None, error=None):
+        output_sha256 = file_sha256(output) if status == "done" and output and os.path.isfile(output) else None
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO stages (seq, stage, status, output, output_sha256, error, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (seq, stage, status, output, output_sha256, error, time.time()),
+            )
+
+    def stage_status(self, seq, stage):
+        row = self.conn.execute("SELECT status FROM stages WHERE seq = ? AND stage = ?", (seq, stage)).fetchone()
+        return row["status"] if row else None
+
+    def stages(self, seq):
+        return {row["stage"]: row["status"] for row in self.conn.execute("SELECT stage, status FROM stages WHERE seq = ?", (seq,))}
+
+
+# ================== 各阶段脚本使用的辅助函数 ==================
+def catalog_exists():
+    return os.path.exists(catalog_path())
+
+
+def stage_inputs(previous_stage, folder, name_for, legacy_filter):
+    """
+    返回本阶段要处理的 [(seq, 输入名称)]。
+
+    有活动目录时查询上一阶段已完成的活动，输入名称由 name_for(活动记录) 给出；
+    没有活动目录时退回旧的 os.listdir + enumerate 编号。
+
+    :param previous_stage: 上一阶段名称，如 "B"。
+    :param folder: 输入文件夹。
+    :param name_for: 活动记录字典 -> 输入文件或文件夹名称。
+    :param legacy_filter: 旧行为下筛选目录项的函数，参数为名称。
+    """
+    if not catalog_exists():
+        return list(enumerate([f for f in os.listdir(folder) if legacy_filter(f)], start=1))
+    with Catalog() as catalog:
+        rows = catalog.activities(stage_done=previous_stage)
+    inputs = []
+    for row in rows:
+        name = name_for(row)
+        if os.path.exists(os.path.join(folder, name)):
+            inputs.append((row["seq"], name))
+        else:
+            print(f"活动 {row['seq']} 的输入 {name} 不存在，跳过")
+    return inputs
+
+
+@contextlib.contextmanager
+def track_stage(seq, stage, output=None):
+    """
+    在活动目录中记录一个活动某阶段的处理状态；没有活动目录时不做任何事。
+
+    抛出异常时记为失败；也可以在 with 块中设置 record["error"] 把没有抛出异常的结果记为失败。
+    """
+    record = {}
+    if not catalog_exists():
+        yield record
+        return
+    with Catalog() as catalog:
+        catalog.set_stage(seq, stage, "running")
+        try:
+            yield record
+        except BaseException as e:
+            catalog.set_stage(seq, stage, "failed", output, error=str(e))
+            raise
+        if record.get("error"):
+            catalog.set_stage(seq, stage, "failed", output, error=record["error"])
+        else:
+            catalog.set_stage(seq, stage, "done", output)
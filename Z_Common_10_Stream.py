@@ -0,0 +1,92 @@
+import csv
+import itertools
+import os
+
+import pandas as pd
+
+# ================== 配置参数 ==================
+CHUNK_ROWS_ENV = "GARMIN_CHUNK_ROWS"  # 覆盖每块处理的采样点数
+CHUNK_ROWS = 50000  # 每块处理的采样点数，内存占用只与块大小有关，与活动长度无关
+
+
+def chunk_rows():
+    return int(os.getenv(CHUNK_ROWS_ENV) or CHUNK_ROWS)
+
+
+# ================== 分块读写 ==================
+def read_csv_chunks(path, **kwargs):
+    """按块读取无标题行的 CSV，每块是一个 DataFrame（行索引在整个文件中连续），其余参数传给 pd.read_csv"""
+    return pd.read_csv(path, header=None, chunksize=chunk_rows(), **kwargs)
+
+
+class ChunkWriter:
+    """
+    把 DataFrame 块依次追加写入 CSV（无标题行、无索引），输出与一次性 to_csv 相同。
+
+    先写入临时文件，正常结束后再重命名，中途出错不会留下写了一半的输出。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.f = None
+
+    def write(self, df):
+        df.to_csv(self.f, index=False, header=False)
+
+    def __enter__(self):
+        self.f = open(self.tmp_path, "w", newline="", encoding="utf-8")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.f.close()
+        if exc_type is None:
+            os.replace(self.tmp_path, self.path)
+        else:
+            os.remove(self.tmp_path)
+        return False
+
+
+# ================== 单列 CSV ==================
+def column_summary(path):
+    """流式扫描单列 CSV，返回 (行数, 第一个值, 最后一个值)，值为字符串，空文件时为 (0, None, None)"""
+    rows, first, last = 0, None, None
+    with open(path, "r", newline="") as f:
+        for row in csv.reader(f):
+            if rows == 0:
+                first = row[0]
+            last = row[0]
+            rows += 1
+    return rows, first, last
+
+
+def read_column_windows(paths, frame_nums, size):
+    """
+    按行号窗口依次读取若干个行数相同的单列 CSV，只保留窗口内需要渲染的帧。
+
+    :param paths: 单列 CSV 路径列表。
+    :param frame_nums: 需要渲染的帧号（升序），帧号即行号。
+    :param size: 每个窗口的行数。
+    :return: 生成 (窗口起始行号, 窗口内的帧号列表, [各文件该窗口的值列表])。
+    """
+    pending = iter(frame_nums)
+    next_frame = next(pending, None)
+    files = [open(path, "r", newline="") for path in paths]
+    try:
+        readers = [csv.reader(f) for f in files]
+        start = 0
+        while next_frame is not None:
+            columns = [[row[0] for row in itertools.islice(reader, size)] for reader in readers]
+            if not columns or not columns[0]:
+                return
+            end = start + len(columns[0])
+            frames = []
+            while next_frame is not None and next_frame < end:
+                frames.append(next_frame)
+                next_frame = next(pending, None)
+            if frames:
+                yield start, frames, columns
+            start = end
+    finally:
+        for f in files:
+            f.close()
@@ -0,0 +1,277 @@
+import functools
+import queue
+import threading
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from Z_Common_02_FrameRunner import current_pipeline
+from Z_Common_07_Text import load_font
+
+# ================== 配置参数 ==================
+ATLAS_CHARSET = "0123456789:/.- "  # 字形图集包含的字符（计时、时钟、日期等数字文本），含其他字符的文本完整排版
+ATLAS_CACHE_SIZE = 16  # 每个进程缓存的字形图集数量（每种字体、字号、颜色与描边组合一个）
+
+# ================== 合成引擎 ==================
+_local = threading.local()  # 每个线程（工作进程）各自复用的帧缓冲区与缓冲区环
+
+
+class Sprite:
+    """
+    图块：由 RGBA 图片生成一次预乘 alpha 的像素，之后可以反复合成到帧缓冲区中。
+
+    只保存 alpha 不为 0 的最小矩形区域，offset 为该区域相对原图左上角的偏移。
+    """
+
+    def __init__(self, img):
+        img = img.convert("RGBA")
+        bbox = img.getbbox() or (0, 0, 0, 0)
+        self.offset = bbox[:2]
+        self.rgba = np.asarray(img.crop(bbox), dtype=np.uint8).copy()  # 原始像素，合成到透明区域时直接写入
+        self.rgba[self.rgba[..., 3] == 0] = 0  # 完全透明的像素统一为 (0, 0, 0, 0)
+        self.height, self.width = self.rgba.shape[:2]
+
+    @classmethod
+    def from_array(cls, rgba, offset=(0, 0)):
+        """由已经拼好的 RGBA 像素（完全透明的像素为 0）直接生成图块，不经过 PIL 图片"""
+        sprite = cls.__new__(cls)
+        sprite.offset = offset
+        sprite.rgba = rgba
+        sprite.height, sprite.width = rgba.shape[:2]
+        return sprite
+
+    # 预乘像素只在第一次与非透明区域混合时计算，只合成到透明区域的图块（如文字）不占用额外内存
+    @functools.cached_property
+    def alpha(self):
+        return self.rgba[..., 3:4].astype(np.float32) / 255
+
+    @functools.cached_property
+    def premultiplied(self):
+        return self.rgba[..., :3] * self.alpha
+
+
+class FrameBuffer:
+    """
+    预分配的 RGBA 帧缓冲区（非预乘），各帧复用同一块内存。
+
+    每帧开始时调用 clear() 只清除上一帧合成过的区域；image() 返回与缓冲区共享内存的 PIL 图片。
+    异步编码时由 FrameBufferRing 轮流提供缓冲区，编码完成前不会被下一帧复用，编码器读取时不复制像素。
+    """
+
+    def __init__(self, size, background=(0, 0, 0, 0)):
+        self.size = tuple(size)
+        self.background = np.array(background, dtype=np.uint8)
+        self.array = np.empty((self.size[1], self.size[0], 4), dtype=np.uint8)
+        self.array[:] = self.background
+        self.dirty = []  # 上次清除后合成过的区域 (x0, y0, x1, y1)
+
+    def clear(self):
+        """把上一帧合成过的区域恢复为背景色"""
+        for x0, y0, x1, y1 in self.dirty:
+            self.array[y0:y1, x0:x1] = self.background
+        self.dirty = []
+
+    def composite(self, sprite, position, clip=None):
+        """
+        把图块以 "over" 方式合成到 position（图块原图左上角）处，超出画面的部分被裁剪。
+
+        源为预乘 alpha，只在图块覆盖的区域内计算；目标区域完全透明时直接写入源像素。
+
+        :param clip: 可选的画面坐标矩形 (x0, y0, x1, y1)，只合成图块落在其中的部分。
+        """
+        x0 = int(position[0]) + sprite.offset[0]
+        y0 = int(position[1]) + sprite.offset[1]
+        x1, y1 = x0 + sprite.width, y0 + sprite.height
+        bounds = (0, 0) + self.size if clip is None else clip
+        cx0, cy0 = max(x0, bounds[0], 0), max(y0, bounds[1], 0)
+        cx1, cy1 = min(x1, bounds[2], self.size[0]), min(y1, bounds[3], self.size[1])
+        if cx0 >= cx1 or cy0 >= cy1:
+            return
+        region = self.array[cy0:cy1, cx0:cx1]
+        crop = (slice(cy0 - y0, cy1 - y0), slice(cx0 - x0, cx1 - x0))
+        self.dirty.append((cx0, cy0, cx1, cy1))
+        if not region[..., 3].any():
+            region[:] = sprite.rgba[crop]
+            return
+
+        src_rgb = sprite.premultiplied[crop]
+        src_a = sprite.alpha[crop]
+        dst_a = region[..., 3:4].astype(np.float32) / 255
+
+        out_a = src_a + dst_a * (1 - src_a)
+        out_rgb = src_rgb + region[..., :3] * dst_a * (1 - src_a)
+        np.divide(out_rgb, out_a, out=out_rgb, where=out_a > 0)
+        region[..., :3] = np.clip(out_rgb + 0.5, 0, 255)
+        region[..., 3:4] = np.clip(out_a * 255 + 0.5, 0, 255)
+
+    def image(self):
+        """与缓冲区共享内存的 PIL 图片（只读视图，下一帧 clear() 后内容会改变）"""
+        return Image.frombuffer("RGBA", self.size, self.array, "raw", "RGBA", 0, 1)
+
+
+class FrameBufferRing:
+    """
+    预分配的一组帧缓冲区：渲染线程取出空闲的缓冲区，编码线程编码完成后归还。
+
+    没有空闲缓冲区时渲染线程阻塞，与编码队列满时的背压相同。
+    """
+
+    def __init__(self, count, size, background=(0, 0, 0, 0)):
+        self.free = queue.SimpleQueue()
+        for _ in range(count):
+            self.free.put(FrameBuffer(size, background))
+
+    def acquire(self):
+        return self.free.get()
+
+    def release(self, buffer):
+        self.free.put(buffer)
+
+
+def frame_buffer(size, background=(0, 0, 0, 0), timer=None):
+    """
+    取得当前线程可复用的帧缓冲区并清除上一帧的内容。
+
+    在异步编码的帧任务中（见 Z_Common_02_FrameRunner.FramePipeline）从本线程的缓冲区环中取出空闲的缓冲区，
+    编码完成后自动归还；否则每帧复用同一个缓冲区。
+
+    :param timer: 可选的 FrameTimer，等待空闲缓冲区的时间计入 backpressure_encode。
+    """
+    key = (tuple(size), tuple(background))
+    pipeline = current_pipeline()
+    if pipeline is None:
+        buffers = getattr(_local, "buffers", None)
+        if buffers is None:
+            buffers = _local.buffers = {}
+        buffer = buffers.get(key)
+        if buffer is None:
+            buffer = buffers[key] = FrameBuffer(size, background)
+    else:
+        rings = getattr(_local, "rings", None)
+        if rings is None:
+            rings = _local.rings = {}
+        ring = rings.get(key + (pipeline.buffer_count,))
+        if ring is None:
+            ring = rings[key + (pipeline.buffer_count,)] = FrameBufferRing(pipeline.buffer_count, size, background)
+        buffer = ring.acquire()
+        pipeline.hold(functools.partial(ring.release, buffer))
+        if timer:
+            timer.lap("backpressure_encode")
+    buffer.clear()
+    return buffer
+
+
+def text_sprite(text, font, margin, draw_text):
+    """
+    把文本绘制到刚好容纳它的透明小图上，返回 (Sprite, 绘制位置到图块原点的偏移)。
+
+    :param margin: 四周预留的像素（描边宽度）。
+    :param draw_text: draw_text(draw, position) 在小图的 position 处绘制文本。
+    """
+    left, top, right, bottom = font.getbbox(text)
+    img = Image.new("RGBA", (right - left + 2 * margin, bottom - top + 2 * margin), (0, 0, 0, 0))
+    draw_text(ImageDraw.Draw(img), (margin - left, margin - top))
+    return Sprite(img), (left - margin, top - margin)
+
+
+# ================== 字形图集 ==================
+class GlyphAtlas:
+    """
+    数字文本的字形图集：每个字符的描边遮罩与填充遮罩只栅格化一次，文本按预先确定的步进逐字拼接遮罩，
+    再一次性着色，每帧只有几次数组复制，不再调用字体排版。
+
+    数字使用相同的步进（等宽数字，取各数字步进的最大值，字形在步进内居中），数值变化时文本不会左右跳动。
+    相邻字符的遮罩重叠处按 "over" 方式合并、填充覆盖在描边之上，与 Pillow 绘制整行带描边文本的结果相同。
+    """
+
+    def __init__(self, font, fill, stroke_fill=None, stroke_width=0, charset=ATLAS_CHARSET):
+        self.charset = frozenset(charset)
+
+        # 着色查找表：(描边遮罩值, 填充遮罩值) -> RGBA。按 Pillow 在 RGBA 图上绘制文本的方式计算：先在透明底上以描边色
+        # 按描边遮罩绘制，再以填充色按填充遮罩混合；与 draw.text(..., stroke_width=...) 的结果相同，每帧着色只需一次查表
+        fill = np.array((tuple(fill) + (255,))[:4], dtype=np.int64)
+        stroke_fill = np.array((tuple(stroke_fill or fill) + (255,))[:4], dtype=np.int64)
+        s = np.arange(256, dtype=np.int64)[:, None]
+        f = np.arange(256, dtype=np.int64)[None, :]
+        base = np.zeros((256, 256, 4), dtype=np.int64)
+        base[..., :3] = stroke_fill[:3]  # 透明底上颜色直接取描边色，只有 alpha 按遮罩混合
+        base[..., 3] = _mul_div_255(stroke_fill[3], s)
+        weight = np.where((base[..., 3] == 0) & (f > 0), 255, f)  # 底色完全透明处颜色直接取填充色
+        colors = np.empty_like(base)
+        colors[..., :3] = _blend(base[..., :3], fill[:3], weight[..., None])
+        colors[..., 3] = _blend(base[..., 3], fill[3], f)
+        colors[colors[..., 3] == 0] = 0  # 完全透明的像素统一为 (0, 0, 0, 0)，与 Sprite 的约定一致
+        self.colors = colors.astype(np.uint8).reshape(-1, 4)
+
+        # 所有字符共用同一垂直范围，拼接时各字符的基线对齐
+        boxes = {ch: font.getbbox(ch, stroke_width=stroke_width) for ch in charset}
+        self.top = min(box[1] for box in boxes.values())
+        height = max(box[3] for box in boxes.values()) - self.top
+        digit_advance = max(font.getlength(ch) for ch in charset if ch.isdigit())
+
+        self.cells = {}  # 字符 -> (步进, 遮罩相对笔位置的X偏移, 描边遮罩, 填充遮罩)
+        for ch in charset:
+            length = font.getlength(ch)
+            advance = digit_advance if ch.isdigit() else length
+            shift = round((advance - length) / 2)
+            left, _, right, _ = boxes[ch]
+            width = max(right - left, 0)
+            stroke_mask = np.zeros((height, width), dtype=np.uint16)
+            fill_mask = np.zeros((height, width), dtype=np.uint16)
+            if width:
+                position = (-left, -self.top)
+                fill_mask = self._mask(font, ch, (width, height), position, 0)
+                if stroke_width:
+                    stroke_mask = self._mask(font, ch, (width, height), position, stroke_width)
+            self.cells[ch] = (advance, shift + left, stroke_mask, fill_mask)
+
+    @staticmethod
+    def _mask(font, ch, size, position, stroke_width):
+        img = Image.new("L", size, 0)
+        ImageDraw.Draw(img).text(position, ch, font=font, fill=255, stroke_width=stroke_width, stroke_fill=255)
+        return np.asarray(img, dtype=np.uint16)
+
+    def text_sprite(self, text):
+        """
+        用图集拼接文本，返回 (Sprite, 绘制位置到图块原点的偏移)，与 text_sprite 的返回值用法相同。
+
+        :return: 文本含图集以外的字符时返回 None，由调用方完整排版。
+        """
+        if not text or not self.charset.issuperset(text):
+            return None
+        placements, pen = [], 0.0
+        for ch in text:
+            advance, x_offset, stroke_mask, fill_mask = self.cells[ch]
+            placements.append((round(pen) + x_offset, stroke_mask, fill_mask))
+            pen += advance
+        left = min(x for x, _, _ in placements)
+        right = max(x + mask.shape[1] for x, mask, _ in placements)
+        height = placements[0][1].shape[0]
+
+        stroke = np.zeros((height, right - left), dtype=np.uint16)
+        fill = np.zeros((height, right - left), dtype=np.uint16)
+        for x, stroke_mask, fill_mask in placements:
+            columns = slice(x - left, x - left + fill_mask.shape[1])
+            for target, mask in ((stroke, stroke_mask), (fill, fill_mask)):
+                region = target[:, columns]
+                region += (mask * (255 - region) + 127) // 255
+
+        index = (stroke << 8) | fill
+        return Sprite.from_array(self.colors[index]), (left, self.top)
+
+
+def _mul_div_255(a, b):
+    """a * b / 255，按 Pillow 的整数舍入方式"""
+    tmp = a * b + 128
+    return (tmp + (tmp >> 8)) >> 8
+
+
+def _blend(base, ink, mask):
+    """按遮罩在 base 与 ink 之间线性混合（Pillow 的 BLEND）"""
+    return _mul_div_255(base, 255 - mask) + _mul_div_255(ink, mask)
+
+
+@functools.lru_cache(maxsize=ATLAS_CACHE_SIZE)
+def glyph_atlas(font_path, font_size, fill, stroke_fill=None, stroke_width=0):
+    """取得（或创建）某种字体、字号、颜色与描边组合的字形图集"""
+    return GlyphAtlas(load_font(font_path, font_size), fill, stroke_fill, stroke_width)
@@ -0,0 +1,80 @@
+import importlib
+
+import numpy as np
+
+# ================== 通道注册表 ==================
+CHANNELS = {}  # 通道名称 -> Channel
+
+
+class Channel:
+    """
+    一个数据通道：D 阶段拆分出的一个源文件、把原始数值转换为显示单位的向量化函数，以及把数值格式化为显示文本的向量化函数。
+
+    E_Conversion_05 为每个通道输出 {output}Value.csv（转换后的数值，供图表图层使用）与 {output}Text.csv（格式化后的文本，
+    可直接作为 F_Frames_01 的 csv_configs 文件）。
+    """
+
+    def __init__(self, name, source, convert=None, format=None, label="", unit="", output=None):
+        """
+        :param name: 通道名称，如 "altitude"。
+        :param source: D_DividedData 中的源文件名，如 "Altitude.csv"。
+        :param convert: 向量化转换函数 ndarray -> ndarray，缺失值为 NaN；None 表示不转换。
+        :param format: 向量化格式化函数 ndarray -> 字符串数组；None 表示保留一位小数。
+        :param label: 显示名称，如 "海拔"。
+        :param unit: 转换后的单位，如 "米"。
+        :param output: 输出文件名前缀，默认取源文件名。
+        """
+        self.name = name
+        self.source = source
+        self.convert = convert or (lambda values: values)
+        self.format = format or fixed(1)
+        self.label = label
+        self.unit = unit
+        self.output = output or source.rsplit(".", 1)[0]
+
+    @property
+    def value_file(self):
+        return f"{self.output}Value.csv"
+
+    @property
+    def text_file(self):
+        return f"{self.output}Text.csv"
+
+
+def register_channel(name, source, convert=None, format=None, label="", unit="", output=None):
+    """登记（或覆盖同名的）通道并返回它；插件模块在导入时调用"""
+    channel = Channel(name, source, convert, format, label, unit, output)
+    CHANNELS[name] = channel
+    return channel
+
+
+def get_channel(name):
+    if name not in CHANNELS:
+        raise KeyError(f"未登记的通道: {name}（已登记: {', '.join(sorted(CHANNELS))}）")
+    return CHANNELS[name]
+
+
+def load_plugins(modules):
+    """导入插件模块（模块名列表），插件在导入时调用 register_channel 登记自己的通道"""
+    for module in modules:
+        importlib.import_module(module)
+
+
+# ================== 格式化函数 ==================
+def fixed(digits, missing="--"):
+    """返回保留 digits 位小数的向量化格式化函数，缺失值显示为 missing"""
+    def format_values(values):
+        values = np.asarray(values, dtype=float)
+        text = np.char.mod(f"%.{digits}f", np.nan_to_num(values))
+        return np.where(np.isfinite(values), text, missing)
+    return format_values
+
+
+# ================== 内置通道 ==================
+register_channel("altitude", "Altitude.csv", format=fixed(0), label="海拔", unit="米")
+register_channel("heart_rate", "HeartRate.csv", format=fixed(0), label="心率", unit="次/分钟")
+register_channel("distance", "Distance.csv", convert=lambda m: m / 1000, format=fixed(2), label="距离", unit="千米")
+register_channel("vertical_oscillation", "VerticalOscillation.csv", convert=lambda mm: mm / 10, format=fixed(1), label="垂直振幅", unit="厘米")
+register_channel("stance_time", "StanceTime.csv", format=fixed(0), label="触地时间", unit="毫秒")
+register_channel("vertical_ratio", "VerticalRatio.csv", format=fixed(1), label="垂直比", unit="%")
+register_channel("step_length", "StepLength.csv", convert=lambda mm: mm / 1000, format=fixed(2), label="步幅", unit="米")
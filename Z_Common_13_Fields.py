@@ -0,0 +1,88 @@
+import functools
+import importlib
+import os
+
+# ================== 配置参数 ==================
+PROJECT_FIELDS = True  # 只解码、拆分帧图层实际需要的字段；False 时 C 阶段保留全部字段、D 阶段输出 output_config 中的全部文件
+
+# 参与推算的帧图层模块（默认包含全部图层，不渲染的图层可以去掉以减少需要解码的字段）
+LAYER_MODULES = [
+    "F_Frames_01_Speed_HeartRate_Cadence_Power",
+    "F_Frames_02_ProgressBar",
+    "F_Frames_03_Trace",
+    "F_Frames_04_DatenTime",
+    "F_Frames_05_Heatmap",
+    "F_Frames_06_Chart",
+]
+
+# E 阶段模块，各自的 output_dependencies() 给出 输出文件 -> 所需的 D 阶段文件
+CONVERSION_MODULES = [
+    "E_Conversion_01_Speed_HeartRate_Cadence_Power",
+    "E_Conversion_02_Distance",
+    "E_Conversion_03_Latitude_Longitude",
+    "E_Conversion_04_DatenTime",
+    "E_Conversion_05_Channels",
+]
+
+SPLIT_MODULE = "D_Divide_01_CSV2CSVs"  # output_config 给出 D 阶段文件 -> FIT 字段
+
+FRAME_INDEX_FILES = ["DateDay.csv", "DateTime.csv"]  # 所有图层的帧索引都需要的文件（见 Z_Common_03_FrameStore.load_frame_timestamps）
+ALWAYS_REQUIRED_FIELDS = ["timestamp"]  # C 阶段补全活动开始时间需要的字段
+
+
+def config_input_files(config):
+    """收集图层配置中引用的输入文件：键为 "file" 或以 "_file" 结尾、值为 .csv 文件名的项，递归进入 csv_configs、charts 等子配置列表"""
+    files = []
+    for key, value in config.items():
+        if isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict):
+                    files.extend(config_input_files(item))
+        elif isinstance(value, str) and (key == "file" or key.endswith("_file")) and value.endswith(".csv"):
+            files.append(value)
+    return files
+
+
+def has_inputs(input_folder_path, input_files):
+    """输入文件都存在时返回 True；否则打印跳过信息（字段投影后，不需要的输出没有对应的输入文件）"""
+    missing = [f for f in input_files if not os.path.exists(os.path.join(input_folder_path, f))]
+    if missing:
+        print(f"活动缺少 {', '.join(missing)}，跳过")
+        return False
+    return True
+
+
+@functools.lru_cache(maxsize=None)
+def required_projection(layer_modules=tuple(LAYER_MODULES)):
+    """
+    从帧图层的配置往回推算需要的数据：图层读取的 E 阶段文件 -> 生成它们所需的 D 阶段文件 -> 这些文件对应的 FIT 字段。
+
+    :param layer_modules: 参与推算的图层模块名称。
+    :return: (D 阶段需要输出的文件集合, C 阶段需要解码的 FIT 字段集合)。
+    """
+    needed = set(FRAME_INDEX_FILES)
+    for name in layer_modules:
+        needed.update(config_input_files(importlib.import_module(name).CONFIG))
+
+    divided_files = set()
+    for name in CONVERSION_MODULES:
+        for output_file, input_files in importlib.import_module(name).output_dependencies().items():
+            if output_file in needed:
+                divided_files.update(input_files)
+
+    output_config = importlib.import_module(SPLIT_MODULE).output_config
+    divided_files &= set(output_config)
+    fields = set(ALWAYS_REQUIRED_FIELDS)
+    for filename in divided_files:
+        fields.update(output_config[filename])
+    return divided_files, fields
+
+
+def required_fields():
+    """C 阶段需要保留的 FIT 字段，不做字段投影时返回 None"""
+    return required_projection()[1] if PROJECT_FIELDS else None
+
+
+def required_divided_files():
+    """D 阶段需要输出的文件，不做字段投影时返回 None"""
+    return required_projection()[0] if PROJECT_FIELDS else None
@@ -0,0 +1,75 @@
+import glob
+import os
+import re
+
+from Z_Common_03_FrameStore import INDEX_NAME
+
+# ================== 配置参数 ==================
+SHARD_ENV = "GARMIN_SHARD"  # 覆盖配置中的 shard，便于多台机器运行同一份脚本，如 GARMIN_SHARD=2/4
+
+
+# ================== 分片规格 ==================
+def shard_spec(config):
+    """本次渲染的分片规格：环境变量优先，其次为配置中的 shard，None 表示渲染全部帧"""
+    return os.getenv(SHARD_ENV) or config.get("shard")
+
+
+def shard_range(spec, total_frames):
+    """
+    把分片规格解析为帧号区间 [start, end)。
+
+    "k/n" 表示把全部帧按顺序等分为 n 份中的第 k 份（k 从 1 开始），同一总帧数下各机器算出的区间相同、互不重叠；
+    "start-end" 表示显式的闭区间帧号。
+
+    :raises ValueError: 规格格式错误或超出范围。
+    """
+    spec = str(spec).strip()
+    match = re.fullmatch(r"(\d+)/(\d+)", spec)
+    if match:
+        k, n = int(match.group(1)), int(match.group(2))
+        if not 1 <= k <= n:
+            raise ValueError(f"分片 {spec} 无效：应为 1/n 到 n/n")
+        return total_frames * (k - 1) // n, total_frames * k // n
+    match = re.fullmatch(r"(\d+)-(\d+)", spec)
+    if match:
+        start, end = int(match.group(1)), int(match.group(2)) + 1
+        if start >= end:
+            raise ValueError(f"帧区间 {spec} 无效：起点应不大于终点")
+        return min(start, total_frames), min(end, total_frames)
+    raise ValueError(f"无法解析分片规格 {spec!r}（应为 \"k/n\" 或 \"start-end\"）")
+
+
+# ================== 分片文件 ==================
+def shard_file_name(name, start, end):
+    """分片各自的清单与索引文件名，如 render_manifest.shard-1000-1999.json"""
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.shard-{start}-{end - 1}{ext}"
+
+
+def find_shard_files(root, name):
+    """返回目录中某类分片文件 [(start, end, 路径)]，按起始帧排序"""
+    stem, ext = os.path.splitext(name)
+    pattern = re.compile(re.escape(stem) + r"\.shard-(\d+)-(\d+)" + re.escape(ext) + "$")
+    shards = []
+    for path in glob.glob(os.path.join(glob.escape(root), f"{stem}.shard-*{ext}")):
+        match = pattern.search(os.path.basename(path))
+        if match:
+            shards.append((int(match.group(1)), int(match.group(2)) + 1, path))
+    return sorted(shards)
+
+
+def write_frame_index(store, timestamps, config, failures=None):
+    """
+    渲染结束后写出帧索引：分片渲染时只写出本分片帧的 frame_index.shard-*.csv（由合并命令拼接），否则写出完整索引。
+
+    :param failures: render_with_manifest 返回的失败帧字典，这些帧没有输出文件，不写入索引。
+    """
+    spec = shard_spec(config)
+    start, end = shard_range(spec, store.total_frames) if spec else (0, store.total_frames)
+    frame_nums = range(start, end)
+    if failures:
+        frame_nums = [n for n in frame_nums if n not in failures]
+    if not spec:
+        store.write_index(timestamps, frame_nums)
+        return
+    store.write_index(timestamps, frame_nums, name=shard_file_name(INDEX_NAME, start, end))
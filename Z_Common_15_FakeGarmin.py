@@ -0,0 +1,165 @@
+import datetime
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import zipfile
+from enum import Enum, auto
+
+from garminconnect import (
+    GarminConnectAuthenticationError,
+    GarminConnectConnectionError,
+    GarminConnectTooManyRequestsError,
+)
+
+from Z_Common_04_FitFile import ALL_SENSORS, write_synthetic_fit
+
+# ================== 配置参数 ==================
+FAKE_ENV = "GARMIN_FAKE"  # 设置后 A_Download_01 使用离线替身："1" 使用默认配置，或 JSON 格式的配置（覆盖 DEFAULTS 中的项）
+
+DEFAULTS = {
+    "activities": 20,  # 账户中的活动数量
+    "activities_file": None,  # 录制的 get_activities 返回结果（JSON 列表），提供时按录制内容回放活动列表
+    "latency": 0.05,  # 每次调用的基础延迟(秒)
+    "jitter": 0.02,  # 延迟的随机抖动上限(秒)
+    "bandwidth": 5_000_000,  # 下载带宽(字节/秒)，None 表示不限
+    "payload": "fit",  # 下载内容："fit"（合成活动的 .zip，可被后续阶段处理）或 "random"（随机字节）
+    "payload_size": 200_000,  # payload 为 "random" 时的下载大小(字节)
+    "duration": 600,  # payload 为 "fit" 时合成活动的时长(秒)
+    "requests_per_second": None,  # 服务端限流：最近一秒内的请求数超过该值时返回 429，None 表示不限
+    "too_many_requests_rate": 0.0,  # 随机注入 429 的概率
+    "failure_rate": 0.0,  # 随机注入连接错误的概率
+    "authentication_failure": False,  # True 时登录失败
+    "seed": 0,  # 随机数种子，相同配置的多次运行注入的错误相同
+}
+
+ACTIVITY_ID_BASE = 10_000_000_000  # 合成活动的 activityId 起始值
+START_TIME = datetime.datetime(2024, 5, 1, 7, 0, 0)  # 最近一个合成活动的开始时间
+
+
+class FakeGarmin:
+    """
+    Garmin Connect 客户端的离线替身，提供 A_Download_01 使用的 login、get_activities、get_activity、
+    download_activity，按配置模拟延迟、带宽、限流（429）与连接错误，抛出与 garminconnect 相同的异常。
+
+    stats 记录各方法的调用次数、注入的错误数与发送的字节数，供基准测试统计重试行为。
+    """
+
+    class ActivityDownloadFormat(Enum):
+        ORIGINAL = auto()
+        TCX = auto()
+        GPX = auto()
+        KML = auto()
+        CSV = auto()
+
+    def __init__(self, email=None, password=None, is_cn=False, **config):
+        unknown = set(config) - set(DEFAULTS)
+        if unknown:
+            raise ValueError(f"未知的替身配置项: {', '.join(sorted(unknown))}")
+        self.config = dict(DEFAULTS, **config)
+        self.rng = random.Random(self.config["seed"])
+        self.stats = {"calls": {}, "too_many_requests": 0, "failures": 0, "bytes_sent": 0}
+        self._lock = threading.Lock()
+        self._recent = []  # 最近一秒内的请求时间，用于限流
+        self._payloads = {}  # activityId -> 下载内容（每个活动只生成一次）
+        self._activities = self._load_activities()
+
+    @classmethod
+    def from_env(cls):
+        """按环境变量 GARMIN_FAKE 创建替身"""
+        value = os.getenv(FAKE_ENV, "").strip()
+        return cls(**json.loads(value)) if value.startswith("{") else cls()
+
+    # ---------- 活动列表 ----------
+    def _load_activities(self):
+        if self.config["activities_file"]:
+            with open(self.config["activities_file"], "r", encoding="utf-8") as f:
+                return json.load(f)
+        activities = []
+        for i in range(self.config["activities"]):
+            start = START_TIME - datetime.timedelta(days=i)
+            activities.append({
+                "activityId": ACTIVITY_ID_BASE + i,
+                "activityName": f"合成活动 {i + 1}",
+                "activityType": {"typeKey": "running"},
+                "startTimeLocal": start.strftime("%Y-%m-%d %H:%M:%S"),
+                "startTimeGMT": (start - datetime.timedelta(hours=8)).strftime("%Y-%m-%d %H:%M:%S"),
+                "duration": float(self.config["duration"]),
+                "distance": self.config["duration"] * 3.0,
+            })
+        return activities
+
+    def _payload(self, activity_id):
+        payload = self._payloads.get(activity_id)
+        if payload is not None:
+            return payload
+        if self.config["payload"] == "random":
+            payload = random.Random(activity_id).randbytes(self.config["payload_size"])
+        else:
+            with tempfile.TemporaryDirectory() as tmp:
+                fit_path = os.path.join(tmp, "activity.fit")
+                write_synthetic_fit(fit_path, self.config["duration"], sensors=ALL_SENSORS, seed=activity_id % 2**32)
+                buf = io.BytesIO()
+                with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+                    zf.write(fit_path, f"{activity_id}_ACTIVITY.fit")
+                payload = buf.getvalue()
+        self._payloads[activity_id] = payload
+        return payload
+
+    # ---------- 模拟网络 ----------
+    def _request(self, method):
+        """模拟一次请求：延迟、限流与随机错误"""
+        with self._lock:
+            self.stats["calls"][method] = self.stats["calls"].get(method, 0) + 1
+            delay = self.config["latency"] + self.rng.uniform(0, self.config["jitter"])
+            roll_429, roll_failure = self.rng.random(), self.rng.random()
+            now = time.monotonic()
+            self._recent = [t for t in self._recent if now - t < 1.0]
+            self._recent.append(now)
+            limited = self.config["requests_per_second"] is not None and len(self._recent) > self.config["requests_per_second"]
+        time.sleep(delay)
+        if limited or roll_429 < self.config["too_many_requests_rate"]:
+            with self._lock:
+                self.stats["too_many_requests"] += 1
+            raise GarminConnectTooManyRequestsError(f"{method}: Too many requests (429，离线替身)")
+        if roll_failure < self.config["failure_rate"]:
+            with self._lock:
+                self.stats["failures"] += 1
+            raise GarminConnectConnectionError(f"{method}: Connection error（离线替身）")
+
+    def _find(self, activity_id):
+        for activity in self._activities:
+            if str(activity["activityId"]) == str(activity_id):
+                return activity
+        raise GarminConnectConnectionError(f"活动 {activity_id} 不存在（离线替身）")
+
+    # ---------- 客户端接口 ----------
+    def login(self, tokenstore=None):
+        self._request("login")
+        if self.config["authentication_failure"]:
+            raise GarminConnectAuthenticationError("登录失败（离线替身）")
+        return None, None
+
+    def get_activities(self, start=0, limit=20, activitytype=None):
+        self._request("get_activities")
+        activities = self._activities
+        if activitytype:
+            activities = [a for a in activities if (a.get("activityType") or {}).get("typeKey") == activitytype]
+        return [dict(a) for a in activities[start:start + limit]]
+
+    def get_activity(self, activity_id):
+        self._request("get_activity")
+        return dict(self._find(activity_id))
+
+    def download_activity(self, activity_id, dl_fmt=ActivityDownloadFormat.TCX):
+        self._request("download_activity")
+        self._find(activity_id)
+        payload = self._payload(activity_id)
+        if self.config["bandwidth"]:
+            time.sleep(len(payload) / self.config["bandwidth"])
+        with self._lock:
+            self.stats["bytes_sent"] += len(payload)
+        return payload
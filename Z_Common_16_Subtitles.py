@@ -0,0 +1,164 @@
+import csv
+import json
+import os
+
+from Z_Common_07_Text import load_font
+
+# ================== 配置参数 ==================
+SUBTITLE_FORMATS = ("ass", "srt", "json")  # 文本图层除 "frames"（逐帧 PNG）外可选的输出形式
+ASS_ALIGNMENT = 7  # ASS 对齐方式：7 为左上角，与图层按 position 绘制文本的锚点一致
+
+
+# ================== 数据轨道 ==================
+def track_text(cfg, value):
+    """图层在一帧中显示的文本（与逐帧渲染时相同：前缀 + 数据 + 后缀）"""
+    return f"{cfg.get('prefix', '')}{value}{cfg.get('suffix', '')}"
+
+
+def read_track(path, cfg):
+    """流式读取单列 CSV，逐行给出该轨道显示的文本"""
+    with open(path, "r", newline="") as f:
+        for row in csv.reader(f):
+            yield track_text(cfg, row[0])
+
+
+def merge_runs(values):
+    """把连续相同的值合并为一段，生成 (起始帧, 结束帧（不含）, 值)"""
+    start, current, frame = 0, None, -1
+    for frame, value in enumerate(values):
+        if frame and value != current:
+            yield start, frame, current
+            start = frame
+        current = value
+    if frame >= 0:
+        yield start, frame + 1, current
+
+
+# ================== 时间码 ==================
+def _split_seconds(seconds, unit):
+    """把秒数拆分为 (时, 分, 秒, 1/unit 秒)，按整数计算避免浮点误差"""
+    ticks = round(seconds * unit)
+    total_seconds, fraction = divmod(ticks, unit)
+    minutes, secs = divmod(total_seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return hours, minutes, secs, fraction
+
+
+def srt_time(seconds):
+    return "{:02}:{:02}:{:02},{:03}".format(*_split_seconds(seconds, 1000))
+
+
+def ass_time(seconds):
+    return "{}:{:02}:{:02}.{:02}".format(*_split_seconds(seconds, 100))
+
+
+def timecode(seconds):
+    return "{:02}:{:02}:{:02}.{:03}".format(*_split_seconds(seconds, 1000))
+
+
+# ================== ASS ==================
+def _ass_color(rgba):
+    """RGBA -> ASS 颜色 &HAABBGGRR（ASS 的 alpha 为透明度，00 表示不透明）"""
+    r, g, b, a = (tuple(rgba) + (255,))[:4]
+    return f"&H{255 - a:02X}{b:02X}{g:02X}{r:02X}"
+
+
+def _font_name(font_path, font_size):
+    """字体族名称（视频编辑器按名称查找已安装的字体），字体文件不存在时使用文件名"""
+    try:
+        return load_font(font_path, font_size).getname()[0]
+    except (FileNotFoundError, OSError):
+        return os.path.splitext(os.path.basename(font_path))[0]
+
+
+def _ass_style(name, cfg):
+    return ",".join(str(v) for v in [
+        name, _font_name(cfg["font"], cfg["font_size"]), cfg["font_size"],
+        _ass_color(cfg["font_color"]), _ass_color(cfg["font_color"]), _ass_color(cfg["stroke_color"]), "&H00000000",
+        0, 0, 0, 0, 100, 100, 0, 0, 1, cfg["stroke_width"], 0, ASS_ALIGNMENT, 0, 0, 0, 1,
+    ])
+
+
+def _ass_escape(text):
+    return text.replace("\\", "\\\\").replace("{", "\\{").replace("}", "\\}")
+
+
+def write_ass(f, tracks, csv_configs, frame_size, fps):
+    """每个 csv_configs 项映射为一个样式，文本按 position 定位"""
+    f.write("[Script Info]\nScriptType: v4.00+\nWrapStyle: 2\nScaledBorderAndShadow: yes\n")
+    f.write(f"PlayResX: {frame_size[0]}\nPlayResY: {frame_size[1]}\n\n")
+    f.write("[V4+ Styles]\n")
+    f.write("Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, "
+            "Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding\n")
+    names = [os.path.splitext(cfg["file"])[0] for cfg in csv_configs]
+    for name, cfg in zip(names, csv_configs):
+        f.write(f"Style: {_ass_style(name, cfg)}\n")
+    f.write("\n[Events]\nFormat: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n")
+    events = 0
+    for name, cfg, track in zip(names, csv_configs, tracks):
+        x, y = cfg["position"]
+        for start, end, text in merge_runs(track):
+            f.write(f"Dialogue: 0,{ass_time(start / fps)},{ass_time(end / fps)},{name},,0,0,0,,{{\\an{ASS_ALIGNMENT}\\pos({x},{y})}}{_ass_escape(text)}\n")
+            events += 1
+    return events
+
+
+# ================== SRT ==================
+def write_srt(f, tracks, fps):
+    """SRT 不支持定位与样式：各轨道同一帧的文本按行合并为一条字幕，整体不变的连续帧合并为一段"""
+    events = 0
+    for events, (start, end, lines) in enumerate(merge_runs(zip(*tracks)), start=1):
+        f.write(f"{events}\n{srt_time(start / fps)} --> {srt_time(end / fps)}\n" + "\n".join(lines) + "\n\n")
+    return events
+
+
+# ================== JSON ==================
+def write_json(f, tracks, csv_configs, frame_size, fps):
+    """每个轨道一个事件列表，事件包含帧号区间、秒数与时间码"""
+    document = {"fps": fps, "frame_size": list(frame_size), "tracks": []}
+    events = 0
+    for cfg, track in zip(csv_configs, tracks):
+        items = [{
+            "start_frame": start, "end_frame": end,
+            "start": start / fps, "end": end / fps,
+            "start_timecode": timecode(start / fps), "end_timecode": timecode(end / fps),
+            "text": text,
+        } for start, end, text in merge_runs(track)]
+        events += len(items)
+        document["tracks"].append({
+            "file": cfg["file"],
+            "style": {k: cfg[k] for k in ("position", "font", "font_size", "font_color", "stroke_color", "stroke_width") if k in cfg},
+            "events": items,
+        })
+    json.dump(document, f, ensure_ascii=False, indent=1)
+    return events
+
+
+# ================== 导出 ==================
+def subtitle_path(output_dir, fmt):
+    """字幕文件与图层的帧目录同名，如 .../Activity1/DatenTime.ass"""
+    return f"{os.path.normpath(output_dir)}.{fmt}"
+
+
+def export_subtitles(csv_paths, csv_configs, output_path, fmt, frame_size, fps=1):
+    """
+    把文本图层逐帧显示的值导出为带时间的字幕/数据轨道，代替逐帧渲染 PNG。
+
+    :param csv_paths: 各 csv_configs 项对应的单列 CSV 路径，每行为一帧。
+    :param fmt: "ass"（样式由 csv_configs 映射）、"srt" 或 "json"。
+    :param fps: 帧率，第 k 帧显示于 [k / fps, (k + 1) / fps)。
+    :return: 写出的事件数。
+    """
+    if fmt not in SUBTITLE_FORMATS:
+        raise ValueError(f"不支持的字幕格式 {fmt!r}，可选: {', '.join(SUBTITLE_FORMATS)}")
+    tracks = [read_track(path, cfg) for path, cfg in zip(csv_paths, csv_configs)]
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8-sig" if fmt == "ass" else "utf-8", newline="\n") as f:
+        if fmt == "ass":
+            events = write_ass(f, tracks, csv_configs, frame_size, fps)
+        elif fmt == "srt":
+            events = write_srt(f, tracks, fps)
+        else:
+            events = write_json(f, tracks, csv_configs, frame_size, fps)
+    os.replace(tmp_path, output_path)
+    return events